@@ -41,6 +41,19 @@ class IAttention(nn.Module):
         """
         super(IAttention, self).__init__()
         
+    def prepare(self, *args):
+        """Evaluate the part of the attention that depends only on the images, once per caption.
+
+        Args:
+            images (torch.Tensor): `(batch_dim, image_portions, encoder_dim)`
+                The tensor of the images in the batch. 
+
+        Returns:
+            (torch.Tensor): `(batch_dim, image_portions, attention_dim)`
+                The projected images, to be given to forward at each time step.
+        """
+        pass
+    
     def forward(self, *args):
         """Compute z_t given images and hidden state at t-1 for all the element in the batch.
 
@@ -49,6 +62,8 @@ class IAttention(nn.Module):
                 The tensor of the images in the batch. 
             lstm_hidden_states (torch.Tensor): `(batch_dim, hidden_dim)`
                 The hidden states at t-1 of the elements in the batch. 
+            images_attention (torch.Tensor, optional): `(batch_dim, image_portions, attention_dim)`
+                The output of prepare, if None it is evaluated from the images.
 
         Returns:
             (Tuple[torch.Tensor,torch.Tensor]): `[(batch_dim, encoder_dim), (batch_dim, image_portions)]`
@@ -24,7 +24,7 @@ from re import S
 import torch.nn as nn
 import torch
 import torchvision.models as models
-from typing import Tuple
+from typing import Tuple, Optional
 
 class SoftAttention(nn.Module):
     """
@@ -69,7 +69,20 @@ class SoftAttention(nn.Module):
         self.out = nn.Softmax(dim=1)
         
         
-    def forward(self, images: torch.Tensor, lstm_hidden_states: torch.Tensor) -> Tuple[torch.Tensor,torch.Tensor]:
+    def prepare(self, images: torch.Tensor) -> torch.Tensor:
+        """Project the images in the attention space, the projection doesn't depend on t so it can be evaluated once per caption.
+
+        Args:
+            images (torch.Tensor): `(batch_dim, image_portions, encoder_dim)`
+                The tensor of the images in the batch.
+
+        Returns:
+            (torch.Tensor): `(batch_dim, image_portions, attention_dim)`
+                The projected images, to be given to forward at each time step.
+        """
+        return self.image_attention_projection(images) # IN: (batch_dim, image_portions, encoder_dim) -> Out: (batch_dim, image_portions, attention_dim)
+    
+    def forward(self, images: torch.Tensor, lstm_hidden_states: torch.Tensor, images_attention: Optional[torch.Tensor] = None) -> Tuple[torch.Tensor,torch.Tensor]:
         """Compute z_t given images and hidden state at t-1 for all the element in the batch.
 
         Args:
@@ -77,18 +90,23 @@ class SoftAttention(nn.Module):
                 The tensor of the images in the batch.  
             lstm_hidden_states (torch.Tensor): `(batch_dim, hidden_dim)`
                 The hidden states at t-1 of all the element in the batch. 
+            images_attention (Optional[torch.Tensor], optional): `(batch_dim, image_portions, attention_dim)` Defaults to None.
+                The projection of the images as returned by prepare, if None it is evaluated here.
 
         Returns:
             (Tuple[torch.Tensor,torch.Tensor]): `[(batch_dim, encoder_dim), (batch_dim, image_portions)]`
                 Z_t and the alphas evaluated for each portion of the image, for each image in the batch.
         """
         
-        _images_attention = self.image_attention_projection(images) # IN: (batch_dim, image_portions, encoder_dim) -> Out: (batch_dim, image_portions, attention_dim)
+        # Q. Why Optional and an explicit check?
+        # A. TorchScript types a parameter with default None as Tensor, unless it is declared Optional: only with `is None` it knows that after the check it is a Tensor.
+        if images_attention is None:
+            images_attention = self.prepare(images) # Out: (batch_dim, image_portions, attention_dim)
         
         _lstm_attention = self.lstm_hidden_state_attention_projection(lstm_hidden_states) # IN: (batch_dim, hidden_dim) -> Out: (batch_size, attention_dim)
         
         # (batch_size, image_portions, attention_dim) + (batch_size, 1, attention_dim) -> Broadcast on dim 2 -> (batch_size, image_portions, attention_dim)
-        _attention = self.attention(self.ReLU(_images_attention + _lstm_attention.unsqueeze(1))).squeeze(2) # IN: (batch_dim, image_portions, attention_dim) -> Out: (batch_size, image_portions)
+        _attention = self.attention(self.ReLU(images_attention + _lstm_attention.unsqueeze(1))).squeeze(2) # IN: (batch_dim, image_portions, attention_dim) -> Out: (batch_size, image_portions)
         
         _alphas_t = self.out(_attention) # Out: (batch_dim, image_portions)
         
@@ -26,19 +26,24 @@ import torch.nn as nn
 import torchvision.models as models
 from torch.nn.utils.rnn import pack_padded_sequence
 import torch.nn.functional as F
-from typing import Tuple,List
+import numpy as np
+from typing import Tuple,List,Iterator,Iterable
 from .Dataset import MyDataset
 from .Vocabulary import Vocabulary
 from .Decoder.IDecoder import IDecoder
 from .Encoder.IEncoder import IEncoder
 from .Attention.IAttention import IAttention
-import numpy as np
+from .Decoder.BeamSearch import BeamSearch
+from .Decoder.GreedySearch import GreedySearch
 from PIL import Image
 from torchvision import transforms
 from torchvision.utils import save_image
 import matplotlib.pyplot as plt
 from VARIABLE import MAX_CAPTION_LENGTH
-from .Metrics import Result
+from .Metrics import Result, Progress
+from .Output.IOutput import IOutput
+from .Export import export_torchscript, export_onnx
+from .Quantization import quantize_dynamic_int8, quantize_static_int8
 
 class CaRNet(nn.Module):
     """
@@ -55,7 +60,10 @@ class CaRNet(nn.Module):
         - vHC
     """
     
-    def __init__(self, encoder: IEncoder, decoder: IDecoder, net_name: str, encoder_dim: int, hidden_dim: int, padding_index: int, vocab_size: int, embedding_dim: int, attention: IAttention = None, attention_dim: int = 1024, device: str = "cpu"):
+    # The dtype of the autocast for each precision of the training, None means no autocast (See train).
+    precisions = {"fp32": None, "bf16": torch.bfloat16, "fp16": torch.float16}
+    
+    def __init__(self, encoder: IEncoder, decoder: IDecoder, net_name: str, encoder_dim: int, hidden_dim: int, padding_index: int, vocab_size: int, embedding_dim: int, attention: IAttention = None, attention_dim: int = 1024, device: str = "cpu", beam_size: int = 1, output: IOutput = None, words_counts: np.ndarray = None):
         """Create the C[aA]RNet 
 
         Args:
@@ -91,6 +99,15 @@ class CaRNet(nn.Module):
                 
             device (str, optional): 
                 The device on which the net does the computation. Defaults to "cpu".
+                
+            beam_size (int, optional): (Default is 1)
+                The number of beams used for generate a caption, 1 means greedy decoding.
+                
+            output (IOutput, optional): (Default is None)
+                The output layer to use, None means a full softmax (LinearOutput).
+                
+            words_counts (np.ndarray, optional): (Default is None)
+                The occurrences of each word id, used by the output layer to cluster the vocabulary (e.g. the adaptive softmax).
         """
 
         super(CaRNet, self).__init__()
@@ -98,18 +115,24 @@ class CaRNet(nn.Module):
         self.device = torch.device(device)
         self.name_net = net_name
         self.result_storer = Result()
+        self.beam_size = beam_size
+        # "" for a float net, oth. the kind of quantization applied (See quantize), it is part of the name of the checkpoints.
+        self.quantization = ""
         # Define Encoder and Decoder
         self.C = encoder(encoder_dim = encoder_dim, device = device)
         self.R = None
         
+        # Create the output layer of the decoder, the projection of the hidden state on the vocabulary
+        output_layer = output(hidden_dim, vocab_size, words_counts) if output is not None else None
+        
         # Take the attention in consideration
         self.attention = False
         
         if attention is not None: # I know..some skilled dev. will hate me for this if-else statement. Forgive ME.
             self.attention = True
-            self.R = decoder(hidden_dim, padding_index, vocab_size, embedding_dim, device, attention(self.C.encoder_dim, hidden_dim, attention_dim))
+            self.R = decoder(hidden_dim, padding_index, vocab_size, embedding_dim, device, attention(self.C.encoder_dim, hidden_dim, attention_dim), output=output_layer)
         else:
-            self.R = decoder(hidden_dim, padding_index, vocab_size, embedding_dim, device)
+            self.R = decoder(hidden_dim, padding_index, vocab_size, embedding_dim, device, output=output_layer)
 
         # Check if the Recurrent net was initialized oth. we are in error state.
         if self.R is None:
@@ -153,9 +176,10 @@ class CaRNet(nn.Module):
             bool: If True: Net saved correctly. False otherwise.
         """
         try:
-            # Name_type_encoderdim_embeddingdim_hiddendim_attentiondim
-            torch.save(self.C.state_dict(), f"{file_path}/{self.name_net}_{self.C.encoder_dim}_{self.R.hidden_dim}_{self.R.attention.attention_dim if self.attention == True else 0}_C.pth")
-            torch.save(self.R.state_dict(), f"{file_path}/{self.name_net}_{self.C.encoder_dim}_{self.R.hidden_dim}_{self.R.attention.attention_dim if self.attention == True else 0}_R.pth")
+            # Name_type_encoderdim_embeddingdim_hiddendim_attentiondim[_quantization]
+            quantization = f"_{self.quantization}" if self.quantization != "" else ""
+            torch.save(self.C.state_dict(), f"{file_path}/{self.name_net}_{self.C.encoder_dim}_{self.R.hidden_dim}_{self.R.attention.attention_dim if self.attention == True else 0}_C{quantization}.pth")
+            torch.save(self.R.state_dict(), f"{file_path}/{self.name_net}_{self.C.encoder_dim}_{self.R.hidden_dim}_{self.R.attention.attention_dim if self.attention == True else 0}_R{quantization}.pth")
         except Exception as ex:
             print(ex)
             return False
@@ -172,9 +196,96 @@ class CaRNet(nn.Module):
         """
         
         # since our classifier is a nn.Module, we can load it using pytorch facilities (mapping it to the right device)
-        self.C.load_state_dict(torch.load(f"{file_path}/{self.name_net}_{self.C.encoder_dim}_{self.R.hidden_dim}_{self.R.attention.attention_dim if self.attention == True else 0}_C.pth", map_location=self.device))
-        self.R.load_state_dict(torch.load(f"{file_path}/{self.name_net}_{self.C.encoder_dim}_{self.R.hidden_dim}_{self.R.attention.attention_dim if self.attention == True else 0}_R.pth", map_location=self.device))
+        # A quantized net loads the quantized checkpoints, the structure must be already quantized (See quantize).
+        # Q. Why weights_only is False for the quantized checkpoints?
+        # A. The packed weights of the quantized LSTMCell are TorchScript objects, they are refused by the safe unpickler. The checkpoints are the ones produced by quantize.
+        #       The float checkpoints are loaded with the default of the installed torch.
+        quantization = f"_{self.quantization}" if self.quantization != "" else ""
+        load_arguments = {"weights_only": False} if quantization != "" else {}
+        self.C.load_state_dict(torch.load(f"{file_path}/{self.name_net}_{self.C.encoder_dim}_{self.R.hidden_dim}_{self.R.attention.attention_dim if self.attention == True else 0}_C{quantization}.pth", map_location=self.device, **load_arguments))
+        self.R.load_state_dict(torch.load(f"{file_path}/{self.name_net}_{self.C.encoder_dim}_{self.R.hidden_dim}_{self.R.attention.attention_dim if self.attention == True else 0}_R{quantization}.pth", map_location=self.device, **load_arguments))
+    
+    def quantize(self, trunk: bool = False, calibration: Iterable[torch.Tensor] = None) -> str:
+        """Quantize the net to int8 for a faster inference on cpu (See Quantization).
+            The decoder (LSTMCell, output layer, attention projections) and the last fc layer of the encoder are quantized with the dynamic quantization.
+            The ResNet50 trunk, if requested, with the static quantization.
+            After the quantization the net can't be trained and it saves and loads the quantized checkpoints.
+
+        Args:
+            trunk (bool, optional): Defaults to False.
+                If True the ResNet50 trunk is quantized too.
+                
+            calibration (Iterable[torch.Tensor], optional): `(batch_dim, channels, height, width)` Defaults to None.
+                The batches of images used for calibrate the trunk. 
+                If None the trunk is not calibrated: use it only before loading a quantized checkpoint.
+
+        Raises:
+            ValueError: If the net is not on cpu or it is already quantized.
+
+        Returns:
+            str: The kind of quantization applied, "int8" or "int8_trunk".
+        """
+        if self.device.type != "cpu":
+            raise ValueError(f"The int8 kernels run only on cpu, got {self.device}.")
+        if self.quantization != "":
+            raise ValueError(f"The net is already quantized ({self.quantization}).")
         
+        self.switch_mode("evaluation")
+        if trunk == True:
+            crop_size = MyDataset.image_trasformation_parameter["crop"]["size"]
+            self.C.resnet = quantize_static_int8(self.C.resnet, torch.zeros((1, 3, crop_size, crop_size)), calibration)
+        quantize_dynamic_int8(self.C)
+        quantize_dynamic_int8(self.R)
+        self.switch_mode("training")
+        
+        self.quantization = "int8_trunk" if trunk == True else "int8"
+        return self.quantization
+        
+    def export(self, file_path: str, vocabulary: Vocabulary, format: str = "torchscript") -> str:
+        """Export the net for inference, it can be used without the source code (See Export.ScriptedCaptioner and OnnxCaptioner).
+
+        Args:
+            file_path (str): Relative path of the directory of the artefact. Ex. "home/pippo/saved"
+
+            vocabulary (Vocabulary): The vocabulary associated to the net.
+
+            format (str, optional): "torchscript" | "onnx". Defaults to "torchscript".
+
+        Raises:
+            ValueError: If the format is unknown.
+
+        Returns:
+            str: The path of the artefact.
+        """
+        if format == "torchscript":
+            return export_torchscript(self, vocabulary, self.export_path(file_path, format), MyDataset.image_trasformation_parameter, MAX_CAPTION_LENGTH)
+        if format == "onnx":
+            return export_onnx(self, vocabulary, self.export_path(file_path, format), MyDataset.image_trasformation_parameter, MAX_CAPTION_LENGTH)
+        raise ValueError(f"Unknown export format {format}.")
+
+    def export_path(self, file_path: str, format: str = "torchscript") -> str:
+        """The path of the artefact produced by export.
+
+        Args:
+            file_path (str): Relative path of the directory of the artefact. Ex. "home/pippo/saved"
+
+            format (str, optional): "torchscript" | "onnx". Defaults to "torchscript".
+
+        Returns:
+            str: The path of the artefact, for onnx the json file that describes the graphs.
+        """
+        return f"{file_path}/{self.name_net}_{self.C.encoder_dim}_{self.R.hidden_dim}_{self.R.attention.attention_dim if self.attention == True else 0}" + (".pt" if format == "torchscript" else "_onnx.json")
+
+    def set_words_embedding(self, weights: torch.Tensor):
+        """Initialize the embedding of the words of the decoder, Ex. with pretrained vectors (See Vocabulary.load_pretrained_embeddings).
+
+        Args:
+            weights (torch.Tensor): `(vocab_size, embedding_dim)`
+                The embedding of each ID.
+        """
+        with torch.no_grad():
+            self.R.words_embedding.weight.copy_(weights)
+    
     def forward(self, images: torch.tensor, captions: torch.tensor) -> torch.tensor:
         """Provide images to the net for retrieve captions
 
@@ -192,8 +303,33 @@ class CaRNet(nn.Module):
         """
         features = self.C(images)
         return self.R(features, captions)
+    
+    def __encode(self, images: torch.tensor) -> torch.tensor:
+        """Retrieve the features of the images, skipping the frozen trunk of the encoder if they come from a FeaturesStore.
 
-    def __accuracy(self, outputs: torch.tensor, labels: torch.tensor, captions_length: List[int]) -> float:
+        Args:
+            images (torch.tensor): `(batch_dim, channels, height, width)` or `(batch_dim, *trunk_output_shape)`
+                The images of the batch, or their already extracted features.
+
+        Returns:
+            (torch.tensor): `(batch_dim, encoder_dim)` or `(batch_dim, H_portions, W_portions, encoder_dim)` with Attention
+                The features of each image.
+        """
+        if self.__is_features(images):
+            return self.C.head(images)
+        
+        # The trunk is frozen: it runs without any tracking of autograd (no version counters, no graph), only the head is trained.
+        with torch.inference_mode():
+            features = self.C.trunk(images)
+        # Q. Why the clone?
+        # A. A tensor created in inference mode can't be saved for the backward of the head, its copy is a normal tensor.
+        return self.C.head(features.clone())
+    
+    def __is_features(self, images: torch.tensor) -> bool:
+        """Tell if the batch contains features coming from a FeaturesStore instead of images."""
+        return tuple(images.shape[1:]) == tuple(self.C.trunk_output_shape)
+
+    def __accuracy(self, outputs: torch.tensor, labels: torch.tensor, captions_length: List[int]) -> torch.Tensor:
         """Evaluate the accuracy of the Net with Jaccard Similarity.
                 Assumption: outputs and labels have same shape and already padded.
 
@@ -205,24 +341,30 @@ class CaRNet(nn.Module):
             captions_length (list): 
 
         Returns:
-            float: The accuracy of the Net
+            (torch.Tensor): `(1)`
+                The accuracy of the Net, on the same device of the outputs.
         """
         
 
-        # computing the accuracy with Jaccard Similarity, pytorch unique facility has bugs with cuda....it can be done "a manella" :)
-        # from python 3.9 you could use the package torchmetrics
-        # from torchmetrics import JaccardIndex
-        # intersection_over_union = JaccardIndex(num_classes=self.R.vocab_size).cuda() if self.device.type != "cpu" else JaccardIndex(num_classes=self.R.vocab_size)
-        # return intersection_over_union(outputs, labels)
-        outputs = np.array(list(map(lambda output: np.unique(output), outputs.cpu())), dtype=object) # Remove duplicate from each caption
-        labels = np.array(list(map(lambda label: np.unique(label), labels.cpu())), dtype=object) # Remove duplicate from each caption
+        # computing the accuracy with Jaccard Similarity over the set of words of each caption.
+        # Each caption is turned into a presence mask over the vocabulary, the sets are evaluated for the whole batch at once on the device of the tensors.
+        # <PAD>, <START> and <END> are not words, they are removed from both the sets.
+        batch_dim = labels.shape[0]
+        outputs_presence = torch.zeros((batch_dim, self.R.vocab_size), dtype=torch.bool, device=outputs.device).scatter_(1, outputs.long(), True) # Out: (batch_dim, vocab_size)
+        labels_presence = torch.zeros((batch_dim, self.R.vocab_size), dtype=torch.bool, device=labels.device).scatter_(1, labels.long().to(outputs.device), True) # Out: (batch_dim, vocab_size)
+        
+        special_tokens = [self.padding_index, 1, 2] # <PAD>, <START>, <END>
+        outputs_presence[:, special_tokens] = False
+        labels_presence[:, special_tokens] = False
+        
+        intersections = (outputs_presence & labels_presence).sum(dim=1).type(torch.float) # Out: (batch_dim)
+        unions = (outputs_presence | labels_presence).sum(dim=1).type(torch.float) # Out: (batch_dim)
         
-        unions = list(map(lambda index: len(np.union1d(outputs[index],labels[index])), range(labels.shape[0])))
-        intersections = list(map(lambda index: len(np.intersect1d(outputs[index],labels[index])), range(labels.shape[0])))
-        return torch.mean(torch.tensor(intersections).type(torch.float)/torch.tensor(unions).type(torch.float), axis=0)
+        # Two empty captions are equal
+        return torch.where(unions > 0, intersections / unions.clamp(min=1.), torch.ones_like(unions)).mean()
     
     
-    def train(self, train_set: MyDataset, validation_set: MyDataset, lr: float, epochs: int, vocabulary: Vocabulary):
+    def train(self, train_set: MyDataset, validation_set: MyDataset, lr: float, epochs: int, vocabulary: Vocabulary, precision: str = "fp32"):
         """Train the net
 
         Args:
@@ -240,15 +382,16 @@ class CaRNet(nn.Module):
                 
             vocabulary (Vocabulary): 
                 The vocabulary associate to the Dataset
+                
+            precision (str, optional): Defaults to "fp32".
+                "fp32" | "bf16" | "fp16". With bf16 or fp16 the forward of the encoder and of the decoder runs under autocast (mixed precision),
+                the loss, the gradients, the weights and the state of the optimizer stay in float32. fp16 uses a GradScaler (loss scaling).
+
+        Raises:
+            ValueError: If the precision is unknown.
         """
-        
-        # Initialize Loss: CrossEntropyLoss -> Softmax + NegativeLogLikelihoodLoss 
-        # Q. Why ignore_index is setted to <START> instead of <PAD>?
-        # A. In the training, both output of the CaRNet and Target is a padded tensor, but when we compute the loss it will evaluate the tensor with pack_padded_sequence.
-        #       And since <START> token is hardcoded as output at t_0 and it is contained into the Target we could avoid the computation of loss on it, since will be 0.                     
-        
-        criterion = nn.CrossEntropyLoss(ignore_index=vocabulary.predefined_token_idx()["<START>"],reduction="sum").cuda() if self.device.type == "cuda"  \
-                                            else nn.CrossEntropyLoss(ignore_index=vocabulary.predefined_token_idx()["<START>"],reduction="sum")
+        if precision not in CaRNet.precisions:
+            raise ValueError(f"Unknown precision {precision}, expected one of {list(CaRNet.precisions.keys())}.")
         
         # initializing some elements
         best_val_acc = -1.  # the best accuracy computed on the validation data
@@ -259,6 +402,16 @@ class CaRNet(nn.Module):
 
         # creating the optimizer
         optimizer = torch.optim.Adam(list(self.R.parameters()) + list(self.C.parameters()), lr)
+        
+        # Mixed precision: the autocast is disabled for fp32.
+        # Q. Why the scaler only for fp16?
+        # A. The small gradients underflow in float16, so the loss is scaled up before the backward and the gradients scaled down before the step.
+        #       bfloat16 has the same range of float32, it doesn't need it. When disabled the scaler does nothing.
+        autocast_dtype = CaRNet.precisions[precision]
+        scaler = torch.amp.GradScaler(self.device.type, enabled=(precision == "fp16"))
+        
+        # the mini-batch stats are printed at most once every 10 seconds
+        progress = Progress(10.)
 
         # loop on epochs
         for e in range(0, epochs):
@@ -268,10 +421,19 @@ class CaRNet(nn.Module):
             epoch_train_loss = 0.
             epoch_num_train_examples = 0
             batch_id_reporter = 0
-            for images,captions_ids,captions_length in  train_set:
+            
+            # Q. Why the number of mini-batches is computed before the loop?
+            # A. The mini-batches of a batch sampler depend on the epoch (See EpochBatchSampler), once the iteration is started
+            #       its length is the one of the next epoch.
+            number_of_batches = len(train_set)
+            for batch in  train_set:
+                # If the mini-batch is grouped by image, the 4th element is the index of the image of each caption. (See MyDataset.pack_minibatch_training)
+                images, captions_ids, captions_length = batch[:3]
+                images_index = batch[3].to(self.device) if len(batch) > 3 else None
+                
                 optimizer.zero_grad() 
                 
-                batch_num_train_examples = images.shape[0]  # mini-batch size (it might be different from 'batch_size') -> last batch truncated
+                batch_num_train_examples = captions_ids.shape[0]  # mini-batch size (it might be different from 'batch_size') -> last batch truncated
                 epoch_num_train_examples += batch_num_train_examples
                 
                 # Send data to the appropriate device
@@ -285,31 +447,46 @@ class CaRNet(nn.Module):
                 # Else:
                 # In: (batch_dim, channels, height, width) Out: (batch_dim, encoder_dim)
                 # Retrieve Features for each image
-                features = self.C(images)
+                with torch.autocast(self.device.type, dtype=autocast_dtype, enabled=(autocast_dtype is not None)):
+                    features = self.__encode(images)
+                    
+                    # Share the features of each image among all its captions
+                    if images_index is not None:
+                        features = features.index_select(0, images_index)
+                    
+                    # Check if attention is provided, if yes the output will change accordly for fitting doubly stochastic gradient
+                    if self.attention == False: # I know..some skilled dev. will hate me for this if-else statement. Forgive ME.
+                        hiddens, decode_lengths = self.R.hidden_states(features, captions_ids, captions_length) # hiddens > (B, L, hidden_dim); 
+                    else:
+                        hiddens, decode_lengths, alphas =  self.R.hidden_states(features, captions_ids, captions_length)
                 
-                # Check if attention is provided, if yes the output will change accordly for fitting doubly stochastic gradient
-                if self.attention == False: # I know..some skilled dev. will hate me for this if-else statement. Forgive ME.
-                    outputs, _ = self.R(features, captions_ids, captions_length) # outputs > (B, L, |V|); 
-                else:
-                    outputs, _, alphas =  self.R(features, captions_ids, captions_length)
+                # The loss is evaluated in float32, outside the autocast
+                hiddens = hiddens.float()
                 
-                outputs = pack_padded_sequence(outputs, captions_length.cpu(), batch_first=True)  #(Batch, MaxCaptionLength, |Vocabulary|) -> (Batch * CaptionLength, |Vocabulary|)
+                # The hidden state at t predicts the word t+1: the targets are the captions without <START>
+                hiddens = pack_padded_sequence(hiddens, decode_lengths, batch_first=True, enforce_sorted=False)  #(Batch, MaxCaptionLength, hidden_dim) -> (Batch * (CaptionLength - 1), hidden_dim)
                 
-                targets = pack_padded_sequence(captions_ids, captions_length.cpu(), batch_first=True) #(Batch, MaxCaptionLength) -> (Batch * CaptionLength)
+                targets = pack_padded_sequence(captions_ids[:, 1:], decode_lengths, batch_first=True, enforce_sorted=False) #(Batch, MaxCaptionLength - 1) -> (Batch * (CaptionLength - 1))
                 
-                loss = criterion(outputs.data, targets.data)
+                # Loss: CrossEntropy (sum reduction), computed by the output layer of the decoder directly on the hidden states
+                # Q. Why the logits are not computed by the decoder?
+                # A. The logits tensor (Batch, MaxCaptionLength, |Vocabulary|) is the biggest of the step, the output layer evaluates only the hidden states of the real tokens, 
+                #       a slice of the vocabulary at a time (LinearOutput) or only the clusters of the targets (AdaptiveOutput).
+                #       The <START> token is hardcoded as output at t_0, it is never a target.
+                loss = self.R.linear_1.loss(hiddens.data, targets.data)
                 
                 # Doubly stochastic gradient if attention is ON
                 if self.attention == True:
                     loss += float(torch.sum((
                                         0.5 * torch.sum((
-                                                            (1 - torch.sum(alphas, dim=1,keepdim=True)) ** 2 # caption_length sum
+                                                            (1 - torch.sum(alphas.float(), dim=1,keepdim=True)) ** 2 # caption_length sum
                                                         ), dim=2, keepdim=True) # alpha_dim sum
                                     ), dim=0).squeeze(1)) # batch_dim sum
                     
                 # computing gradients and updating the network weights
-                loss.backward()  # computing gradients
-                optimizer.step()  # updating weights
+                scaler.scale(loss).backward()  # computing gradients
+                scaler.step(optimizer)  # updating weights, skipped if the scaled gradients are not finite
+                scaler.update()
 
                 # Training set accuracy evaluation
                 with torch.no_grad():
@@ -321,19 +498,14 @@ class CaRNet(nn.Module):
                     # Else:
                     # In: (batch_dim, channels, height, width) Out: (batch_dim, encoder_dim)
                     # Retrieve Features for each image
-                    projections = self.C(images)
+                    projections = self.__encode(images)
                     
-                    # Create a padded tensor manually
-                    captions_output = torch.zeros((projections.shape[0],captions_ids.shape[1])).to(self.device)
+                    # Generate the caption of all the images at once, Out: (batch_dim, captions_ids.shape[1])
+                    captions_output = self.__generate_captions(projections, captions_ids.shape[1])
                     
-                    for idx, _ in enumerate(range(projections.shape[0])):
-                        # OUT: (1, CAPTION_LENGTH)
-                        if self.attention == True:
-                            _caption_no_pad, _ = self.R.generate_caption(projections[idx].unsqueeze(0),captions_ids.shape[1]) # IN: ((1, H_portions, W_portions, encoder_dim), 1)
-                        else:
-                            _caption_no_pad = self.R.generate_caption(projections[idx].unsqueeze(0),captions_ids.shape[1]) # IN: ((1, encoder_dim), 1)
-                        # Add for each batch element the caption. The surplus element are already feeded with zeros
-                        captions_output[idx,:_caption_no_pad.shape[1]] = _caption_no_pad
+                    # The caption is generated once for each image, then it is compared with all the captions of the image
+                    if images_index is not None:
+                        captions_output = captions_output.index_select(0, images_index)
                         
 
                     captions_output_padded = captions_output.type(torch.int32).to(self.device) # Out: (batch_dim, MAX_CAPTION_LENGTH)
@@ -350,9 +522,10 @@ class CaRNet(nn.Module):
                     self.switch_mode("training")
                     
                     # printing (mini-batch related) stats on screen
-                    print(f"  mini-batch:\tloss={loss.item():.4f}, tr_acc={batch_train_acc:.5f}")
+                    if progress.ready():
+                        print(f"  mini-batch {batch_id_reporter + 1}/{number_of_batches}:\tloss={loss.item():.4f}, tr_acc={batch_train_acc:.5f}")
                     
-                    # Store result of this batch in a dataframe
+                    # Store result of this batch
                     self.result_storer.add_train_info(epoch=int(e), batch_id=int(batch_id_reporter),loss=float(loss.item()),accuracy=float(batch_train_acc) )
                     batch_id_reporter += 1
             # Evaluate the accuracy of the validation set
@@ -383,13 +556,15 @@ class CaRNet(nn.Module):
                 The vocabulary associate to the Dataset
 
         Returns:
-            (int):
-                Accuracy on given dataset
+            (torch.Tensor): `(1)`
+                Accuracy on given dataset, the mean over all its captions.
         """
         
         self.switch_mode("evaluation")  # enforcing evaluation mode
         with torch.no_grad():  # keeping off the autograd engine
             _images = None
+            acc = 0.
+            number_of_examples = 0
             # loop on mini-batches to accumulate the network outputs (creating a new iterator)
             for images,captions_ids,captions_length  in data_set:
                 images = images.to(self.device)
@@ -401,32 +576,74 @@ class CaRNet(nn.Module):
                 # Else:
                 # In: (batch_dim, channels, height, width) Out: (batch_dim, encoder_dim) 
                 # Retrieve Features for each image
-                projections = self.C(images) 
+                projections = self.__encode(images) 
                 
-                # Create a padded tensor manually
-                captions_output = torch.zeros((projections.shape[0],captions_ids.shape[1])).to(self.device)
+                # Generate the caption of all the images at once, Out: (batch_dim, captions_ids.shape[1])
+                captions_output = self.__generate_captions(projections, captions_ids.shape[1])
                 
-                for idx, _ in enumerate(range(projections.shape[0])):
-                    # OUT: (1, CAPTION_LENGTH)
-                    if self.attention == True:
-                        _caption_no_pad, _ = self.R.generate_caption(projections[idx].unsqueeze(0),captions_ids.shape[1]) # IN: ((1, H_portions, W_portions, encoder_dim), 1)
-                    else:
-                        _caption_no_pad = self.R.generate_caption(projections[idx].unsqueeze(0),captions_ids.shape[1]) # IN: ((1, encoder_dim), 1)
-                   # Add for each batch element the caption. The surplus element are already feeded with zeros
-                    captions_output[idx,:_caption_no_pad.shape[1]] = _caption_no_pad
-                
-                # Pick the 1st image of the last batch for printing out the result 
-                _image = images[0]
+                # Pick the 1st image of the last batch for printing out the result, features coming from a FeaturesStore can't be printed.
+                _image = images[0] if not self.__is_features(images) else None
                 captions_output_padded = captions_output.type(torch.int32).to(self.device) # Out: (batch_dim, MAX_CAPTION_LENGTH)
                 
-                # computing performance
-                acc = self.__accuracy(captions_output_padded.squeeze(1), captions_ids, captions_length)
+                # computing performance, accumulated on the whole data set (the last mini-batch might be smaller)
+                acc += self.__accuracy(captions_output_padded.squeeze(1), captions_ids, captions_length) * captions_ids.shape[0]
+                number_of_examples += captions_ids.shape[0]
             
-            self.eval(_image,vocabulary)
+            if _image is not None:
+                self.eval(_image,vocabulary)
         self.switch_mode("training")
         
-        return acc
+        return acc / number_of_examples
     
+    def __generate_captions(self, features: torch.Tensor, max_caption_length: int) -> torch.Tensor:
+        """Generate the caption of each image in the batch.
+
+        Args:
+            features (torch.Tensor): `(batch_dim, encoder_dim)` or `(batch_dim, H_portions, W_portions, encoder_dim)` with Attention
+                The features of each image.
+                
+            max_caption_length (int): 
+                The maximum ammisible length of the caption.
+
+        Returns:
+            (torch.Tensor): `(batch_dim, max_caption_length)`
+                The caption of each image, padded with <PAD>.
+        """
+        if self.beam_size > 1:
+            captions, _ = BeamSearch(self.beam_size).search(self.R, features, max_caption_length)
+        elif self.attention == True:
+            captions, _ = self.R.generate_caption(features, max_caption_length) # IN: ((batch_dim, H_portions, W_portions, encoder_dim), max_caption_length)
+        else:
+            captions = self.R.generate_caption(features, max_caption_length) # IN: ((batch_dim, encoder_dim), max_caption_length)
+        
+        # Create a padded tensor manually, the surplus elements are already feeded with zeros
+        captions_output = torch.zeros((features.shape[0], max_caption_length), dtype=torch.int32, device=self.device)
+        captions_output[:, :captions.shape[1]] = captions
+        return captions_output
+
+    def stream_captions(self, images: torch.Tensor, max_caption_length: int = MAX_CAPTION_LENGTH) -> Iterator[Tuple[torch.Tensor, torch.Tensor]]:
+        """Generate the caption of each image in the batch with a greedy decoding, giving back each token as soon as it is produced.
+
+        Args:
+            images (torch.Tensor): `(batch_dim, channels, height, width)` or `(batch_dim, *trunk_output_shape)`
+                The images, or their already extracted features.
+
+            max_caption_length (int, optional): Defaults to MAX_CAPTION_LENGTH.
+                The maximum ammisible length of the caption, <START> included.
+
+        Yields:
+            (Tuple[torch.Tensor, torch.Tensor]): `[(batch_dim), (batch_dim)]`
+                For each step: the new token of each caption (<PAD> after <END>) and True if the caption has produced <END>.
+        """
+        self.switch_mode("evaluation")  # enforcing evaluation mode
+        try:
+            with torch.no_grad():
+                features = self.__encode(images.to(self.device))
+            for token_ids, finished, _ in GreedySearch().stream(self.R, features, max_caption_length):
+                yield token_ids, finished
+        finally:
+            self.switch_mode("training")
+
     def __generate_image_caption(self, image: torch.Tensor, vocabulary: Vocabulary, image_name: str = "caption.png"):
         """ Genareate an image with caption.
 
@@ -446,9 +663,22 @@ class CaRNet(nn.Module):
         # Out: 1st step (batch_dim,H_portions, W_portions, encoder_dim) -> 2nd step (batch_dim, H_portions * W_portions, encoder_dim) 
         # Else:
         # Out: (1, encoder_dim) 
-        features = self.C(image.unsqueeze(0))
+        features = self.__encode(image.unsqueeze(0))
         
-        if self.attention == True:
+        if self.beam_size > 1:
+            caption, _ = BeamSearch(self.beam_size).search(self.R, features, MAX_CAPTION_LENGTH)
+            if self.attention == True:
+                # The alphas of the best caption are retrieved feeding it back to the decoder, a step at a time.
+                # Q. Why not the forward of the decoder?
+                # A. It runs the weights of the LSTMCell in a single fused call, a quantized LSTMCell doesn't expose them (See quantize).
+                with torch.no_grad():
+                    state = self.R.init_state(features)
+                    alphas = []
+                    for t in range(caption.shape[1]):
+                        state = self.R.advance(state, caption[:, t])
+                        alphas.append(state[4])
+                    alphas = torch.stack(alphas, dim=1) # Out: (1, caption_length, H_portions * W_portions)
+        elif self.attention == True:
             caption, alphas = self.R.generate_caption(features,MAX_CAPTION_LENGTH)
         else:
             caption = self.R.generate_caption(features,MAX_CAPTION_LENGTH)
@@ -469,7 +699,7 @@ class CaRNet(nn.Module):
         
         # If attention is ON perform the evaluation of attention over the immage
         if self.attention == True:
-            self.__generate_image_attention(image, caption, alphas)
+            self.__generate_image_attention(image, caption, alphas[0].cpu())
 
         plt.figure(figsize=(15, 15))
         plt.imshow(image.cpu())
@@ -28,6 +28,7 @@
 
 import os
 import pandas as pd 
+import numpy as np
 import torch
 from torch.utils.data import Dataset
 import torch.nn as nn
@@ -35,7 +36,7 @@ from PIL import Image
 import re
 from torchvision import transforms
 from VARIABLE import MAX_CAPTION_LENGTH, IMAGES_SUBDIRECTORY_NAME, CAPTION_FILE_NAME
-from typing import Tuple, List, Iterable
+from typing import Tuple, List, Iterable, Union
 
 
 class MyDataset(Dataset):
@@ -62,8 +63,15 @@ class MyDataset(Dataset):
         "std_dev": torch.tensor([0.229, 0.224, 0.225]) # the standard deviation of the training data on the 3 channels (RGB)
     }
     
-    def __init__(self, directory_of_data:str , percentage:int = 100, already_computed_dataframe: pd.DataFrame = None):
+    def __init__(self, directory_of_data:str , percentage:int = 100, already_computed_arrays: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray] = None):
         """Create a new dataset from source files or from a preprocessed dataset.
+            The dataset is stored in numpy arrays, no python object is kept for each row:\n
+                images: `(number_of_images)` str, the name of each image.\n
+                image_ids: `(number_of_rows)` int32, the index in images of the image of each row.\n
+                words: `(number_of_words)` str, the words of the captions.\n
+                tokens: `(number_of_tokens)` int32, the index in words of each word of all the captions, one after the other.\n
+                offsets: `(number_of_rows + 1)` int64, the caption of the row i is tokens[offsets[i]:offsets[i+1]].\n
+                captions_ids: `(number_of_tokens + 2 * number_of_rows)` int32, None until encode is called. The captions in IDs form of the vocabulary, <START> and <END> included.
 
         Args:
             directory_of_data (str, mandatory): 
@@ -72,21 +80,24 @@ class MyDataset(Dataset):
             percentage (int, optional): Default is 100.
                 The percentage of row that we want store in our object.
                 
-            already_computed_dataframe (pd.DataFrame, Optional): Default is None.
+            already_computed_arrays (Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray], Optional): Default is None.
                 If the dataset is computed outside put it there.
-                REMARK Please follow the rule:
-                    | Index | image_name |  <List(str)> Caption |\n
-                    |:-----:|:----------:|:--------------------:|\n
-                    |   0   |  pippo.jpg | ["i","like","pizza"] |\n
+                REMARK Please follow the rule: (images, image_ids, words, tokens, offsets, captions_ids)
                     
         Raises:
             ValueError: if the dataset directory is invalid (Not Exist, Not a directory).
         """
         
-        # If the constructor receive a dataframe, we assume that it is already manipulated for doing our operation, no further op. needed.
-        if already_computed_dataframe is not None:
+        # If not None, the images are replaced by the features stored in it (See set_features_store).
+        self.features_store = None
+        
+        # If not None, the images are read already decoded and resized from it (See set_images_store).
+        self.images_store = None
+        
+        # If the constructor receive the arrays, we assume that they are already manipulated for doing our operation, no further op. needed.
+        if already_computed_arrays is not None:
             self.directory_of_data = directory_of_data
-            self._dataset = already_computed_dataframe
+            self.images, self.image_ids, self.words, self.tokens, self.offsets, self.captions_ids = already_computed_arrays
             return
         
         # Input checking
@@ -101,13 +112,52 @@ class MyDataset(Dataset):
         _temp_dataset: pd.DataFrame = pd.read_csv(f"{directory_of_data}/{CAPTION_FILE_NAME}", sep="|", skipinitialspace=True)[["image_name","comment"]]
         
         # Split every caption in its words. 
-        _temp_dataset["comment"] = _temp_dataset["comment"].apply( lambda comment: re.findall("[\\w]+|\.|\,",str(comment).lower()))
+        captions = [re.findall("[\\w]+|\.|\,",str(comment).lower()) for comment in _temp_dataset["comment"].tolist()]
         
         # Filter for retrieve only caption with a length less than MAX_CAPTION_LENGTH length
-        _temp_dataset = _temp_dataset[ _temp_dataset["comment"].map(len) <= MAX_CAPTION_LENGTH]
+        keep = [len(caption) <= MAX_CAPTION_LENGTH for caption in captions]
+        images_names = _temp_dataset["image_name"].astype(str).to_numpy()[np.asarray(keep, dtype=bool)]
+        captions = [caption for caption, _keep in zip(captions, keep) if _keep]
         
         # Pick only a given percentage of the row in the dataset
-        self._dataset = _temp_dataset.head(int(len(_temp_dataset)*(percentage/100)))
+        number_of_rows = int(len(captions)*(percentage/100))
+        images_names = images_names[:number_of_rows]
+        captions = captions[:number_of_rows]
+        
+        # Intern the image names and the words: each row only holds integers.
+        self.images, self.image_ids = np.unique(images_names.astype(str), return_inverse=True) # Out: (number_of_images), (number_of_rows)
+        self.image_ids = self.image_ids.reshape(-1).astype(np.int32)
+        
+        self.words, self.tokens = np.unique(np.array([word for caption in captions for word in caption], dtype=str), return_inverse=True) # Out: (number_of_words), (number_of_tokens)
+        self.tokens = self.tokens.reshape(-1).astype(np.int32)
+        
+        self.offsets = np.zeros(number_of_rows + 1, dtype=np.int64)
+        np.cumsum([len(caption) for caption in captions], out=self.offsets[1:])
+        
+        # The captions in IDs form, see encode.
+        self.captions_ids = None
+    
+    # For python > 3.9 -> def encode(self, vocabulary: Vocabulary):
+    def encode(self, vocabulary):
+        """Translate once all the captions of the dataset in IDs form, from now on __getitem__ returns the IDs of the caption instead of its words.
+            The fractions of the dataset (See get_fraction_of_dataset) keep the IDs.
+
+        Args:
+            vocabulary (Vocabulary): 
+                Vocabulary associated to the dataset.
+        """
+        # ID of each word of the dataset, the translation is done once per distinct word.
+        unknown = vocabulary.predefined_token_idx()["<UNK>"]
+        words_ids = np.array([vocabulary.word2id.get(word, unknown) for word in self.words.tolist()], dtype=np.int32) # Out: (number_of_words)
+        
+        # Each caption is moved forward by the <START> and <END> of the previous ones.
+        rows = np.arange(len(self))
+        captions_offsets = self.offsets + 2 * np.arange(len(self) + 1)
+        
+        self.captions_ids = np.empty(captions_offsets[-1], dtype=np.int32)
+        self.captions_ids[captions_offsets[:-1]] = vocabulary.predefined_token_idx()["<START>"]
+        self.captions_ids[captions_offsets[1:] - 1] = vocabulary.predefined_token_idx()["<END>"]
+        self.captions_ids[np.arange(len(self.tokens)) + 2 * np.repeat(rows, np.diff(self.offsets)) + 1] = words_ids[self.tokens]
         
     def get_fraction_of_dataset(self, percentage: int, delete_transfered_from_source: bool = False):
         """Get a fraction of the dataset 
@@ -123,32 +173,207 @@ class MyDataset(Dataset):
             (MyDataset): 
                 The new computed dataset object.
         """
-        # Retrieve the number of rows 
-        _temp_df_moved: pd.DataFrame = self._dataset.head(int(len(self._dataset)*(percentage/100))).sample(frac=1)
+        # Retrieve the number of rows, the rows moved are shuffled.
+        number_of_rows = int(len(self)*(percentage/100))
+        _rows_moved = np.random.permutation(number_of_rows)
         
-        # Deep copy of the dataframe
-        _temp_df_copy = _temp_df_moved.copy()
+        # Fresh MyDataset object with a copy of the rows.
+        _fraction = MyDataset(directory_of_data=self.directory_of_data, already_computed_arrays=self.__select(_rows_moved))
         
         # If delete_transfered_from_source == True delete the rows in the source object.
         if delete_transfered_from_source:
-            self._dataset: pd.DataFrame = self._dataset.drop(_temp_df_copy.index)
+            self.images, self.image_ids, self.words, self.tokens, self.offsets, self.captions_ids = self.__select(np.arange(number_of_rows, len(self)))
+        
+        _fraction.set_features_store(self.features_store)
+        _fraction.set_images_store(self.images_store)
+        return _fraction
+    
+    def __select(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Copy the given rows of the dataset, the images and words tables are shared.
+
+        Args:
+            rows (np.ndarray): `(number_of_selected_rows)`
+                The index of the rows to copy.
+
+        Returns:
+            (Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]): 
+                The arrays of the new dataset, see the constructor.
+        """
+        tokens, offsets = MyDataset.__gather(self.tokens, self.offsets, rows)
+        captions_ids = None
+        if self.captions_ids is not None:
+            captions_ids, _ = MyDataset.__gather(self.captions_ids, self.offsets + 2 * np.arange(len(self) + 1), rows)
+        
+        return self.images, self.image_ids[rows], self.words, tokens, offsets, captions_ids
+    
+    @staticmethod
+    def __gather(values: np.ndarray, offsets: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Copy the slices of a flat array associated to the given rows.
+
+        Args:
+            values (np.ndarray): `(number_of_values)`
+                The flat array, the slice of the row i is values[offsets[i]:offsets[i+1]].
+            offsets (np.ndarray): `(number_of_rows + 1)`
+                The offsets of the slices.
+            rows (np.ndarray): `(number_of_selected_rows)`
+                The index of the rows to copy.
+
+        Returns:
+            (Tuple[np.ndarray, np.ndarray]): [`(number_of_selected_values)`, `(number_of_selected_rows + 1)`]
+                The selected values one slice after the other and their offsets.
+        """
+        starts = offsets[rows]
+        lengths = offsets[rows + 1] - starts
+        
+        _offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=_offsets[1:])
+        
+        # Position in values of each value of the selection: start of its slice + position inside the slice.
+        values_index = np.repeat(starts - _offsets[:-1], lengths) + np.arange(_offsets[-1])
+        
+        return values[values_index], _offsets
+    
+    # For python > 3.9 -> def set_features_store(self, features_store: FeaturesStore):
+    def set_features_store(self, features_store):
+        """Serve the features of the frozen trunk instead of the images.
+
+        Args:
+            features_store (FeaturesStore): 
+                The store that contains the features of every image in the dataset, if None the images are served again.
+        """
+        self.features_store = features_store
+    
+    # For python > 3.9 -> def set_images_store(self, images_store: ImagesStore):
+    def set_images_store(self, images_store):
+        """Serve the images already decoded and resized, as uint8 tensor views of the store.
+
+        Args:
+            images_store (ImagesStore): 
+                The store that contains every image in the dataset, if None the images are decoded from the images folder again.
+        """
+        self.images_store = images_store
+    
+    def get_all_distinct_images_in_dataset(self) -> List[str]:
+        """Return the name of all the images in the dataset (No Repetition).
+
+        Returns:
+            (List[str]): All the images in the dataset, in order of appearance.
+        """
+        _, first_rows = np.unique(self.image_ids, return_index=True)
+        return self.images[self.image_ids[np.sort(first_rows)]].tolist()
+    
+    def get_captions_length(self) -> List[int]:
+        """Return the length of each caption of the dataset, +2 for <START> and <END> token.
+
+        Returns:
+            (List[int]): The length of the caption of each row.
+        """
+        return (np.diff(self.offsets) + 2).tolist()
+    
+    def get_images_groups(self) -> List[List[int]]:
+        """Group the rows of the dataset by image.
+
+        Returns:
+            (List[List[int]]): For each image in the dataset (in order of appearance), the indexes of its rows.
+        """
+        rows = np.argsort(self.image_ids, kind="stable")
+        _, first_rows = np.unique(self.image_ids[rows], return_index=True)
+        groups = np.split(rows, first_rows[1:])
+        return [groups[group].tolist() for group in np.argsort(rows[first_rows], kind="stable")]
+    
+    def load_image(self, image_name: str) -> Image.Image:
+        """Load an image of the dataset from the images folder.
+
+        Args:
+            image_name (str): 
+                The name of the image.
+
+        Returns:
+            (Image.Image): 
+                The image in RGB format.
+        """
+        return Image.open(f"{self.directory_of_data}/{IMAGES_SUBDIRECTORY_NAME}/{image_name}").convert('RGB')
+    
+    @staticmethod
+    def image_to_tensor(image: Image.Image) -> torch.Tensor:
+        """Transform an image from PIL.Image into a pytorch.Tensor ready for the encoder (No random transformation).
+
+        Args:
+            image (Image.Image): 
+                The image.
+
+        Returns:
+            (torch.Tensor): `(channels, height, width)`
+                The image as a normalized tensor.
+        """
+        operations = transforms.Compose([
+                transforms.Resize((MyDataset.image_trasformation_parameter["crop"]["size"], MyDataset.image_trasformation_parameter["crop"]["size"])),  # Crops the given image at the center.
+                transforms.ToTensor(),
+                transforms.Normalize(mean=MyDataset.image_trasformation_parameter["mean"], std=MyDataset.image_trasformation_parameter["std_dev"])
+        ])
+        return operations(image)
+    
+    @staticmethod
+    def images_to_batch(images: List[object], training: bool = False) -> torch.Tensor:
+        """Merge the images coming from the __getitem__ method into a tensor ready for the encoder.
+
+        Args:
+            images (List[object]): 
+                The images, they can be:\n
+                    PIL.Image.Image: decoded from the images folder.\n
+                    torch.Tensor `(height, width, channels)` uint8: coming from an ImagesStore.\n
+                    torch.Tensor `(*trunk_output_shape)` float: coming from a FeaturesStore, they are only stacked.
+                    
+            training (bool, optional): Defaults to False.
+                If True the images are flipped randomly.
+
+        Returns:
+            (torch.Tensor): `(batch_dim, channels, height, width)` or `(batch_dim, *trunk_output_shape)`
+                The images of the mini-batch.
+        """
+        if isinstance(images[0], Image.Image):
+            # Trasnform the images from PIL.Image into a pytorch.Tensor
+            operations = transforms.Compose([
+                    transforms.Resize((MyDataset.image_trasformation_parameter["crop"]["size"],MyDataset.image_trasformation_parameter["crop"]["size"])), # Crop a random portion of image and resize it to a given size.
+                    transforms.RandomHorizontalFlip(p=0.3 if training else 0.), # Horizontally flip the given image randomly with a given probability.
+                    transforms.ToTensor(), # Convert a PIL Image or numpy.ndarray to tensor.  (H x W x C) in the range [0, 255] to a torch.FloatTensor of shape (C x H x W) in the range [0.0, 1.0] 
+                    transforms.Normalize(mean=MyDataset.image_trasformation_parameter["mean"], std=MyDataset.image_trasformation_parameter["std_dev"]),
+            ])
+            images = list(map(lambda image: operations(image),list(images))) # Out: List[(channels, height, width)]
+            # Merge images (from list of 3D tensor to a tensor).
+            return torch.stack(images, 0) #  Out: (batch_dim, channels, height, width)
         
-        # Return a fresh MyDataset object.
-        return MyDataset(directory_of_data=self.directory_of_data, already_computed_dataframe=_temp_df_copy)
+        if images[0].dtype == torch.uint8:
+            # Same operations of the PIL.Image case, done on the whole batch: the resize is already done by the store.
+            images = torch.stack(images, 0).permute(0, 3, 1, 2).float().div_(255.) # Out: (batch_dim, channels, height, width) in the range [0.0, 1.0]
+            if training:
+                flip = torch.rand(images.shape[0]) < 0.3 # Horizontally flip the given image randomly with a given probability.
+                images[flip] = images[flip].flip(3)
+            return images.sub_(MyDataset.image_trasformation_parameter["mean"].view(1, -1, 1, 1)).div_(MyDataset.image_trasformation_parameter["std_dev"].view(1, -1, 1, 1))
+        
+        # The images are already features coming from the store, they are only stacked.
+        return torch.stack(images, 0) # Out: (batch_dim, *trunk_output_shape)
     
     def get_all_distinct_words_in_dataset(self) -> List[str]:
         """Return all the words in each caption of the dataset as a big list of strings (No Repetition).
 
         Returns:
-            (List[str]): All the words in the dataset.
+            (List[str]): All the words in the dataset, in order of appearance.
         """
-        words = []
-        # Iterate over each sample in the dataset.
-        for idx,row in self._dataset.iterrows():
-            for word in row["comment"]:
-                if word not in words:
-                    words.append(word)
-        return words
+        _, first_tokens = np.unique(self.tokens, return_index=True)
+        return self.words[self.tokens[np.sort(first_tokens)]].tolist()
+    
+    def get_words_frequency(self) -> Tuple[List[str], np.ndarray]:
+        """Count how many times each word appears in the captions of the dataset.
+
+        Returns:
+            (Tuple[List[str], np.ndarray]): [`(number_of_words)`, `(number_of_words)`]
+                All the words in the dataset in order of appearance (See get_all_distinct_words_in_dataset) and the number of occurrences of each of them.
+        """
+        counts = np.bincount(self.tokens, minlength=len(self.words)) # Out: (number_of_words)
+        _, first_tokens = np.unique(self.tokens, return_index=True)
+        words_index = self.tokens[np.sort(first_tokens)]
+        return self.words[words_index].tolist(), counts[words_index]
     
     def __len__(self) -> int:
         """Evaluate the length of the dataset.
@@ -158,79 +383,165 @@ class MyDataset(Dataset):
             int: The legth of the dataset.
 
         """
-        return self._dataset.shape[0]
+        return self.image_ids.shape[0]
     
-    def __getitem__(self, idx: int) -> Tuple[Image.Image, List[str]]:
-        """Get the associated image and caption of a given index.
+    def get_caption(self, idx: int) -> List[str]:
+        """Get the caption of a given index.
+
+        Args:
+            idx (int): 
+                The index associated univocally to a row of the dataset.
+
+        Returns:
+            (List[str]): 
+                The words of the caption.
+        """
+        return self.words[self.tokens[self.offsets[idx]:self.offsets[idx+1]]].tolist()
+    
+    def get_caption_ids(self, idx: int) -> np.ndarray:
+        """Get the caption in IDs form of a given index, the dataset must be encoded (See encode).
+
+        Args:
+            idx (int): 
+                The index associated univocally to a row of the dataset.
+
+        Returns:
+            (np.ndarray): `(caption_length + 2)`
+                The IDs of the caption, <START> and <END> included.
+        """
+        return self.captions_ids[self.offsets[idx] + 2 * idx:self.offsets[idx+1] + 2 * (idx + 1)]
+    
+    def get_caption_or_ids(self, idx: int) -> Union[List[str], np.ndarray]:
+        """Get the caption of a given index in IDs form if the dataset is encoded, otherwise in words form.
 
         Args:
             idx (int): 
                 The index associated univocally to a row of the dataset.
 
+        Returns:
+            (Union[List[str], np.ndarray]): 
+                See get_caption_ids and get_caption.
+        """
+        return self.get_caption(idx) if self.captions_ids is None else self.get_caption_ids(idx)
+    
+    def __getitem__(self, idx: Union[int, List[int]]) -> Tuple[Image.Image, List[str]]:
+        """Get the associated image and caption of a given index.
+
+        Args:
+            idx (int or List[int]): 
+                The index associated univocally to a row of the dataset.
+                If it is a list of indexes of the same image (See get_images_groups), the image is loaded once with all the captions.
+
         Returns:
             (Tuple[Image.Image, List[str]]): 
                 Image and caption of the input index.
+                    REMARK If a features store is set, the image is replaced by its features `(*trunk_output_shape)`.
+                    REMARK If an images store is set, the image is a uint8 tensor `(height, width, channels)`.
+                    REMARK If idx is a list, the caption is a List[List[str]].
+                    REMARK If the dataset is encoded (See encode), the caption is a np.ndarray of IDs `(caption_length + 2)`.
         """
-        image: Image.Image = Image.open(f"{self.directory_of_data}/{IMAGES_SUBDIRECTORY_NAME}/{self._dataset.iloc[idx]['image_name']}").convert('RGB')
-        caption: List[str] = self._dataset.iloc[idx]["comment"]
+        if isinstance(idx, list):
+            image, _ = self[idx[0]]
+            return image, [self.get_caption_or_ids(_idx) for _idx in idx]
+        
+        image_name: str = str(self.images[self.image_ids[idx]])
+        if self.features_store is not None:
+            image = self.features_store.get(image_name)
+        elif self.images_store is not None:
+            image = self.images_store.get(image_name)
+        else:
+            image = self.load_image(image_name)
+        caption: List[str] = self.get_caption_or_ids(idx)
         
         return image, caption 
     
-    # For python > 3.9 -> def pack_minibatch_training(self, data: List[Tuple[Image.Image, List[str]]], vocabulary: Vocabulary) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
-    def pack_minibatch_training(self, data: List[Tuple[Image.Image, List[str]]], vocabulary) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    # For python > 3.9 -> def pack_minibatch_training(self, data: List[Tuple[Image.Image, List[str]]], vocabulary: Vocabulary, group_by_image: bool = False) -> Tuple[torch.Tensor, ...]:
+    def pack_minibatch_training(self, data: List[Tuple[Image.Image, List[str]]], vocabulary, group_by_image: bool = False) -> Tuple[torch.Tensor, ...]:
         """Custom method for packing a mini-batch for training.
 
         Args:
             data (List[Tuple[image.Image, List[str]]]): 
                 A list of tuples coming from the calls of the __getitem__ method.
+                    REMARK If group_by_image is True, each tuple holds an image and all its captions: Tuple[image.Image, List[List[str]]]
                 
             vocabulary (Vocabulary): 
                 Vocabulary associated to the dataset.
+                
+            group_by_image (bool, optional): Defaults to False.
+                If True, each image is packed only once (See ImageGroupedBatchSampler) and an index is added to the mini-batch.
 
         Returns:
             (Tuple[
                     torch.Tensor,
                     torch.Tensor, 
-                    torch.Tensor
-                  ]): [`(batch_dim, channels, height, width)`, `(batch_dim,min(MAX_CAPTION_LENGTH,captions[0]))`, `(batch_dim)`]
+                    torch.Tensor,
+                    (torch.Tensor) 
+                  ]): [`(images_dim, channels, height, width)`, `(batch_dim,min(MAX_CAPTION_LENGTH,captions[0]))`, `(batch_dim)`, (`(batch_dim)`)]
                   
                 Tuple[0]: The images of the mini-batch converted to Tensor.
                 Tuple[1]: The caption of each image the mini-batch, the dim 2 depends on the maximum caption length inside the batch. 
                 Tuple[2]: The length of each caption +2 for <START> and <END> token.
+                Tuple[3]: Only if group_by_image is True, for each caption the index of its image in Tuple[0].
         """
+        if group_by_image:
+            images, captions_groups = zip(*data)
+            
+            # Flat the captions, remembering the image of each of them.
+            data = [(image_index, caption) for image_index, captions in enumerate(captions_groups) for caption in captions]
+        
         # Sort the data list by caption length (descending order).
         data.sort(key=lambda x: len(x[1]), reverse=True)
-    
-        images, captions = zip(*data)
+        
+        if group_by_image:
+            images_index, captions = zip(*data)
+            images_index = torch.tensor(images_index, dtype=torch.long) # Out: (batch_dim)
+        else:
+            images, captions = zip(*data)
         
         # Type annotation for zip extraction, no clear way to determine type with this kind of built-in method in a pythonic way.
         images: List[Image.Image] = images
         captions: List[List[str]] = captions
         
-        # Trasnform the images from PIL.Image into a pytorch.Tensor
-        operations = transforms.Compose([
-                transforms.Resize((MyDataset.image_trasformation_parameter["crop"]["size"],MyDataset.image_trasformation_parameter["crop"]["size"])), # Crop a random portion of image and resize it to a given size.
-                transforms.RandomHorizontalFlip(p=0.3), # Horizontally flip the given image randomly with a given probability.
-                transforms.ToTensor(), # Convert a PIL Image or numpy.ndarray to tensor.  (H x W x C) in the range [0, 255] to a torch.FloatTensor of shape (C x H x W) in the range [0.0, 1.0] 
-                transforms.Normalize(mean=MyDataset.image_trasformation_parameter["mean"], std=MyDataset.image_trasformation_parameter["std_dev"]),
-        ])
-        images = list(map(lambda image: operations(image),list(images))) # Out: List[(channels, height, width)]
-        # Merge images (from list of 3D tensor to a tensor).
-        images = torch.stack(images, 0) #  Out: (batch_dim, channels, height, width)
-        
-        # Evaluate captions: Devo
-        # Q. Why +2?
-        # A. For the <START> and <END> Token.
-        captions_length = torch.tensor([len(caption)+2 for caption in captions]) # Out: (batch_dim)
+        # Trasnform the images into a pytorch.Tensor, with random flip.
+        images = MyDataset.images_to_batch(list(images), training=True) #  Out: (images_dim, channels, height, width) or (images_dim, *trunk_output_shape)
         
-        # From to words to ids of vocabulary, add <START>.id at beginning and <END>.id at end.
-        captions = [vocabulary.translate(caption,"complete") for caption in captions]
-        
-        # Pad the captions with zeros id == <PAD>.id.
-        captions = nn.utils.rnn.pad_sequence(captions, padding_value=0, batch_first=True) # Out: (batch_dim,min(MAX_CAPTION_LENGTH,captions[0]))
+        captions, captions_length = MyDataset.captions_to_batch(list(captions), vocabulary)
         
+        if group_by_image:
+            return images, captions, captions_length, images_index
+        return images, captions, captions_length
+    
+    # For python > 3.9 -> def captions_to_batch(captions: List[Union[List[str], np.ndarray]], vocabulary: Vocabulary) -> Tuple[torch.Tensor, torch.Tensor]:
+    @staticmethod
+    def captions_to_batch(captions: List[Union[List[str], np.ndarray]], vocabulary) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Translate the captions coming from the __getitem__ method and merge them into a padded tensor.
+
+        Args:
+            captions (List[Union[List[str], np.ndarray]]): 
+                The captions, already sorted by length (descending order).
+                    REMARK If the dataset is encoded (See MyDataset.encode) they are already in IDs form, they are only padded.
+                
+            vocabulary (Vocabulary): 
+                Vocabulary associated to the dataset.
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): [`(batch_dim,min(MAX_CAPTION_LENGTH,captions[0]))`, `(batch_dim)`]
+                The padded captions in IDs form and the length of each caption +2 for <START> and <END> token.
+        """
+        if isinstance(captions[0], np.ndarray):
+            # The IDs already include <START> and <END>.
+            captions_length = np.array([caption.shape[0] for caption in captions], dtype=np.int32) # Out: (batch_dim)
+            
+            # Pad the captions with zeros id == <PAD>.id.
+            padded = np.zeros((len(captions), captions_length.max()), dtype=np.int64) # Out: (batch_dim,min(MAX_CAPTION_LENGTH,captions[0]))
+            padded[np.arange(padded.shape[1]) < captions_length[:, None]] = np.concatenate(captions)
+            
+            return torch.from_numpy(padded), torch.from_numpy(captions_length)
         
-        return images, captions.type(torch.LongTensor), captions_length.type(torch.int32)
+        # From to words to ids of vocabulary, add <START>.id at beginning and <END>.id at end, padded with zeros id == <PAD>.id.
+        # Q. Why the length is +2?
+        # A. For the <START> and <END> Token.
+        return vocabulary.translate_batch(captions, "complete") # Out: (batch_dim,min(MAX_CAPTION_LENGTH,captions[0])), (batch_dim)
     
     # For python > 3.9 -> def pack_minibatch_training(self, data: List[Tuple[Image.Image, List[str]]], vocabulary: Vocabulary) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
     def pack_minibatch_evaluation(self, data: List[Tuple[Image.Image, List[str]]], vocabulary) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
@@ -263,29 +574,10 @@ class MyDataset(Dataset):
         images: List[Image.Image] = images
         captions: List[List[str]] = captions
         
-        # Trasnform the images from PIL.Image into a pytorch.Tensor)
-        
-        operations = transforms.Compose([
-                transforms.Resize((MyDataset.image_trasformation_parameter["crop"]["size"], MyDataset.image_trasformation_parameter["crop"]["size"])),  # Crops the given image at the center.
-                transforms.ToTensor(),
-                transforms.Normalize(mean=MyDataset.image_trasformation_parameter["mean"], std=MyDataset.image_trasformation_parameter["std_dev"])
-        ])
-
-        images = list(map(lambda image: operations(image),list(images))) # Out: List[(channels, height, width)]
-        # Merge images (from list of 3D tensor to a tensor).
-        images = torch.stack(images, 0) #  Out: (batch_dim, channels, height, width)
-        
-        # Evaluate captions: Devo
-        # Q. Why +2?
-        # A. For the <START> and <END> Token.
-        captions_length = torch.tensor([len(caption)+2 for caption in captions]) # Out: (batch_dim)
-        
-        # From to words to ids of vocabulary, add <START>.id at beginning and <END>.id at end.
-        captions = [vocabulary.translate(caption,"complete") for caption in captions]
-        
-        # Pad the captions with zeros id == <PAD>.id.
-        captions = nn.utils.rnn.pad_sequence(captions, padding_value=0, batch_first=True) # Out: (batch_dim,min(MAX_CAPTION_LENGTH,captions[0]))
+        # Trasnform the images into a pytorch.Tensor.
+        images = MyDataset.images_to_batch(list(images)) #  Out: (batch_dim, channels, height, width) or (batch_dim, *trunk_output_shape)
         
+        captions, captions_length = MyDataset.captions_to_batch(list(captions), vocabulary)
         
-        return images, captions.type(torch.LongTensor), captions_length.type(torch.int32)
+        return images, captions, captions_length
         
\ No newline at end of file
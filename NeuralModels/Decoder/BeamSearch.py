@@ -0,0 +1,166 @@
+# MIT License
+
+# Copyright (c) 2022 christiandimaio
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Typing trick for avoid circular import dependencies valid for python > 3.9
+# from __future__ import annotations
+# from typing import TYPE_CHECKING
+# if TYPE_CHECKING:
+#     from .IDecoder import IDecoder
+
+import torch
+import torch.nn.functional as F
+from typing import Tuple
+from .DecoderState import select_states, repeat_states
+
+class BeamSearch():
+    """
+        Beam search decoding, vectorized over the images of the batch and over the beams.
+        
+        It works with every decoder that exposes:
+        
+            1) init_state(images) -> state: a tuple of tensors, dim 0 is the batch.\n
+            2) step(state, token_ids) -> (logits, state)
+            
+        At each step all the (batch_dim * beam_size) beams go through a single step of the decoder. 
+        A beam that produces <END> stops growing, it is only padded with <PAD> at zero cost.
+    """
+    
+    def __init__(self, beam_size: int = 3, length_penalty: float = 0.7, start_index: int = 1, end_index: int = 2, padding_index: int = 0):
+        """Constructor of the beam search
+
+        Args:
+            beam_size (int, optional): Defaults to 3.
+                The number of beams kept for each image.
+                
+            length_penalty (float, optional): Defaults to 0.7.
+                The score of a caption, used for rank the beams, is log_probability / length ** length_penalty, 0 means no normalization.
+                
+            start_index (int, optional): Defaults to 1.
+                The index of <START>.
+                
+            end_index (int, optional): Defaults to 2.
+                The index of <END>.
+                
+            padding_index (int, optional): Defaults to 0.
+                The index of <PAD>.
+        """
+        self.beam_size = beam_size
+        self.length_penalty = length_penalty
+        self.start_index = start_index
+        self.end_index = end_index
+        self.padding_index = padding_index
+        
+    # For python > 3.9 -> def search(self, decoder: IDecoder, images: torch.Tensor, max_caption_length: int) -> Tuple[torch.Tensor, torch.Tensor]:
+    def search(self, decoder, images: torch.Tensor, max_caption_length: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Generate the best caption of each image in the batch.
+
+        Args:
+            decoder (IDecoder): 
+                The decoder.
+                
+            images (torch.Tensor): `(batch_dim, *)`
+                The features associated to each image, as expected by decoder.init_state.
+                
+            max_caption_length (int): 
+                The maximum ammisible length of the caption.
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): `[(batch_dim, <variable>), (batch_dim)]`
+                The best caption of each image (It includes <START> at t_0, after <END> it is padded with <PAD>) and its normalized score.
+                    REMARK The beams are ranked by the normalized score at each step, not only at the end.
+        """
+        batch_dim = images.shape[0]
+        beam_size = self.beam_size
+        
+        with torch.no_grad():
+            # Each image is replicated for each beam: dim 0 is (batch_dim * beam_size), the beams of an image are contiguous.
+            state = repeat_states(decoder.init_state(images), beam_size)
+            
+            token_ids = torch.full((batch_dim * beam_size,), self.start_index, dtype=torch.long, device=images.device) # Out: (batch_dim * beam_size)
+            sequences = token_ids.unsqueeze(1) # Out: (batch_dim * beam_size, 1)
+            
+            # At t_0 all the beams of an image are the same, only the 1st one is kept alive.
+            scores = torch.full((batch_dim, beam_size), float("-inf"), device=images.device) # Out: (batch_dim, beam_size)
+            scores[:, 0] = 0.
+            
+            finished = torch.zeros(batch_dim * beam_size, dtype=torch.bool, device=images.device) # True if the beam has already produced <END>
+            lengths = torch.zeros(batch_dim * beam_size, device=images.device) # Number of generated tokens of each beam, <END> included
+            
+            # Offset of the 1st beam of each image in dim 0
+            offsets = (torch.arange(batch_dim, device=images.device) * beam_size).unsqueeze(1) # Out: (batch_dim, 1)
+            
+            for _ in range(max_caption_length-1):
+                logits, state = decoder.step(state, token_ids) # Out: (batch_dim * beam_size, vocab_size)
+                log_probabilities = F.log_softmax(logits.float(), dim=1)
+                vocab_size = log_probabilities.shape[1]
+                
+                # A finished beam can only be extended with <PAD>, at zero cost.
+                log_probabilities = log_probabilities.masked_fill(finished.unsqueeze(1), float("-inf"))
+                log_probabilities[:, self.padding_index] = log_probabilities[:, self.padding_index].masked_fill(finished, 0.)
+                
+                # Score of each possible extension of each beam, then pick the best beam_size for each image.
+                # Q. Why the extensions are ranked by the normalized score?
+                # A. A finished beam keeps its length, the others grow: with the raw log probability the short finished beams would
+                #       hold their place in the beam up to the end, and push out longer captions that win after the normalization.
+                candidates = (scores.reshape(-1, 1) + log_probabilities).reshape(batch_dim, beam_size * vocab_size) # Out: (batch_dim, beam_size * vocab_size)
+                candidates_lengths = (lengths + (~finished).float()).reshape(batch_dim, beam_size, 1).expand(-1, -1, vocab_size).reshape(batch_dim, beam_size * vocab_size)
+                _, indexes = self.__normalize(candidates, candidates_lengths).topk(beam_size, dim=1) # Out: (batch_dim, beam_size)
+                scores = candidates.gather(1, indexes) # Out: (batch_dim, beam_size)
+                
+                # From which beam each new beam comes from, and the token that extends it.
+                origins = (offsets + indexes // vocab_size).reshape(-1) # Out: (batch_dim * beam_size)
+                token_ids = (indexes % vocab_size).reshape(-1) # Out: (batch_dim * beam_size)
+                
+                state = select_states(state, origins)
+                sequences = torch.cat((sequences.index_select(0, origins), token_ids.unsqueeze(1)), dim=1)
+                finished = finished.index_select(0, origins)
+                lengths = lengths.index_select(0, origins) + (~finished).float()
+                finished = finished | (token_ids == self.end_index)
+                
+                if bool(finished.all()):
+                    break
+            
+            # Pick the best beam for each image.
+            best_scores, best = self.__normalize(scores, lengths.reshape(batch_dim, beam_size)).max(dim=1) # Out: (batch_dim)
+            captions = sequences.index_select(0, offsets.squeeze(1) + best) # Out: (batch_dim, <variable>)
+            
+            # The discarded beams may be longer than the best ones, the trailing columns with only <PAD> are dropped.
+            # With a single image the caption ends with <END> (or at max_caption_length).
+            captions = captions[:, :int((captions != self.padding_index).sum(dim=1).max())]
+            
+        return captions, best_scores
+    
+    def __normalize(self, scores: torch.Tensor, lengths: torch.Tensor) -> torch.Tensor:
+        """Length normalization of the scores: log_probability / length ** length_penalty.
+
+        Args:
+            scores (torch.Tensor): `(batch_dim, *)`
+                The log probability of each caption.
+                
+            lengths (torch.Tensor): `(batch_dim, *)`
+                The number of generated tokens of each caption, <END> included.
+
+        Returns:
+            (torch.Tensor): `(batch_dim, *)`
+                The normalized scores.
+        """
+        return scores / lengths.clamp(min=1.) ** self.length_penalty
@@ -0,0 +1,75 @@
+# MIT License
+
+# Copyright (c) 2022 christiandimaio
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import torch
+from typing import Tuple, List
+
+# The state of a decoder is a tuple of plain tensors, dim 0 is the batch (See IDecoder.init_state).
+# These helpers manipulate the state of many captions at once, without knowing what the tensors are:
+#   the same code works for the hidden and cell state of RNetvH and for the images and the alphas of RNetvHCAttention.
+
+def merge_states(states: List[Tuple[torch.Tensor, ...]]) -> Tuple[torch.Tensor, ...]:
+    """Concatenate the states of many batches in a single batch.
+        Useful for decode together the captions of different requests, that started at different times.
+
+    Args:
+        states (List[Tuple[torch.Tensor, ...]]): 
+            The states to merge, all produced by the same decoder.
+
+    Returns:
+        (Tuple[torch.Tensor, ...]): 
+            The merged state, the captions keep the order of the given states.
+    """
+    return tuple(torch.cat(tensors, dim=0) for tensors in zip(*states))
+
+def select_states(state: Tuple[torch.Tensor, ...], index: torch.Tensor) -> Tuple[torch.Tensor, ...]:
+    """Select (and reorder) the captions of a state.
+        Useful for remove the finished captions from a batch, or for follow the beams of a beam search.
+
+    Args:
+        state (Tuple[torch.Tensor, ...]): 
+            The state.
+            
+        index (torch.Tensor): `(new_batch_dim)`
+            The position in the batch of each caption to keep, a position can be repeated.
+
+    Returns:
+        (Tuple[torch.Tensor, ...]): 
+            The state of the selected captions.
+    """
+    return tuple(tensor.index_select(0, index) for tensor in state)
+
+def repeat_states(state: Tuple[torch.Tensor, ...], repeats: int) -> Tuple[torch.Tensor, ...]:
+    """Repeat each caption of a state, the copies of a caption are contiguous.
+
+    Args:
+        state (Tuple[torch.Tensor, ...]): 
+            The state.
+            
+        repeats (int): 
+            The number of copies of each caption.
+
+    Returns:
+        (Tuple[torch.Tensor, ...]): 
+            The state with batch_dim * repeats captions.
+    """
+    return tuple(tensor.repeat_interleave(repeats, dim=0) for tensor in state)
@@ -0,0 +1,73 @@
+# MIT License
+
+# Copyright (c) 2022 christiandimaio
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import torch
+import torch.nn as nn
+from torch.nn.utils.rnn import pack_padded_sequence, PackedSequence
+from typing import Tuple
+
+def fused_lstm(lstm_unit: nn.LSTMCell, inputs: torch.Tensor, lengths: torch.Tensor, state: Tuple[torch.Tensor, torch.Tensor] = None) -> PackedSequence:
+    """Run all the timesteps of a batch of sequences through the weights of a LSTMCell with a single multi-timestep LSTM call.
+        Equivalent to loop over the timesteps calling lstm_unit, but without the python overhead and a kernel launch for each step.
+        The weights are the ones of lstm_unit, so the checkpoints of the decoders don't change.
+
+    Args:
+        lstm_unit (nn.LSTMCell): 
+            The cell that owns the weights.
+            
+        inputs (torch.Tensor): `(batch_dim, max_length, input_dim)`
+            The padded input of each timestep.
+            
+        lengths (torch.Tensor): `(batch_dim)`
+            The number of valid timesteps of each sequence, the padding is never fed to the LSTM.
+            
+        state (Tuple[torch.Tensor, torch.Tensor], optional): `[(batch_dim, hidden_dim), (batch_dim, hidden_dim)]` Defaults to None (ZEROS).
+            Hidden and cell state at t_0.
+
+    Returns:
+        (PackedSequence): `(sum(lengths), hidden_dim)`
+            The hidden state of each valid timestep, in the same order of the input.
+    """
+    packed_inputs = pack_padded_sequence(inputs, torch.as_tensor(lengths).cpu(), batch_first=True, enforce_sorted=False)
+    
+    if state is None:
+        state = (torch.zeros((inputs.shape[0], lstm_unit.hidden_size), dtype=inputs.dtype, device=inputs.device), 
+                 torch.zeros((inputs.shape[0], lstm_unit.hidden_size), dtype=inputs.dtype, device=inputs.device))
+    
+    # The packed sequence is sorted by length, the initial state must follow the same order. In: (batch_dim, hidden_dim) -> Out: (1, batch_dim, hidden_dim) 
+    state = tuple(_state.index_select(0, packed_inputs.sorted_indices.to(_state.device)).unsqueeze(0) for _state in state)
+    
+    data = packed_inputs.data
+    weights = [lstm_unit.weight_ih, lstm_unit.weight_hh, lstm_unit.bias_ih, lstm_unit.bias_hh]
+    
+    # Q. Why an explicit cast under autocast?
+    # A. torch.lstm is not in the autocast lists, it follows the dtype of its inputs: float32 or not depending on the decoder (the embedding is float32, the projection of the image is not).
+    #       Everything is cast to the autocast dtype, as autocast does for a matmul: the weights stay float32, the gradient flows back through the cast.
+    if torch.is_autocast_enabled(data.device.type):
+        dtype = torch.get_autocast_dtype(data.device.type)
+        data, state, weights = data.to(dtype), tuple(_state.to(dtype) for _state in state), [weight.to(dtype) for weight in weights]
+    
+    # Same call performed by nn.LSTM with a single layer, unidirectional, no dropout.
+    hiddens, _, _ = torch.lstm(data, packed_inputs.batch_sizes, state, weights, 
+                               True, 1, 0.0, lstm_unit.training, False)
+    
+    return PackedSequence(hiddens, packed_inputs.batch_sizes, packed_inputs.sorted_indices, packed_inputs.unsorted_indices)
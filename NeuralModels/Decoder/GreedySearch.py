@@ -0,0 +1,117 @@
+# MIT License
+
+# Copyright (c) 2022 christiandimaio
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Typing trick for avoid circular import dependencies valid for python > 3.9
+# from __future__ import annotations
+# from typing import TYPE_CHECKING
+# if TYPE_CHECKING:
+#     from .IDecoder import IDecoder
+
+import torch
+from typing import Tuple, Iterator
+
+class GreedySearch():
+    """
+        Greedy decoding, vectorized over the images of the batch: at each step the most likely word is picked.
+        
+        It works with every decoder that exposes (See IDecoder):
+        
+            1) init_state(images) -> state: a tuple of tensors, dim 0 is the batch.\n
+            2) advance(state, token_ids) -> state
+            3) predict(state) -> token_ids
+    """
+    
+    def __init__(self, start_index: int = 1, end_index: int = 2, padding_index: int = 0):
+        """Constructor of the greedy search
+
+        Args:
+            start_index (int, optional): Defaults to 1.
+                The index of <START>.
+                
+            end_index (int, optional): Defaults to 2.
+                The index of <END>.
+                
+            padding_index (int, optional): Defaults to 0.
+                The index of <PAD>.
+        """
+        self.start_index = start_index
+        self.end_index = end_index
+        self.padding_index = padding_index
+    
+    # For python > 3.9 -> def stream(self, decoder: IDecoder, images: torch.Tensor, max_caption_length: int) -> Iterator[Tuple[torch.Tensor, torch.Tensor, Tuple[torch.Tensor, ...]]]:
+    @torch.no_grad()
+    def stream(self, decoder, images: torch.Tensor, max_caption_length: int) -> Iterator[Tuple[torch.Tensor, torch.Tensor, Tuple[torch.Tensor, ...]]]:
+        """Generate the caption of each image in the batch, one token at a time.
+            The tokens are given back as soon as they are produced, the <START> is not given back.
+
+        Args:
+            decoder (IDecoder): 
+                The decoder.
+                
+            images (torch.Tensor): `(batch_dim, *)`
+                The features associated to each image, as expected by decoder.init_state.
+                
+            max_caption_length (int): 
+                The maximum ammisible length of the caption, <START> included.
+
+        Yields:
+            (Tuple[torch.Tensor, torch.Tensor, Tuple[torch.Tensor, ...]]): `[(batch_dim), (batch_dim), state]`
+                For each step: the new token of each caption (<PAD> after <END>), True if the caption has produced <END> and the state of the decoder.
+        """
+        state = decoder.init_state(images)
+        token_ids = torch.full((images.shape[0],), self.start_index, dtype=torch.long, device=images.device) # Out: (batch_dim)
+        finished = torch.zeros(images.shape[0], dtype=torch.bool, device=images.device) # True if the caption has already produced <END>
+        
+        for _ in range(max_caption_length-1):
+            state = decoder.advance(state, token_ids)
+            token_ids = decoder.predict(state).masked_fill(finished, self.padding_index) # The finished captions produce only <PAD>
+            finished = finished | (token_ids == self.end_index)
+            
+            yield token_ids, finished, state
+            
+            if bool(finished.all()):
+                break
+    
+    # For python > 3.9 -> def search(self, decoder: IDecoder, images: torch.Tensor, max_caption_length: int) -> torch.Tensor:
+    def search(self, decoder, images: torch.Tensor, max_caption_length: int) -> torch.Tensor:
+        """Generate the caption of each image in the batch.
+
+        Args:
+            decoder (IDecoder): 
+                The decoder.
+                
+            images (torch.Tensor): `(batch_dim, *)`
+                The features associated to each image, as expected by decoder.init_state.
+                
+            max_caption_length (int): 
+                The maximum ammisible length of the caption.
+
+        Returns:
+            (torch.Tensor): `(batch_dim, <variable>)`
+                The caption of each image. 
+                    REMARK It includes <START> at t_0.
+                    REMARK After <END> a caption is padded with <PAD>.
+        """
+        sampled_ids = [torch.full((images.shape[0],), self.start_index, dtype=torch.long, device=images.device)] # Hardcoded <START>
+        for token_ids, _, _ in self.stream(decoder, images, max_caption_length):
+            sampled_ids.append(token_ids)
+        return torch.stack(sampled_ids, 1) # Out: (batch_dim, <variable>)
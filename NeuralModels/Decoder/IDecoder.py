@@ -83,20 +83,90 @@ class IDecoder(nn.Module):
         pass
     
     def generate_caption(self, *args) -> torch.Tensor:
-        """ Interface for generate a caption
+        """ Interface for generate a caption for each image in the batch
 
         Args (Suggested):
         
-            images (torch.Tensor): `(1, encoder_dim)`
-                The features associated to the image. 
+            images (torch.Tensor): `(batch_dim, encoder_dim)`
+                The features associated to each image. 
                 
             max_caption_length (int): 
                 The maximum ammisible length of the caption.
 
         Returns:
         
-            (torch.Tensor): `(1, <variable>)`
-                The caption associated to the image given. 
+            (torch.Tensor): `(batch_dim, <variable>)`
+                The caption associated to each image given. 
                     REMARK It includes <START> at t_0 by default.
+                    REMARK After <END> a caption is padded with <PAD>.
+        """
+        pass
+    
+    def init_state(self, *args) -> Tuple[torch.Tensor, ...]:
+        """Interface for compute the state of the decoder before the <START> token.
+            The state is a tuple of plain tensors, dim 0 is the batch: the states of different requests can be merged, 
+            selected and reordered without knowing their content (See DecoderState).
+            REMARK The 1st tensor of the state is always the hidden state of the LSTM `(batch_dim, hidden_dim)`.
+
+        Args (Suggested):
+        
+            images (torch.Tensor): `(batch_dim, *)`
+                The features associated to each image. 
+
+        Returns:
+        
+            (Tuple[torch.Tensor, ...]): 
+                The state of each caption.
+        """
+        pass
+    
+    def advance(self, *args) -> Tuple[torch.Tensor, ...]:
+        """Interface for feed a token to the decoder, without projecting the hidden state on the vocabulary.
+
+        Args (Suggested):
+        
+            state (Tuple[torch.Tensor, ...]): 
+                The state, as returned by init_state or by the previous step.
+                
+            token_ids (torch.Tensor): `(batch_dim)`
+                The last token of each caption.
+
+        Returns:
+        
+            (Tuple[torch.Tensor, ...]): 
+                The new state.
+        """
+        pass
+    
+    def step(self, *args) -> Tuple[torch.Tensor, Tuple[torch.Tensor, ...]]:
+        """Interface for a single decoding step: advance + projection on the vocabulary.
+
+        Args (Suggested):
+        
+            state (Tuple[torch.Tensor, ...]): 
+                The state, as returned by init_state or by the previous step.
+                
+            token_ids (torch.Tensor): `(batch_dim)`
+                The last token of each caption.
+
+        Returns:
+        
+            (Tuple[torch.Tensor, Tuple[torch.Tensor, ...]]): `[(batch_dim, vocab_size), state]`
+                The logits of the next token and the new state.
+        """
+        pass
+    
+    def predict(self, *args) -> torch.Tensor:
+        """Interface for pick the most likely next token of a state, without evaluating the full distribution when possible.
+
+        Args (Suggested):
+        
+            state (Tuple[torch.Tensor, ...]): 
+                The state, as returned by advance.
+
+        Returns:
+        
+            (torch.Tensor): `(batch_dim)`
+                The ID of the most likely next token.
         """
         pass
\ No newline at end of file
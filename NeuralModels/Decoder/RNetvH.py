@@ -23,14 +23,19 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.nn.utils.rnn import pad_packed_sequence
 from typing import Tuple,List
+from .FusedLSTM import fused_lstm
+from .GreedySearch import GreedySearch
+from ..Output.IOutput import IOutput
+from ..Output.LinearOutput import LinearOutput
 
 class RNetvH(nn.Module):
     """
         Class implementing LSTM unit with Hidden state initialized with custom features vector and Cell state initialized with ZEROS.
     """
     
-    def __init__(self, hidden_dim: int, padding_index: int, vocab_size: int, embedding_dim: int, device: str = "cpu"):
+    def __init__(self, hidden_dim: int, padding_index: int, vocab_size: int, embedding_dim: int, device: str = "cpu", output: IOutput = None):
         """Define the constructor for the RNN Net
 
         Args:
@@ -49,6 +54,9 @@ class RNetvH(nn.Module):
                 
             device (str, optional): Default "cpu"
                 The device on which the operations will be performed. 
+                
+            output (IOutput, optional): Default None
+                The output layer, the projection of the hidden state on the vocabulary. If None a full softmax (LinearOutput) is used.
         """
         super(RNetvH, self).__init__()
 
@@ -71,9 +79,50 @@ class RNetvH(nn.Module):
         
         # The linear layer that maps the hidden state
         # to the number of words we want as output = vocab_size
-        self.linear_1 = nn.Linear(hidden_dim, vocab_size)
+        # REMARK The name linear_1 is kept for the compatibility with the checkpoints.
+        self.linear_1 = output if output is not None else LinearOutput(hidden_dim, vocab_size)
                 
 
+    def hidden_states(self, images: torch.Tensor, captions: torch.Tensor, captions_length: List[int]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Compute the hidden state of the LSTM for each time step, without projecting it on the vocabulary.
+            The hidden state at t is the one used for predict the word t+1 of the caption.
+
+        Args:
+            images (torch.Tensor): `(batch_dim, encoder_dim)`
+                The features associated to each image of the batch. 
+            
+            captions (torch.Tensor): `(batch_dim, max_captions_length)`
+                The caption associated to each image of the batch.
+                    REMARK Each caption is in the full form: <START> + .... + <END>
+                    
+            captions_length (List(int)): 
+                The length of each caption in the batch.
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): [`(batch_dim, max_captions_length, hidden_dim)`, `(batch_dim)`]
+                The hidden state of each time step from t_0 to t_{N-1} (padded with ZEROS) and the number of valid time steps of each caption (captions_length - 1).
+        """
+        # Check if encoder_dim and self.hidden_dim are equal, assert by construction
+        if images.shape[1] != self.hidden_dim:
+            raise ValueError("The dimensionality of the encoder output is not equal to the dimensionality of the hidden state.")
+        
+        # The <END> token is never an input of the LSTM
+        decode_lengths = torch.as_tensor(captions_length).cpu() - 1 # Out: (batch_dim)
+        
+        # Create embedded word vector for each word in the captions
+        inputs = self.words_embedding(captions) # In: (batch_dim, max_captions_length, embedding_dim) ->  Out: (batch_dim, captions length, embedding_dim)
+        
+        # Initialize the hidden state and the cell state at time t_{-1} 
+        _h, _c = ( images, torch.zeros((captions.shape[0],self.hidden_dim)).to(self.device)) # In: ((batch_dim, hidden_dim),(batch_dim, hidden_dim)) -> Out ((batch_dim, hidden_dim), (batch_dim, hidden_dim))
+        
+        # Feed the LSTM with all the timesteps at once, the <END> token is never an input.
+        # For each time step t \in {0, N-1}, where N is the caption length 
+        hiddens = fused_lstm(self.lstm_unit, inputs, decode_lengths, (_h, _c)) # Out: (sum(decode_lengths), hidden_dim)
+        hiddens, _ = pad_packed_sequence(hiddens, batch_first=True, total_length=inputs.shape[1]) # Out: (batch_dim, max_captions_length, hidden_dim)
+        
+        return hiddens, decode_lengths
+    
+    @torch.jit.unused # Training only, not part of the exported inference (See Export)
     def forward(self, images: torch.Tensor, captions: torch.Tensor, captions_length: List[int]) -> Tuple[torch.Tensor, List[int]]:
         """Compute the forward operation of the RNN.
                 input of the LSTM cell for each time step:
@@ -108,18 +157,12 @@ class RNetvH(nn.Module):
                     REMARK The <START> is provided as input at t_0.
                     REMARK The <END> token will be removed from the input of the LSTM.
         """             
-        # Check if encoder_dim and self.hidden_dim are equal, assert by construction
-        if images.shape[1] != self.hidden_dim:
-            raise ValueError("The dimensionality of the encoder output is not equal to the dimensionality of the hidden state.")
-        
         # Retrieve batch size 
-        batch_dim = images.shape[0] # images is of shape (batch_dim, embedding_dim)
+        batch_dim = images.shape[0]
         
-        # Create embedded word vector for each word in the captions
-        inputs = self.words_embedding(captions) # In: (batch_dim, max_captions_length, embedding_dim) ->  Out: (batch_dim, captions length, embedding_dim)
+        hiddens, _ = self.hidden_states(images, captions, captions_length) # Out: (batch_dim, max_captions_length, hidden_dim)
         
-        # Initialize the hidden state and the cell state at time t_{-1} 
-        _h, _c = ( images, torch.zeros((captions.shape[0],self.hidden_dim)).to(self.device)) # In: ((batch_dim, hidden_dim),(batch_dim, hidden_dim)) -> Out ((batch_dim, hidden_dim), (batch_dim, hidden_dim))
+        outputs = self.linear_1(hiddens) # In: (batch_dim, max_captions_length, hidden_dim), Out: (batch_dim, max_captions_length, vocab_size)
         
         # Deterministict <START> Output as first word of the caption t_{0}
         start = torch.zeros(self.vocab_size)
@@ -127,50 +170,86 @@ class RNetvH(nn.Module):
         start = start.to(self.device)  # Out: (1, vocab_size)
         
         # Bulk insert of <START> to all the elements of the batch 
-        outputs = start.repeat(batch_dim,1,1).to(self.device) # Out: (batch_dim, 1, vocab_size)
-          
-        # Feed LSTMCell with image features and retrieve the state
-        
-        # How it works the loop?
-        # For each time step t \in {0, N-1}, where N is the caption length  
-        
-        for idx in range(0,inputs.shape[1]): 
-            _h, _c = self.lstm_unit(inputs[:,idx,:], (_h,_c))  # inputs[:,idx,:]: for all the captions in the batch, pick the embedding vector of the idx-th word in all the captions
-            _outputs = self.linear_1(_h) # In: (batch_dim, hidden_dim), Out: (batch_dim, vocab_size)
-            outputs = torch.cat((outputs,_outputs.unsqueeze(1)),dim=1) # Append in dim `1` the output of the LSTMCell
+        outputs = torch.cat((start.repeat(batch_dim,1,1).to(outputs.dtype), outputs), dim=1) # Out: (batch_dim, 1 + max_captions_length, vocab_size)
         
         return outputs, list(map(lambda length: length-1, captions_length))  
     
-    def generate_caption(self, image: torch.Tensor, captions_length: int) -> torch.Tensor:
-        """Given the features vector of the image, perform a decoding (Generate a caption)
+    def init_state(self, images: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Compute the state of the decoder before the <START> token, for each image in the batch.
+            The features vector is the hidden state, the cell state is initialized at ZEROS.
+
+        Args:
+            images (torch.Tensor): `(batch_dim, encoder_dim)`
+                The features associated to each image. 
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): `[(batch_dim, hidden_dim), (batch_dim, hidden_dim)]`
+                Hidden and cell state.
+        """
+        return ( images, images.new_zeros((images.shape[0],self.hidden_dim))) # Out: ((batch_dim, hidden_dim), (batch_dim, hidden_dim))
+    
+    def advance(self, state: Tuple[torch.Tensor, torch.Tensor], token_ids: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Feed a token to the LSTM, without projecting the new hidden state on the vocabulary.
+
+        Args:
+            state (Tuple[torch.Tensor, torch.Tensor]): `[(batch_dim, hidden_dim), (batch_dim, hidden_dim)]`
+                Hidden and cell state, as returned by init_state or by the previous step.
+                
+            token_ids (torch.Tensor): `(batch_dim)`
+                The last token of each caption.
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): `[(batch_dim, hidden_dim), (batch_dim, hidden_dim)]`
+                The new hidden and cell state.
+        """
+        return self.lstm_unit(self.words_embedding(token_ids), state) # Out: ((batch_dim, hidden_dim), (batch_dim, hidden_dim))
+    
+    def step(self, state: Tuple[torch.Tensor, torch.Tensor], token_ids: torch.Tensor) -> Tuple[torch.Tensor, Tuple[torch.Tensor, torch.Tensor]]:
+        """Perform a single decoding step.
+
+        Args:
+            state (Tuple[torch.Tensor, torch.Tensor]): `[(batch_dim, hidden_dim), (batch_dim, hidden_dim)]`
+                Hidden and cell state, as returned by init_state or by the previous step.
+                
+            token_ids (torch.Tensor): `(batch_dim)`
+                The last token of each caption.
+
+        Returns:
+            (Tuple[torch.Tensor, Tuple[torch.Tensor, torch.Tensor]]): `[(batch_dim, vocab_size), [(batch_dim, hidden_dim), (batch_dim, hidden_dim)]]`
+                The logits of the next token and the new state.
+        """
+        state = self.advance(state, token_ids)
+        return self.linear_1(state[0]), state
+    
+    def predict(self, state: Tuple[torch.Tensor, torch.Tensor]) -> torch.Tensor:
+        """Pick the most likely next token, through the output layer (See IOutput.predict).
+
+        Args:
+            state (Tuple[torch.Tensor, torch.Tensor]): `[(batch_dim, hidden_dim), (batch_dim, hidden_dim)]`
+                Hidden and cell state, as returned by advance.
+
+        Returns:
+            (torch.Tensor): `(batch_dim)`
+                The ID of the most likely next token.
+        """
+        return self.linear_1.predict(state[0])
+    
+    def generate_caption(self, images: torch.Tensor, captions_length: int) -> torch.Tensor:
+        """Given the features vector of the images, perform a greedy decoding (Generate a caption) for all the batch at once (See GreedySearch).
 
         Args:
         
-            image (torch.Tensor): `(1, encoder_dim)`
-                The features associated to the image. 
+            images (torch.Tensor): `(batch_dim, encoder_dim)`
+                The features associated to each image. 
                 
             max_caption_length (int): 
                 The maximum ammisible length of the caption.
 
         Returns:
         
-            (torch.Tensor): `(1, <variable>)`
-                The caption associated to the image given. 
+            (torch.Tensor): `(batch_dim, <variable>)`
+                The caption associated to each image given. 
                     REMARK It includes <START> at t_0 by default.
+                    REMARK After <END> a caption is padded with <PAD>.
         """
-        
-        sampled_ids = [torch.tensor([1]).to(self.device)] # Hardcoded <START>
-        input = self.words_embedding(torch.LongTensor([1]).to(torch.device(self.device))).reshape((1,-1)) # Out: (1, embedding_dim)
-        with torch.no_grad(): 
-            _h ,_c = ( image, torch.zeros((1,self.hidden_dim)).to(self.device))
-            for _ in range(captions_length-1):
-                _h, _c = self.lstm_unit(input, (_h ,_c))           # Out : ((1, 1, hidden_dim) , (1, 1, hidden_dim))
-                outputs = self.linear_1(_h)            # Out:  (1, vocab_size)
-                _ , predicted = F.softmax(outputs,dim=1).cuda().max(1)  if self.device.type == "cuda" else   F.softmax(outputs,dim=1).max(1)  # predicted: The predicted id
-                sampled_ids.append(predicted)
-                input = self.words_embedding(predicted)                       # Out: (1, embeddings_dim)
-                input = input.to(torch.device(self.device))                 # In: (1, embedding_dim)
-                if predicted == 2:
-                    break
-            sampled_ids = torch.stack(sampled_ids, 1)                # sampled_ids: (1, captions_length)
-        return sampled_ids
\ No newline at end of file
+        return GreedySearch().search(self, images, captions_length)
@@ -25,13 +25,16 @@ import torch.nn as nn
 import torch.nn.functional as F
 from typing import Tuple,List
 from ..Attention.IAttention import IAttention
+from ..Output.IOutput import IOutput
+from ..Output.LinearOutput import LinearOutput
+from .GreedySearch import GreedySearch
 
 
 class RNetvHCAttention(nn.Module):
     """
         Class implementing LSTM unit with Attention model
     """
-    def __init__(self, hidden_dim: int, padding_index: int, vocab_size: int, embedding_dim: int, device: str = "cpu", attention: IAttention = None):
+    def __init__(self, hidden_dim: int, padding_index: int, vocab_size: int, embedding_dim: int, device: str = "cpu", attention: IAttention = None, output: IOutput = None):
         """Define the constructor for the RNN Net
 
         Args:
@@ -45,6 +48,10 @@ class RNetvHCAttention(nn.Module):
                 The number of dimension associated to the input of the LSTM cell.
             device (str, optional): Default "cpu"
                 The device on which the operations will be performed. 
+            attention (IAttention): 
+                The attention unit.
+            output (IOutput, optional): Default None
+                The output layer, the projection of the hidden state on the vocabulary. If None a full softmax (LinearOutput) is used.
         """
         super(RNetvHCAttention, self).__init__()
 
@@ -81,7 +88,8 @@ class RNetvHCAttention(nn.Module):
         
         # The linear layer that maps the hidden state output dimension
         # to the number of words we want as output, vocab_size
-        self.linear_1 = nn.Linear(hidden_dim, vocab_size)
+        # REMARK The name linear_1 is kept for the compatibility with the checkpoints.
+        self.linear_1 = output if output is not None else LinearOutput(hidden_dim, vocab_size)
         
         # the soft attention model predicts a gating scalar β from previous hidden state ht_1 at each time step t
         # Par. 4.2.1
@@ -103,6 +111,77 @@ class RNetvHCAttention(nn.Module):
         return self.h_0(images), self.c_0(images)
     
     
+    def hidden_states(self, images: torch.Tensor, captions: torch.Tensor, captions_length: List[int]) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """Compute the hidden state of the LSTM for each time step, without projecting it on the vocabulary.
+            The hidden state at t is the one used for predict the word t+1 of the caption.
+
+        Args:
+            images (torch.Tensor): `(batch_dim, H_portions, W_portions, encoder_dim)`
+                The features associated to each image of the batch. 
+            
+            captions (torch.Tensor): `(batch_dim, max_captions_length)`
+                The caption associated to each image of the batch.
+                    REMARK Each caption is in the full form: <START> + .... + <END>
+                    
+            captions_length (List(int)): 
+                The length of each caption in the batch.
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor, torch.Tensor]): [`(batch_dim, max_captions_length, hidden_dim)`, `(batch_dim)`, `(batch_dim, max_captions_length, alphas)`]
+                The hidden state of each time step from t_0 to t_{N-1}, the number of valid time steps of each caption (captions_length - 1) and the alphas evaluated at each time step.
+                    REMARK After the end of a caption both hidden states and alphas are ZEROS.
+        """
+        # Retrieve batch size 
+        batch_dim = images.shape[0] # images is of shape (batch_dim, H_portions, W_portions, encoder_dim)
+        
+        # The <END> token is never an input of the LSTM
+        decode_lengths = torch.as_tensor(captions_length).cpu() - 1 # Out: (batch_dim)
+        
+        # Sort the captions by length (descending order): at each timestep only the first captions are still running.
+        sorted_lengths, order = decode_lengths.sort(descending=True)
+        order = order.to(images.device)
+        
+        # Create embedded word vector for each word in the captions
+        inputs = self.words_embedding(captions.index_select(0, order)) # In:       Out: (batch_dim, captions length, embedding_dim)
+        
+        # Initialize the hidden state and the cell state at time t_{-1}
+        images = images.reshape(batch_dim,-1, images.shape[3]).index_select(0, order) # Out: (batch_dim, H_portions * W_portions, encoder_dim)
+        _h, _c = self.init_h_0_c_0(images) # _h : (batch_dim, hidden_dim), _c : (batch_dim, hidden_dim)
+        
+        # The projection of the images in the attention space doesn't change over t
+        images_attention = self.attention.prepare(images) # Out: (batch_dim, H_portions * W_portions, attention_dim)
+        
+        # Tensor for storing the hidden state at each timestep t, structure (batch_dim, MaxN, hidden_dim)
+        hiddens = torch.zeros((batch_dim,inputs.shape[1],self.hidden_dim), dtype=_h.dtype, device=_h.device)
+        
+        # Tensor for storing alphas at each timestep t, structure (batch_dim, MaxN, number_of_splits^2) -> number_of_splits intended for a single Measure like Heigth and assuming square images
+        alphas_t = torch.zeros((batch_dim,inputs.shape[1],self.attention.number_of_splits**2), dtype=_h.dtype, device=_h.device)
+        
+        # Number of captions still running at each timestep
+        batch_sizes = (sorted_lengths.unsqueeze(0) > torch.arange(int(sorted_lengths.max()) if batch_dim > 0 else 0).unsqueeze(1)).sum(dim=1).tolist()
+        
+        # Feed LSTMCell with image features and retrieve the state
+        
+        # How it works the loop?
+        # For each time step t \in {0, N-1}, where N is the caption length, only the first batch_t captions (the ones longer than t) are evaluated.
+        for idx, batch_t in enumerate(batch_sizes): 
+            _h, _c = _h[:batch_t], _c[:batch_t]
+            attention_encoding, alphas_t_i = self.attention(images[:batch_t], _h, images_attention[:batch_t]) # Out: attention_encoding->(batch_t,encoder_dim), alphas_t_i->(batch_t, number_of_splits)
+            gate = self.sigmoid(self.f_beta(_h))  # IN: (batch_t, hidden_dim) -> Out: (batch_t, encoder_dim)
+            attention_encoding = gate * attention_encoding # Gating z_t
+            alphas_t[:batch_t,idx,:] = alphas_t_i
+            _h, _c = self.lstm_unit(torch.cat([inputs[:batch_t,idx,:], attention_encoding], dim=1), (_h,_c))  # inputs[:batch_t,idx,:]: for the running captions in the batch, pick the embedding vector of the idx-th word
+            hiddens[:batch_t,idx,:] = _h
+        
+        # Back to the order of the input
+        unsort = torch.empty_like(order)
+        unsort[order] = torch.arange(batch_dim, device=order.device)
+        hiddens = hiddens.index_select(0, unsort)
+        alphas_t = alphas_t.index_select(0, unsort)
+        
+        return hiddens, decode_lengths, alphas_t
+    
+    @torch.jit.unused # Training only, not part of the exported inference (See Export)
     def forward(self, images: torch.Tensor, captions: torch.Tensor, captions_length: List[int]) -> Tuple[torch.Tensor, List[int], torch.Tensor]:
         """Compute the forward operation of the RNN.
                 input of the LSTM cell for each time step:
@@ -142,81 +221,116 @@ class RNetvHCAttention(nn.Module):
         # Retrieve batch size 
         batch_dim = images.shape[0] # images is of shape (batch_dim, H_portions, W_portions, encoder_dim)
         
-        # Create embedded word vector for each word in the captions
-        inputs = self.words_embedding(captions) # In:       Out: (batch_dim, captions length, embedding_dim)
-        
+        hiddens, _, alphas_t = self.hidden_states(images, captions, captions_length) # Out: (batch_dim, max_captions_length, hidden_dim), (batch_dim, max_captions_length, alphas)
         
-        # Initialize the hidden state and the cell state at time t_{-1}
-        images = images.reshape(batch_dim,-1, images.shape[3]) # Out: (batch_dim, H_portions * W_portions, encoder_dim)
-        _h, _c = self.init_h_0_c_0(images) # _h : (batch_dim, hidden_dim), _c : (batch_dim, hidden_dim)
+        outputs = self.linear_1(hiddens) # In: (batch_dim, max_captions_length, hidden_dim), Out: (batch_dim, max_captions_length, vocab_size)
         
         # Deterministict <START> Output as first word of the caption t_{0}
-        start = torch.zeros(self.vocab_size).unsqueeze(0)
-        start[0][1] = 1
+        start = torch.zeros(self.vocab_size)
+        start[1] = 1
         start = start.to(self.device)  # Out: (1, vocab_size)
         
         # Bulk insert of <START> to all the elements of the batch 
-        outputs = start.repeat(batch_dim,1,1).to(self.device) # Out: (batch_dim, 1, vocab_size)
-        
-        # Tensor for storing alphas at each timestep t, structure (batch_dim, MaxN, number_of_splits^2) -> number_of_splits intended for a single Measure like Heigth and assuming square images
-        alphas_t = torch.zeros((batch_dim,inputs.shape[1],self.attention.number_of_splits**2)).to(self.device)
-        
-        # Feed LSTMCell with image features and retrieve the state
-        
-        # How it works the loop?
-        # For each time step t \in {0, N-1}, where N is the caption length 
-        
-        
-        for idx in range(0,inputs.shape[1]): 
-            attention_encoding, alphas_t_i = self.attention(images, _h) # Out: attention_encoding->(batch_dim,encoder_dim), alphas_t_i->(batch_dim, number_of_splits)
-            gate = self.sigmoid(self.f_beta(_h))  # IN: (batch_dim, hidden_dim) -> Out: (batch_dim, encoder_dim)
-            attention_encoding = gate * attention_encoding # Gating z_t
-            alphas_t[:,idx,:] = alphas_t_i
-            _h, _c = self.lstm_unit(torch.cat([inputs[:,idx,:], attention_encoding], dim=1), (_h,_c))  # inputs[:,idx,:]: for all the captions in the batch, pick the embedding vector of the idx-th word in all the captions
-            _outputs = self.linear_1(_h) # In: (batch_dim, hidden_dim), Out: (batch_dim, vocab_size)
-            outputs = torch.cat((outputs,_outputs.unsqueeze(1)),dim=1) # Append in dim `1` the output of the LSTMCell for all the elements in batch
+        outputs = torch.cat((start.repeat(batch_dim,1,1).to(outputs.dtype), outputs), dim=1) # Out: (batch_dim, 1 + max_captions_length, vocab_size)
         
         return outputs, list(map(lambda length: length-1, captions_length)),alphas_t
     
-    def generate_caption(self, image: torch.Tensor, captions_length: int) -> torch.Tensor:
-        """Given the features vector retrieved by the encoder, perform a decoding (Generate a caption)
+    def init_state(self, images: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+        """Compute the state of the decoder before the <START> token, for each image in the batch.
+
+        Args:
+            images (torch.Tensor): `(batch_dim, H_portions, W_portions, encoder_dim)`
+                The images.
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]): `[(batch_dim, hidden_dim), (batch_dim, hidden_dim), (batch_dim, H_portions * W_portions, encoder_dim), (batch_dim, H_portions * W_portions, attention_dim), (batch_dim, H_portions * W_portions)]`
+                Hidden state, cell state, the images, their projection in the attention space and the alphas of the last step (ZEROS).
+        """
+        images = images.reshape(images.shape[0],-1, images.shape[3]) # Out: (batch_dim, H_portions * W_portions, encoder_dim)
+        _h, _c = self.init_h_0_c_0(images)
+        return _h, _c, images, self.attention.prepare(images), torch.zeros(images.shape[0], images.shape[1], device=images.device)
+    
+    def advance(self, state: Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor], token_ids: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+        """Attend the image and feed a token to the LSTM, without projecting the new hidden state on the vocabulary.
+
+        Args:
+            state (Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]): 
+                The state, as returned by init_state or by the previous step.
+                
+            token_ids (torch.Tensor): `(batch_dim)`
+                The last token of each caption.
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]): 
+                The new state, the alphas are the ones evaluated in this step.
+        """
+        _h, _c, images, images_attention, _ = state
+        attention_encoding, alphas_t = self.attention(images, _h, images_attention) # Out: attention_encoding->(batch_dim,encoder_dim), alphas_t->(batch_dim, number_of_splits)
+        gate = self.sigmoid(self.f_beta(_h))  # IN: (batch_dim, hidden_dim) -> Out: (batch_dim, encoder_dim)
+        attention_encoding = gate * attention_encoding # Gating z_t
+        _h, _c = self.lstm_unit(torch.cat([self.words_embedding(token_ids), attention_encoding], dim=1), (_h ,_c)) # _h: (batch_dim, hidden_dim)
+        return _h, _c, images, images_attention, alphas_t
+    
+    def step(self, state: Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor], token_ids: torch.Tensor) -> Tuple[torch.Tensor, Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]]:
+        """Perform a single decoding step.
+
+        Args:
+            state (Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]): 
+                The state, as returned by init_state or by the previous step.
+                
+            token_ids (torch.Tensor): `(batch_dim)`
+                The last token of each caption.
+
+        Returns:
+            (Tuple[torch.Tensor, Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]]): 
+                The logits of the next token `(batch_dim, vocab_size)` and the new state, the alphas are the ones evaluated in this step.
+        """
+        state = self.advance(state, token_ids)
+        return self.linear_1(state[0]), state
+    
+    def predict(self, state: Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]) -> torch.Tensor:
+        """Pick the most likely next token, through the output layer (See IOutput.predict).
+
+        Args:
+            state (Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]): 
+                The state, as returned by advance.
+
+        Returns:
+            (torch.Tensor): `(batch_dim)`
+                The ID of the most likely next token.
+        """
+        return self.linear_1.predict(state[0])
+    
+    def generate_caption(self, images: torch.Tensor, captions_length: int) -> torch.Tensor:
+        """Given the features vector retrieved by the encoder, perform a greedy decoding (Generate a caption) for all the batch at once (See GreedySearch).
 
         Args:
         
-            image (torch.Tensor):  `(1, H_portions, W_portions, encoder_dim)`
-                The image.
+            images (torch.Tensor):  `(batch_dim, H_portions, W_portions, encoder_dim)`
+                The images.
                 
             captions_length (int): 
                 The length of the caption.
 
         Returns:
         
-            (torch.Tensor): 
-                The caption associated to the image given. 
+            (torch.Tensor): `(batch_dim, <variable>)`
+                The caption associated to each image given. 
                     It includes <START> at t_0 by default.
+                    After <END> a caption is padded with <PAD>.
                     
-            (torch.Tensor):
+            (torch.Tensor): `(batch_dim, captions_length, H_portions * W_portions)`
                 The alphas evaluated at each time t
                 
         """
+        batch_dim = images.shape[0]
         
-        sampled_ids = [torch.Tensor([1]).type(torch.int64).to(self.device)] # Hardcoded <START>
-        input = self.words_embedding(torch.LongTensor([1]).to(torch.device(self.device))).reshape((1,-1))
-        alphas = torch.zeros(captions_length, self.attention.number_of_splits **2) # Out: (MaxCaptionLength, number_of_splits)
-        with torch.no_grad(): 
-            image = image.reshape(1,-1, image.shape[3]) # Out: (1, H_portions * W_portions, encoder_dim)
-            _h, _c = self.init_h_0_c_0(image)
-            for idx in range(captions_length-1):
-                attention_encoding, alphas[idx,:] = self.attention(image, _h)
-                gate = self.sigmoid(self.f_beta(_h))  # IN: (1, hidden_dim) -> Out: (1, encoder_dim)
-                attention_encoding = gate * attention_encoding # Gating z_t
-                _h, _c = self.lstm_unit(torch.cat([input,attention_encoding], dim=1), (_h ,_c))           # _h: (1, hidden_dim)
-                outputs = self.linear_1(_h)            # outputs:  (1, vocab_size)
-                _ , predicted = F.softmax(outputs,dim=1).cuda().max(1)  if self.device.type == "cuda" else   F.softmax(outputs,dim=1).max(1)  # predicted: The predicted id
-                sampled_ids.append(predicted)
-                input = self.words_embedding(predicted)                       # In: (1, embedding_dim)
-                input = input.to(torch.device(self.device))                       # In: (1, embedding_dim)
-                if predicted == 2:
-                    break
-            sampled_ids = torch.stack(sampled_ids, 1)                # sampled_ids: (1, captions_length)
-        return sampled_ids, alphas
\ No newline at end of file
+        sampled_ids = [torch.ones(batch_dim, dtype=torch.long, device=self.device)] # Hardcoded <START>
+        finished = torch.zeros(batch_dim, dtype=torch.bool, device=self.device) # True if the caption had already produced <END> before the step
+        alphas = torch.zeros(batch_dim, captions_length, self.attention.number_of_splits **2, device=self.device) # Out: (batch_dim, MaxCaptionLength, number_of_splits)
+        for idx, (predicted, _finished, state) in enumerate(GreedySearch().stream(self, images, captions_length)):
+            alphas[:,idx,:] = state[4].masked_fill(finished.unsqueeze(1), 0.) # The finished captions don't look at the image anymore
+            sampled_ids.append(predicted)
+            finished = _finished
+        sampled_ids = torch.stack(sampled_ids, 1)                # sampled_ids: (batch_dim, <variable>)
+        return sampled_ids, alphas
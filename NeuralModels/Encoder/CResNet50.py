@@ -23,6 +23,7 @@
 import torch.nn as nn
 import torch
 import torchvision.models as models
+from .FoldBatchNorm import fold_batch_norm
 
 class CResNet50(nn.Module):
     """
@@ -54,8 +55,44 @@ class CResNet50(nn.Module):
         modules = list(resnet.children())[:-1]   # remove last fc layer, expose the GlobalAveragePooling
         self.resnet = nn.Sequential(*modules)
         
+        # The trunk is frozen: the BatchNorm layers are folded in the convolutions (See FoldBatchNorm) and the weights are stored channels last (NHWC),
+        #   the layout preferred by the convolutions on cpu (oneDNN) and by the tensor cores.
+        fold_batch_norm(self.resnet)
+        self.resnet.to(memory_format=torch.channels_last)
+        
         self.linear = nn.Linear(resnet.fc.in_features, encoder_dim) # define a last fc layer 
         
+        # Shape of a single sample produced by the frozen trunk, used for recognize already extracted features.
+        self.trunk_output_shape = (resnet.fc.in_features,)
+        
+    def trunk(self, images: torch.Tensor) -> torch.Tensor:
+        """Forward operation of the frozen part of the nn (the resnet50 without the last layer)
+
+        Args:
+            images (torch.tensor):  `(batch_dim, channels, heigth, width)`
+                The tensor of the images.
+
+        Returns:
+            [torch.tensor]: `(batch_dim, 2048)`
+                The pooled features of the resnet50 for each image in the batch.
+        """
+        features = self.resnet(images.contiguous(memory_format=torch.channels_last)) # Out: (batch_dim, 2048, 1, 1), 2048 is a Design choice of ResNet50 of last conv.layer.
+        
+        return features.reshape(features.size(0), -1) # Out: (batch_dim, 2048)
+    
+    def head(self, features: torch.Tensor) -> torch.Tensor:
+        """Forward operation of the trainable part of the nn
+
+        Args:
+            features (torch.tensor):  `(batch_dim, 2048)`
+                The features produced by the trunk.
+
+        Returns:
+            [torch.tensor]: `(batch_dim, encoder_dim)`
+                Features Projection for each image in the batch.
+        """
+        return self.linear(features.to(self.device)) # In: (batch_dim, 2048)
+        
     def forward(self, images: torch.Tensor) -> torch.Tensor:
         """Forward operation of the nn
 
@@ -69,9 +106,4 @@ class CResNet50(nn.Module):
                 
         """
         
-        features = self.resnet(images) # Out: (batch_dim, 2048, 1, 1), 2048 is a Design choice of ResNet50 of last conv.layer.
-        
-        features = features.reshape(features.size(0), -1).to(self.device)
-        features = self.linear(features) # In: (batch_dim, 2048)
-        
-        return features
\ No newline at end of file
+        return self.head(self.trunk(images))
\ No newline at end of file
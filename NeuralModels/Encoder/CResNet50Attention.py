@@ -23,6 +23,7 @@
 import torch.nn as nn
 import torch
 import torchvision.models as models
+from .FoldBatchNorm import fold_batch_norm
 
 class CResNet50Attention(nn.Module):
     def __init__(self, encoder_dim: int, number_of_splits: int = 7, device: str = "cpu"):
@@ -61,6 +62,40 @@ class CResNet50Attention(nn.Module):
         
         self.resnet = nn.Sequential(*modules)
         
+        # Same build step of CResNet50: BatchNorm folded in the convolutions, weights channels last.
+        fold_batch_norm(self.resnet)
+        self.resnet.to(memory_format=torch.channels_last)
+        
+        # Shape of a single sample produced by the frozen trunk, used for recognize already extracted features.
+        self.trunk_output_shape = (number_of_splits, number_of_splits, self.encoder_dim)
+        
+    def trunk(self, images: torch.Tensor) -> torch.Tensor:
+        """Forward operation of the frozen part of the nn
+
+        Args:
+            images (torch.tensor):  `(batch_dim, Channels, Width, Height)`
+                The tensor of the images.
+
+        Returns:
+            [torch.tensor]: `(batch_dim, H_splits, W_splits, encoder_dim)`
+                Features Projection Tensor 
+        """
+        features = self.resnet(images.contiguous(memory_format=torch.channels_last)) # Out: (batch_dim, 2048,Heigth/32, Width/32) 
+        features = features.permute(0, 2, 3, 1)  # (batch_dim, H_splits, W_splits, 2048)
+        return features
+    
+    def head(self, features: torch.Tensor) -> torch.Tensor:
+        """Forward operation of the trainable part of the nn, there is nothing to train in this encoder.
+
+        Args:
+            features (torch.tensor):  `(batch_dim, H_splits, W_splits, encoder_dim)`
+                The features produced by the trunk.
+
+        Returns:
+            [torch.tensor]: `(batch_dim, H_splits, W_splits, encoder_dim)`
+                Features Projection Tensor 
+        """
+        return features.to(self.device)
         
     def forward(self, images: torch.Tensor) -> torch.Tensor:
         """Forward operation of the nn
@@ -74,6 +109,4 @@ class CResNet50Attention(nn.Module):
                 Features Projection Tensor 
         """
         
-        features = self.resnet(images) # Out: (batch_dim, 2048,Heigth/32, Width/32) 
-        features = features.permute(0, 2, 3, 1)  # (batch_dim, H_splits, W_splits, 2048)
-        return features
\ No newline at end of file
+        return self.head(self.trunk(images))
\ No newline at end of file
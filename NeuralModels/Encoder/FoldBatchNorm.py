@@ -0,0 +1,89 @@
+# MIT License
+
+# Copyright (c) 2022 christiandimaio
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import torch
+import torch.nn as nn
+from functools import partial
+from torch.nn.utils.fusion import fuse_conv_bn_eval, fuse_conv_bn_weights
+from typing import List, Tuple
+
+# The BatchNorm of a frozen trunk is an affine function of the output of the previous convolution, with constant parameters (the running statistics):
+#   it can be merged in the weights and in the bias of the convolution, one layer less for each convolution and the same output.
+
+def fold_batch_norm(trunk: nn.Module) -> List[Tuple[str, str, float]]:
+    """Fold in place each BatchNorm2d in the Conv2d that precedes it, the BatchNorm2d becomes an Identity.
+        ASSUMPTION: a BatchNorm2d registered right after a Conv2d of the same parent is applied to its output (true for the ResNet).
+        The checkpoints saved before the folding are folded when loaded (See fold_batch_norm_state_dict), the folded ones are loaded as they are.
+
+    Args:
+        trunk (nn.Module): 
+            The frozen module, Ex. the nn.Sequential of the ResNet50.
+
+    Returns:
+        (List[Tuple[str, str, float]]): 
+            The name of each folded convolution, of its BatchNorm and the epsilon of the BatchNorm.
+    """
+    folded = []
+    previous_name, previous = None, None
+    for name, module in list(trunk.named_modules()):
+        if isinstance(module, nn.BatchNorm2d) and isinstance(previous, nn.Conv2d) and name.rpartition(".")[0] == previous_name.rpartition(".")[0]:
+            folded.append((previous_name, name, module.eps))
+        previous_name, previous = name, module
+    
+    for conv_name, bn_name, _ in folded:
+        conv, bn = trunk.get_submodule(conv_name), trunk.get_submodule(bn_name)
+        # The running statistics are used, as in evaluation mode: the trunk is frozen also during the training.
+        _replace(trunk, conv_name, fuse_conv_bn_eval(conv.eval(), bn.eval()))
+        _replace(trunk, bn_name, nn.Identity())
+    
+    trunk._register_load_state_dict_pre_hook(partial(fold_batch_norm_state_dict, folded=folded))
+    return folded
+
+def fold_batch_norm_state_dict(state_dict: dict, prefix: str, local_metadata: dict, strict: bool, missing_keys: List[str], unexpected_keys: List[str], error_msgs: List[str], folded: List[Tuple[str, str, float]]):
+    """Fold in place the BatchNorm of a checkpoint of the trunk saved before the folding, called by load_state_dict (See fold_batch_norm).
+        A checkpoint already folded is not modified: the folding is done at most once.
+
+    Args:
+        state_dict (dict): 
+            The checkpoint being loaded.
+            
+        prefix (str): 
+            The prefix of the keys of the trunk in the checkpoint.
+            
+        local_metadata, strict, missing_keys, unexpected_keys, error_msgs: 
+            Not used, required by the interface of the pre hooks of load_state_dict.
+            
+        folded (List[Tuple[str, str, float]]): 
+            The folded layers, as returned by fold_batch_norm.
+    """
+    for conv_name, bn_name, eps in folded:
+        conv, bn = f"{prefix}{conv_name}.", f"{prefix}{bn_name}."
+        if f"{bn}running_mean" not in state_dict:
+            continue # Already folded
+        weight, bias = fuse_conv_bn_weights(state_dict[f"{conv}weight"], state_dict.get(f"{conv}bias"), state_dict[f"{bn}running_mean"], state_dict[f"{bn}running_var"], eps, state_dict[f"{bn}weight"], state_dict[f"{bn}bias"])
+        state_dict[f"{conv}weight"], state_dict[f"{conv}bias"] = weight.detach(), bias.detach()
+        for key in ["weight", "bias", "running_mean", "running_var", "num_batches_tracked"]:
+            state_dict.pop(f"{bn}{key}", None)
+
+def _replace(module: nn.Module, name: str, new_module: nn.Module):
+    """Replace the submodule with the given name (Ex. "4.0.downsample.1")."""
+    parent_name, _, child_name = name.rpartition(".")
+    setattr(module.get_submodule(parent_name), child_name, new_module)
@@ -45,6 +45,36 @@ class IEncoder(nn.Module):
         """
         super(IEncoder, self).__init__()
         
+        # Attribute (Mandatory):
+        #   trunk_output_shape (tuple): The shape of a single sample produced by the trunk. 
+    
+    def trunk(self, *args) -> torch.Tensor:
+        """Interface of the forward operation of the frozen part of the nn.
+            Since it is frozen, its output can be computed once and stored (See Storage.FeaturesStore).
+
+        Args:
+            images (torch.tensor):  `(batch_dim, channels, heigth, width)`
+                The tensor of the images.
+
+        Returns:
+            [torch.tensor]: `(batch_dim, *trunk_output_shape)`
+                The features produced by the frozen part.
+        """
+        pass
+    
+    def head(self, *args) -> torch.Tensor:
+        """Interface of the forward operation of the trainable part of the nn.
+
+        Args:
+            features (torch.tensor):  `(batch_dim, *trunk_output_shape)`
+                The features produced by the trunk.
+
+        Returns:
+            [torch.tensor]: `(batch_dim, encoder_dim)`
+                Features Projection for each image in the batch.
+        """
+        pass
+        
     def forward(self, *args) -> torch.Tensor:
         """Interface of forward operation of the nn
 
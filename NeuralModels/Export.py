@@ -0,0 +1,373 @@
+# MIT License
+
+# Copyright (c) 2022 christiandimaio
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Typing trick for avoid circular import dependencies valid for python > 3.9
+# from __future__ import annotations
+# from typing import TYPE_CHECKING
+# if TYPE_CHECKING:
+#     from .CaRNet import CaRNet
+#     from .Vocabulary import Vocabulary
+
+import os
+import json
+import copy
+import torch
+import torch.nn as nn
+from PIL import Image
+from torchvision import transforms
+from typing import List, Tuple
+
+# REMARK No import from the project: ScriptedCaptioner must work with this file alone (See OnnxCaptioner for the ONNX runtime, without torch).
+
+# Version of the exported artefact, increase it when the content of the extra files changes.
+EXPORT_VERSION = 1
+
+class CaptionGenerator(nn.Module):
+    """
+        Encoder + greedy decoding in a single module, written in the subset of python understood by TorchScript.
+        The loop is the same of GreedySearch.search, but without the generator: the whole caption is produced by a single call.
+    """
+    
+    # For python > 3.9 -> def __init__(self, encoder: IEncoder, decoder: IDecoder, max_caption_length: int, start_index: int = 1, end_index: int = 2, padding_index: int = 0):
+    def __init__(self, encoder: nn.Module, decoder: nn.Module, max_caption_length: int, start_index: int = 1, end_index: int = 2, padding_index: int = 0):
+        """Constructor of the CaptionGenerator
+
+        Args:
+            encoder (IEncoder): 
+                The encoder.
+                
+            decoder (IDecoder): 
+                The decoder, it must expose the step interface (See IDecoder).
+                
+            max_caption_length (int): 
+                The maximum ammisible length of the caption, <START> included.
+                
+            start_index (int, optional): Defaults to 1.
+                The index of <START>.
+                
+            end_index (int, optional): Defaults to 2.
+                The index of <END>.
+                
+            padding_index (int, optional): Defaults to 0.
+                The index of <PAD>.
+        """
+        super(CaptionGenerator, self).__init__()
+        self.encoder = encoder
+        self.decoder = decoder
+        self.max_caption_length = max_caption_length
+        self.start_index = start_index
+        self.end_index = end_index
+        self.padding_index = padding_index
+    
+    def forward(self, images: torch.Tensor) -> torch.Tensor:
+        """Generate the caption of each image in the batch.
+
+        Args:
+            images (torch.Tensor): `(batch_dim, channels, height, width)`
+                The images, already resized and normalized.
+
+        Returns:
+            (torch.Tensor): `(batch_dim, <variable>)`
+                The caption of each image. 
+                    REMARK It includes <START> at t_0.
+                    REMARK After <END> a caption is padded with <PAD>.
+        """
+        state = self.decoder.init_state(self.encoder(images))
+        token_ids = torch.full([images.shape[0]], self.start_index, dtype=torch.long, device=images.device) # Out: (batch_dim)
+        finished = torch.zeros([images.shape[0]], dtype=torch.bool, device=images.device) # True if the caption has already produced <END>
+        
+        sampled_ids = [token_ids]
+        for _ in range(self.max_caption_length-1):
+            state = self.decoder.advance(state, token_ids)
+            token_ids = self.decoder.predict(state).masked_fill(finished, self.padding_index) # The finished captions produce only <PAD>
+            finished = finished | (token_ids == self.end_index)
+            sampled_ids.append(token_ids)
+            if bool(finished.all()):
+                break
+        return torch.stack(sampled_ids, 1) # Out: (batch_dim, <variable>)
+
+# For python > 3.9 -> def export_torchscript(net: CaRNet, vocabulary: Vocabulary, file_path: str, image_trasformation_parameter: dict, max_caption_length: int) -> str:
+def export_torchscript(net, vocabulary, file_path: str, image_trasformation_parameter: dict, max_caption_length: int) -> str:
+    """Export the encoder and the greedy decoding of a net in a single TorchScript file, it can be loaded without the source code of the net (See ScriptedCaptioner).
+        The words of the vocabulary and the preprocessing of the images are stored in the same file.
+
+    Args:
+        net (CaRNet): 
+            The net to export, the weights are frozen into the artefact.
+            
+        vocabulary (Vocabulary): 
+            The vocabulary associated to the net.
+            
+        file_path (str): 
+            The path of the artefact.
+            
+        image_trasformation_parameter (dict): 
+            The pre-processing of the images (See MyDataset.image_trasformation_parameter).
+            
+        max_caption_length (int): 
+            The maximum ammisible length of the caption, <START> included.
+
+    Returns:
+        (str): 
+            The path of the artefact.
+    """
+    flavored_tokens = vocabulary.predefined_token_idx()
+    
+    # The net keeps working after the export: a copy is frozen.
+    generator = CaptionGenerator(copy.deepcopy(net.C), copy.deepcopy(net.R), max_caption_length,
+                                 start_index=flavored_tokens["<START>"], end_index=flavored_tokens["<END>"], padding_index=flavored_tokens["<PAD>"]).eval()
+    
+    # Q. Why freeze?
+    # A. The weights become constants of the graph: the BatchNorm of the ResNet50 are folded in the convolutions and there is no attribute lookup at run time.
+    scripted = torch.jit.freeze(torch.jit.script(generator))
+    
+    extra_files = {
+        "words.json": json.dumps(vocabulary.id2word.tolist()),
+        "meta.json": json.dumps({
+            "version": EXPORT_VERSION,
+            "net_name": net.name_net,
+            "end_index": flavored_tokens["<END>"],
+            "padding_index": flavored_tokens["<PAD>"],
+            "image_size": image_trasformation_parameter["crop"]["size"],
+            "mean": image_trasformation_parameter["mean"].tolist(),
+            "std_dev": image_trasformation_parameter["std_dev"].tolist()
+        })
+    }
+    torch.jit.save(scripted, file_path, _extra_files=extra_files)
+    return file_path
+
+class EncoderGraph(nn.Module):
+    """
+        Encoder + initial state of the decoder, the 1st graph exported in ONNX.
+    """
+    
+    # For python > 3.9 -> def __init__(self, encoder: IEncoder, decoder: IDecoder):
+    def __init__(self, encoder: nn.Module, decoder: nn.Module):
+        """Constructor of the EncoderGraph
+
+        Args:
+            encoder (IEncoder): 
+                The encoder.
+                
+            decoder (IDecoder): 
+                The decoder, it must expose the step interface (See IDecoder).
+        """
+        super(EncoderGraph, self).__init__()
+        self.encoder = encoder
+        self.decoder = decoder
+    
+    def forward(self, images: torch.Tensor) -> Tuple[torch.Tensor, ...]:
+        """Compute the state of the decoder before the <START> token.
+
+        Args:
+            images (torch.Tensor): `(batch_dim, channels, height, width)`
+                The images, already resized and normalized.
+
+        Returns:
+            (Tuple[torch.Tensor, ...]): 
+                The state of the decoder (See IDecoder.init_state), it includes the features of the images.
+        """
+        return self.decoder.init_state(self.encoder(images))
+
+class StepGraph(nn.Module):
+    """
+        A single step of the decoder, the 2nd graph exported in ONNX.
+        Only the recurrent part of the state is given back (Ex. hidden and cell state), the rest (Ex. the features of the images) is given as input at each step.
+    """
+    
+    # For python > 3.9 -> def __init__(self, decoder: IDecoder, recurrent: List[int]):
+    def __init__(self, decoder: nn.Module, recurrent: List[int]):
+        """Constructor of the StepGraph
+
+        Args:
+            decoder (IDecoder): 
+                The decoder, it must expose the step interface (See IDecoder).
+                
+            recurrent (List[int]): 
+                The position in the state of the tensors changed by a step.
+        """
+        super(StepGraph, self).__init__()
+        self.decoder = decoder
+        self.recurrent = recurrent
+    
+    def forward(self, token_ids: torch.Tensor, *state: torch.Tensor) -> Tuple[torch.Tensor, ...]:
+        """Perform a single decoding step.
+
+        Args:
+            token_ids (torch.Tensor): `(batch_dim)`
+                The last token of each caption.
+                
+            state (torch.Tensor): 
+                The state, as given by the EncoderGraph or updated by the previous step.
+
+        Returns:
+            (Tuple[torch.Tensor, ...]): 
+                The logits of the next token `(batch_dim, vocab_size)`, then the recurrent part of the new state.
+        """
+        logits, state = self.decoder.step(tuple(state), token_ids)
+        return (logits,) + tuple(state[idx] for idx in self.recurrent)
+
+# For python > 3.9 -> def export_onnx(net: CaRNet, vocabulary: Vocabulary, file_path: str, image_trasformation_parameter: dict, max_caption_length: int) -> str:
+def export_onnx(net, vocabulary, file_path: str, image_trasformation_parameter: dict, max_caption_length: int) -> str:
+    """Export a net in 2 ONNX graphs: the encoder (See EncoderGraph) and a single step of the decoder (See StepGraph).
+        The greedy loop is left to the runtime (See OnnxCaptioner), it is described with the words of the vocabulary 
+        and the preprocessing of the images by a json file.
+        The graphs are saved beside the json file: <name>_encoder.onnx and <name>_step.onnx.
+
+    Args:
+        net (CaRNet): 
+            The net to export.
+            
+        vocabulary (Vocabulary): 
+            The vocabulary associated to the net.
+            
+        file_path (str): 
+            The path of the json file.
+            
+        image_trasformation_parameter (dict): 
+            The pre-processing of the images (See MyDataset.image_trasformation_parameter).
+            
+        max_caption_length (int): 
+            The maximum ammisible length of the caption, <START> included.
+
+    Returns:
+        (str): 
+            The path of the json file.
+    """
+    flavored_tokens = vocabulary.predefined_token_idx()
+    encoder, decoder = copy.deepcopy(net.C).eval(), copy.deepcopy(net.R).eval()
+    base_path = os.path.splitext(file_path)[0]
+    
+    # The graphs are traced with 2 images: with a batch of 1, the batch dimension could be specialized as a constant.
+    size = image_trasformation_parameter["crop"]["size"]
+    images = torch.zeros(2, 3, size, size, device=net.device)
+    token_ids = torch.full((2,), flavored_tokens["<START>"], dtype=torch.long, device=net.device)
+    
+    # Q. How to know which part of the state is recurrent without knowing the decoder?
+    # A. A step gives back the same tensor object for the part that doesn't change (Ex. the images of RNetvHCAttention).
+    with torch.no_grad():
+        state = decoder.init_state(encoder(images))
+        _, next_state = decoder.step(state, token_ids)
+    recurrent = [idx for idx in range(len(state)) if next_state[idx] is not state[idx]]
+    
+    state_names = [f"state_{idx}" for idx in range(len(state))]
+    next_state_names = [f"next_{state_names[idx]}" for idx in recurrent]
+    batch_axis = {name: {0: "batch_dim"} for name in ["images", "token_ids", "logits"] + state_names + next_state_names}
+    
+    # Q. Why dynamo=False?
+    # A. The graphs are traced by the TorchScript based exporter, the one that handles the dynamic batch axes given below.
+    #       Since torch 2.9 the default is the dynamo exporter, the argument (torch >= 2.5) keeps the same exporter in every version.
+    encoder_file = f"{base_path}_encoder.onnx"
+    torch.onnx.export(EncoderGraph(encoder, decoder), (images,), encoder_file, input_names=["images"], output_names=state_names, 
+                      dynamic_axes=batch_axis, dynamo=False)
+    step_file = f"{base_path}_step.onnx"
+    torch.onnx.export(StepGraph(decoder, recurrent), (token_ids,) + tuple(state), step_file, input_names=["token_ids"] + state_names, 
+                      output_names=["logits"] + next_state_names, dynamic_axes=batch_axis, dynamo=False)
+    
+    with open(file_path, "w") as description:
+        json.dump({
+            "version": EXPORT_VERSION,
+            "net_name": net.name_net,
+            "encoder": os.path.basename(encoder_file),
+            "step": os.path.basename(step_file),
+            "state": state_names,
+            "recurrent": recurrent,
+            "start_index": flavored_tokens["<START>"],
+            "end_index": flavored_tokens["<END>"],
+            "padding_index": flavored_tokens["<PAD>"],
+            "max_caption_length": max_caption_length,
+            "image_size": size,
+            "mean": image_trasformation_parameter["mean"].tolist(),
+            "std_dev": image_trasformation_parameter["std_dev"].tolist(),
+            "words": vocabulary.id2word.tolist()
+        }, description)
+    return file_path
+
+class ScriptedCaptioner():
+    """
+        Caption generator loaded from an artefact produced by export_torchscript: it needs only torch and torchvision, not the source code of the net.
+    """
+    
+    def __init__(self, file_path: str, device: str = "cpu"):
+        """Load an exported artefact.
+
+        Args:
+            file_path (str): 
+                The path of the artefact.
+                
+            device (str, optional): Defaults to "cpu".
+                The device on which the captions are generated.
+
+        Raises:
+            ValueError: If the artefact was produced by an unknown version of export_torchscript.
+        """
+        extra_files = {"words.json": "", "meta.json": ""}
+        self.device = torch.device(device)
+        self.generator = torch.jit.load(file_path, map_location=self.device, _extra_files=extra_files)
+        
+        self.meta = json.loads(extra_files["meta.json"])
+        if self.meta["version"] > EXPORT_VERSION:
+            raise ValueError(f"The artefact has version {self.meta['version']}, the supported version is {EXPORT_VERSION}.")
+        self.words = json.loads(extra_files["words.json"])
+        
+        self.operations = transforms.Compose([
+            transforms.Resize((self.meta["image_size"], self.meta["image_size"])),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=self.meta["mean"], std=self.meta["std_dev"])
+        ])
+    
+    def generate(self, images: torch.Tensor) -> torch.Tensor:
+        """Generate the caption of each image in the batch.
+
+        Args:
+            images (torch.Tensor): `(batch_dim, channels, height, width)`
+                The images, already resized and normalized.
+
+        Returns:
+            (torch.Tensor): `(batch_dim, <variable>)`
+                The ID of the words of each caption, <START> included and padded with <PAD> after <END>.
+        """
+        with torch.inference_mode():
+            return self.generator(images.to(self.device))
+    
+    def caption(self, images: List[Image.Image]) -> List[str]:
+        """Generate the caption of each image.
+
+        Args:
+            images (List[PIL.Image.Image]): 
+                The images, in RGB.
+
+        Returns:
+            (List[str]): 
+                The caption of each image, without the Flavored Token.
+        """
+        captions_ids = self.generate(torch.stack([self.operations(image) for image in images])).tolist()
+        
+        captions = []
+        for caption_ids in captions_ids:
+            words = []
+            for word_id in caption_ids[1:]: # Skip <START>
+                if word_id == self.meta["end_index"] or word_id == self.meta["padding_index"]: # Stop at <END> or <PAD>
+                    break
+                words.append(self.words[word_id])
+            captions.append(" ".join(words))
+        return captions
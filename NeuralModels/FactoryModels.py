@@ -29,6 +29,8 @@ from .Decoder.RNetvH import RNetvH
 from .Decoder.RNetvHCAttention import RNetvHCAttention
 from .CaRNet import CaRNet
 from .Attention.SoftAttention import SoftAttention
+from .Output.LinearOutput import LinearOutput
+from .Output.AdaptiveOutput import AdaptiveOutput
 from enum import Enum
 
 # Open source is a development methodology; free software is a social movement. 
@@ -168,6 +170,48 @@ def FactoryDecoder(decoder: Decoder):
 
 #####################################################################
 
+class Output(Enum):
+    """
+        Output layer type list.
+    """
+    Linear = "Linear"
+    Adaptive = "Adaptive"
+    
+    def __str__(self):
+        return self.name
+    
+    def __repr__(self):
+        return str(self)
+    
+    @staticmethod
+    def argparse(s):
+        try:
+            return Output[s]
+        except KeyError:
+            return s
+
+def FactoryOutput(output: Output):
+    """ Output layer Factory 
+
+    Args:
+        output (Output): 
+            The expected output layer to produce
+
+    Raises:
+        NotImplementedError: Raise when external ask for an implementation that is not covered yet.
+
+    Returns:
+        (IOutput):   
+            A Class reference
+    """
+    if output == Output.Linear:
+        return LinearOutput
+    if output == Output.Adaptive:
+        return AdaptiveOutput
+    raise NotImplementedError("This output layer is not implemented yet")
+
+#####################################################################
+
 class NeuralNet(Enum):
     """
         NeuralNet type list.
@@ -0,0 +1,151 @@
+# MIT License
+
+# Copyright (c) 2022 christiandimaio
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+class ChunkedCrossEntropy(torch.autograd.Function):
+    """
+        Sum of the cross entropy of the projection of the hidden states on the vocabulary, evaluated a slice of the vocabulary at a time.
+        Equivalent to nn.CrossEntropyLoss(reduction="sum", ignore_index=ignore_index)(linear(hiddens), targets), but the logits `(number_of_tokens, vocab_size)` are never stored:
+            the forward keeps a running log-sum-exp over the slices and the backward evaluates again the logits of each slice.
+    """
+    
+    @staticmethod
+    def forward(ctx, hiddens: torch.Tensor, weight: torch.Tensor, bias: torch.Tensor, targets: torch.Tensor, chunk_size: int, ignore_index: int = -100) -> torch.Tensor:
+        """Evaluate the loss.
+
+        Args:
+            hiddens (torch.Tensor): `(number_of_tokens, hidden_dim)`
+                The hidden state used for predict each token.
+            weight (torch.Tensor): `(vocab_size, hidden_dim)`
+                The weight of the projection on the vocabulary.
+            bias (torch.Tensor): `(vocab_size)`
+                The bias of the projection on the vocabulary, it can be None.
+            targets (torch.Tensor): `(number_of_tokens)`
+                The ID of each token.
+            chunk_size (int): 
+                The number of words of the vocabulary evaluated at a time.
+            ignore_index (int, optional): Defaults to -100.
+                The ID of the tokens that don't contribute to the loss (Ex. <PAD>), as in nn.CrossEntropyLoss.
+
+        Returns:
+            (torch.Tensor): `(1)`
+                The sum of the cross entropy of each token.
+        """
+        number_of_tokens = hiddens.shape[0]
+        
+        # The loss is accumulated at least in single precision
+        dtype = torch.promote_types(hiddens.dtype, torch.float)
+        
+        # Running log-sum-exp: max and sum of exp(logits - max) of the slices seen so far
+        max_logits = torch.full((number_of_tokens,), -float("inf"), dtype=dtype, device=hiddens.device) # Out: (number_of_tokens)
+        sum_exp = torch.zeros(number_of_tokens, dtype=dtype, device=hiddens.device) # Out: (number_of_tokens)
+        target_logits = torch.zeros(number_of_tokens, dtype=dtype, device=hiddens.device) # Out: (number_of_tokens)
+        
+        for start in range(0, weight.shape[0], chunk_size):
+            end = min(start + chunk_size, weight.shape[0])
+            logits = F.linear(hiddens, weight[start:end], bias[start:end] if bias is not None else None).to(dtype) # Out: (number_of_tokens, chunk_size)
+            
+            _max_logits = torch.maximum(max_logits, logits.max(dim=1).values)
+            sum_exp = sum_exp * torch.exp(max_logits - _max_logits) + torch.exp(logits - _max_logits.unsqueeze(1)).sum(dim=1)
+            max_logits = _max_logits
+            
+            # The logit of the target, if it is in this slice
+            in_chunk = (targets >= start) & (targets < end) & (targets != ignore_index)
+            target_logits[in_chunk] = logits[in_chunk, targets[in_chunk] - start]
+        
+        log_sum_exp = max_logits + torch.log(sum_exp) # Out: (number_of_tokens)
+        
+        ctx.save_for_backward(hiddens, weight, bias, targets, log_sum_exp)
+        ctx.chunk_size = chunk_size
+        ctx.ignore_index = ignore_index
+        
+        return ((log_sum_exp - target_logits) * (targets != ignore_index).to(dtype)).sum()
+    
+    @staticmethod
+    def backward(ctx, grad_output: torch.Tensor):
+        """Evaluate the gradient of the loss wrt hiddens, weight and bias.
+            d(loss)/d(logits) = softmax(logits) - one_hot(targets), ZEROS for the ignored tokens.
+        """
+        hiddens, weight, bias, targets, log_sum_exp = ctx.saved_tensors
+        
+        ignored = targets == ctx.ignore_index # Out: (number_of_tokens)
+        
+        grad_hiddens = torch.zeros_like(hiddens) if ctx.needs_input_grad[0] else None
+        grad_weight = torch.zeros_like(weight) if ctx.needs_input_grad[1] else None
+        grad_bias = torch.zeros_like(bias) if bias is not None and ctx.needs_input_grad[2] else None
+        
+        for start in range(0, weight.shape[0], ctx.chunk_size):
+            end = min(start + ctx.chunk_size, weight.shape[0])
+            logits = F.linear(hiddens, weight[start:end], bias[start:end] if bias is not None else None).to(log_sum_exp.dtype) # Out: (number_of_tokens, chunk_size)
+            
+            grad_logits = torch.exp(logits - log_sum_exp.unsqueeze(1)) # softmax, Out: (number_of_tokens, chunk_size)
+            in_chunk = (targets >= start) & (targets < end) & ~ignored
+            grad_logits[in_chunk, targets[in_chunk] - start] -= 1.
+            grad_logits[ignored] = 0.
+            grad_logits = (grad_logits * grad_output).to(hiddens.dtype)
+            
+            if grad_hiddens is not None:
+                grad_hiddens += grad_logits @ weight[start:end] # Out: (number_of_tokens, hidden_dim)
+            if grad_weight is not None:
+                grad_weight[start:end] = grad_logits.t() @ hiddens # Out: (chunk_size, hidden_dim)
+            if grad_bias is not None:
+                grad_bias[start:end] = grad_logits.sum(dim=0) # Out: (chunk_size)
+        
+        return grad_hiddens, grad_weight, grad_bias, None, None, None
+
+class ChunkedCrossEntropyLoss(nn.Module):
+    """
+        Cross entropy loss (sum reduction) of a linear projection on the vocabulary, with bounded memory (See ChunkedCrossEntropy).
+    """
+    
+    def __init__(self, chunk_size: int = 4096, ignore_index: int = -100):
+        """Constructor of the loss
+
+        Args:
+            chunk_size (int, optional): Defaults to 4096.
+                The number of words of the vocabulary evaluated at a time, the peak memory is `(number_of_tokens, chunk_size)`.
+            ignore_index (int, optional): Defaults to -100.
+                The ID of the tokens that don't contribute to the loss (Ex. <PAD>), as in nn.CrossEntropyLoss.
+        """
+        super(ChunkedCrossEntropyLoss, self).__init__()
+        self.chunk_size = chunk_size
+        self.ignore_index = ignore_index
+        
+    def forward(self, hiddens: torch.Tensor, linear: nn.Linear, targets: torch.Tensor) -> torch.Tensor:
+        """Evaluate the loss.
+
+        Args:
+            hiddens (torch.Tensor): `(number_of_tokens, hidden_dim)`
+                The hidden state used for predict each token.
+            linear (nn.Linear): 
+                The projection of the hidden states on the vocabulary.
+            targets (torch.Tensor): `(number_of_tokens)`
+                The ID of each token.
+
+        Returns:
+            (torch.Tensor): `(1)`
+                The sum of the cross entropy of each token.
+        """
+        return ChunkedCrossEntropy.apply(hiddens, linear.weight, linear.bias, targets, self.chunk_size, self.ignore_index)
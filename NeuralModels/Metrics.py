@@ -20,31 +20,41 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import pandas as pd
+import csv
+import os
+import time
+from array import array
 
 class Result():
     """
-            Class for storing result of the net
+            Class for storing result of the net.
+                The rows are buffered column by column and appended to the csv files when the buffer is big or old enough.
     """
-    def __init__(self):
+    def __init__(self, directory: str = ".", buffer_size: int = 1024, buffer_seconds: float = 60.):
         """Constructor of the class
+
+        Args:
+            directory (str, optional): Defaults to ".".
+                The directory to store the files as csv.
+            buffer_size (int, optional): Defaults to 1024.
+                The number of rows kept in memory before appending them to the file.
+            buffer_seconds (float, optional): Defaults to 60.
+                The maximum number of seconds a row is kept in memory before appending it to the file.
         """
-        self.train_results = pd.DataFrame([], columns=["Epoch", "IDBatch", "Loss", "Accuracy"])
-        convert_dict = {'Epoch': int,
-                        "IDBatch": int,
-                        "Loss":float,
-                        'Accuracy': float
-               }
-        self.train_results = self.train_results.astype(convert_dict)
+        self.directory = directory
+        self.buffer_size = buffer_size
+        self.buffer_seconds = buffer_seconds
         
-        convert_dict = {'Epoch': int,
-                        'Accuracy': float
-               }
-        self.validation_results = pd.DataFrame([], columns=["Epoch", "Accuracy"])
-        self.validation_results = self.validation_results.astype(convert_dict)
+        # Typecode of each column: "q" -> int, "d" -> float
+        self.train_results = {"Epoch": array("q"), "IDBatch": array("q"), "Loss": array("d"), "Accuracy": array("d")}
+        self.validation_results = {"Epoch": array("q"), "Accuracy": array("d")}
+        
+        # The files are created (header included) at the first flush, the previous results are overwritten
+        self._created = set()
+        self._last_flush = time.monotonic()
         
     def add_train_info(self, epoch: int, batch_id: int, loss: float, accuracy: float):
-        """Add a row to the dataframe of the training set info
+        """Add a row to the training set info
 
         Args:
             epoch (int): 
@@ -56,10 +66,10 @@ class Result():
             accuracy (float): 
                 Accuracy of the given epoch-batch.
         """
-        self.train_results = self.train_results.append({"Epoch":epoch,"IDBatch": batch_id, "Loss": loss, "Accuracy":accuracy}, ignore_index=True)
+        self.__add(self.train_results, Epoch=epoch, IDBatch=batch_id, Loss=loss, Accuracy=accuracy)
         
     def add_validation_info(self, epoch: int, accuracy: float):
-        """Add a row to the dataframe of the validation set info
+        """Add a row to the validation set info
 
         Args:
             epoch (int): 
@@ -67,14 +77,75 @@ class Result():
             accuracy (float): 
                 Accuracy of the given epoch-batch.
         """
-        self.validation_results = self.validation_results.append({"Epoch":epoch, "Accuracy":accuracy}, ignore_index=True)
+        self.__add(self.validation_results, Epoch=epoch, Accuracy=accuracy)
+    
+    def __add(self, results: dict, **row):
+        """Append a row to the columns of results, flush the buffers if a threshold is reached.
+
+        Args:
+            results (dict): 
+                The columns of the results.
+            row (dict): 
+                The value of each column.
+        """
+        for column, values in results.items():
+            values.append(row[column])
+        
+        if len(results["Epoch"]) >= self.buffer_size or time.monotonic() - self._last_flush >= self.buffer_seconds:
+            self.flush()
         
-    def flush(self, directory: str = "."): 
-        """Flush the dataframes to non-volatile memory in a csv format
+    def flush(self): 
+        """Append the buffered rows to the csv files and empty the buffers.
+        """
+        self.__append("train_results.csv", self.train_results)
+        self.__append("validation_results.csv", self.validation_results)
+        self._last_flush = time.monotonic()
+    
+    def __append(self, file_name: str, results: dict):
+        """Append the rows of results to file_name.
 
         Args:
-            directory (str, optional):  Defaults to ".".
-                The directory to store the files as csv.
+            file_name (str): 
+                The name of the csv file, inside self.directory.
+            results (dict): 
+                The columns of the results.
+        """
+        first = file_name not in self._created
+        if not first and len(results["Epoch"]) == 0:
+            return
+        
+        with open(os.path.join(self.directory, file_name), "w" if first else "a", encoding="utf-8", newline="") as file:
+            writer = csv.writer(file)
+            if first:
+                writer.writerow(results.keys())
+            writer.writerows(zip(*results.values()))
+        
+        self._created.add(file_name)
+        for column in results:
+            del results[column][:]
+    
+class Progress():
+    """
+            Class for rate limiting the progress messages on screen
+    """
+    def __init__(self, interval: float = 10.):
+        """Constructor of the class
+
+        Args:
+            interval (float, optional): Defaults to 10.
+                The minimum number of seconds between two messages.
+        """
+        self.interval = interval
+        self._last = None
+    
+    def ready(self) -> bool:
+        """Tell if a new message can be printed, if yes the timer restarts.
+
+        Returns:
+            bool: True if at least interval seconds are passed from the last message.
         """
-        self.train_results.to_csv(f'{directory}/train_results.csv', encoding='utf-8', index=False)
-        self.validation_results.to_csv(f'{directory}/validation_results.csv', encoding='utf-8', index=False)
\ No newline at end of file
+        now = time.monotonic()
+        if self._last is not None and now - self._last < self.interval:
+            return False
+        self._last = now
+        return True
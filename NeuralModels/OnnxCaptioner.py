@@ -0,0 +1,141 @@
+# MIT License
+
+# Copyright (c) 2022 christiandimaio
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import json
+import numpy as np
+from PIL import Image
+from typing import List
+
+# REMARK No import from the project and no torch: OnnxCaptioner must work with this file, numpy, PIL and onnxruntime alone.
+
+# Version of the exported artefact supported (See Export.EXPORT_VERSION).
+EXPORT_VERSION = 1
+
+class OnnxCaptioner():
+    """
+        Caption generator driven by ONNX Runtime, on the 2 graphs produced by Export.export_onnx: 
+        the encoder runs once, then the step of the decoder runs in a greedy loop.
+    """
+    
+    def __init__(self, file_path: str, providers: List[str] = ["CPUExecutionProvider"]):
+        """Load an exported artefact.
+
+        Args:
+            file_path (str): 
+                The path of the json file that describes the artefact.
+                
+            providers (List[str], optional): Defaults to ["CPUExecutionProvider"].
+                The execution providers of ONNX Runtime.
+
+        Raises:
+            ImportError: If onnxruntime is not installed.
+            ValueError: If the artefact was produced by an unknown version of export_onnx.
+        """
+        # Q. Why import here?
+        # A. onnxruntime is needed only by this backend, the rest of the project works without it.
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("The onnx backend needs onnxruntime, install it with: pip install onnxruntime")
+        
+        with open(file_path, "r") as description:
+            self.meta = json.load(description)
+        if self.meta["version"] > EXPORT_VERSION:
+            raise ValueError(f"The artefact has version {self.meta['version']}, the supported version is {EXPORT_VERSION}.")
+        
+        directory = os.path.dirname(file_path)
+        self.encoder = onnxruntime.InferenceSession(os.path.join(directory, self.meta["encoder"]), providers=providers)
+        self.step = onnxruntime.InferenceSession(os.path.join(directory, self.meta["step"]), providers=providers)
+        
+        # The exporter removes the inputs not used by a graph (Ex. the alphas of the previous step)
+        self.step_inputs = [_input.name for _input in self.step.get_inputs()]
+        
+        self.mean = np.array(self.meta["mean"], dtype=np.float32).reshape(3, 1, 1)
+        self.std_dev = np.array(self.meta["std_dev"], dtype=np.float32).reshape(3, 1, 1)
+    
+    def preprocess(self, image: Image.Image) -> np.ndarray:
+        """Resize and normalize an image, as done in training (See MyDataset).
+
+        Args:
+            image (PIL.Image.Image): 
+                The image, in RGB.
+
+        Returns:
+            (np.ndarray): `(channels, height, width)`
+                The image ready for the encoder.
+        """
+        image = image.resize((self.meta["image_size"], self.meta["image_size"]), Image.BILINEAR)
+        image = np.asarray(image, dtype=np.float32).transpose(2, 0, 1) / 255. # Out: (channels, height, width)
+        return (image - self.mean) / self.std_dev
+    
+    def generate(self, images: np.ndarray) -> np.ndarray:
+        """Generate the caption of each image in the batch with a greedy decoding.
+
+        Args:
+            images (np.ndarray): `(batch_dim, channels, height, width)`
+                The images, already resized and normalized.
+
+        Returns:
+            (np.ndarray): `(batch_dim, <variable>)`
+                The ID of the words of each caption, <START> included and padded with <PAD> after <END>.
+        """
+        state = dict(zip(self.meta["state"], self.encoder.run(None, {"images": images.astype(np.float32)})))
+        
+        token_ids = np.full(images.shape[0], self.meta["start_index"], dtype=np.int64) # Out: (batch_dim)
+        finished = np.zeros(images.shape[0], dtype=bool) # True if the caption has already produced <END>
+        sampled_ids = [token_ids]
+        for _ in range(self.meta["max_caption_length"]-1):
+            feeds = {name: token_ids if name == "token_ids" else state[name] for name in self.step_inputs}
+            logits, *next_state = self.step.run(None, feeds) # logits: (batch_dim, vocab_size)
+            for idx, tensor in zip(self.meta["recurrent"], next_state):
+                state[self.meta["state"][idx]] = tensor
+            
+            token_ids = np.where(finished, self.meta["padding_index"], logits.argmax(axis=1)) # The finished captions produce only <PAD>
+            finished = finished | (token_ids == self.meta["end_index"])
+            sampled_ids.append(token_ids)
+            if finished.all():
+                break
+        return np.stack(sampled_ids, axis=1) # Out: (batch_dim, <variable>)
+    
+    def caption(self, images: List[Image.Image]) -> List[str]:
+        """Generate the caption of each image.
+
+        Args:
+            images (List[PIL.Image.Image]): 
+                The images, in RGB.
+
+        Returns:
+            (List[str]): 
+                The caption of each image, without the Flavored Token.
+        """
+        captions_ids = self.generate(np.stack([self.preprocess(image) for image in images])).tolist()
+        
+        captions = []
+        for caption_ids in captions_ids:
+            words = []
+            for word_id in caption_ids[1:]: # Skip <START>
+                if word_id == self.meta["end_index"] or word_id == self.meta["padding_index"]: # Stop at <END> or <PAD>
+                    break
+                words.append(self.meta["words"][word_id])
+            captions.append(" ".join(words))
+        return captions
@@ -0,0 +1,168 @@
+# MIT License
+
+# Copyright (c) 2022 christiandimaio
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import numpy as np
+from typing import List
+
+class AdaptiveOutput(nn.AdaptiveLogSoftmaxWithLoss):
+    """
+        Adaptive softmax (Grave et al. 2016) over the vocabulary.
+        The IDs of the vocabulary are sorted by frequency (See Vocabulary): the head holds the most frequent words, the rare words are in clusters 
+        of tail with a smaller projection, evaluated only when needed.
+    """
+    
+    # Q. Why these annotations?
+    # A. TorchScript reads the annotations of the class, and the ones inherited from nn.AdaptiveLogSoftmaxWithLoss declare head and tail as plain classes:
+    #       redeclaring only the attributes that aren't modules keeps the output layer exportable (See Export).
+    in_features: int
+    n_classes: int
+    cutoffs: List[int]
+    shortlist_size: int
+    n_clusters: int
+    head_size: int
+    def __init__(self, hidden_dim: int, vocab_size: int, counts: np.ndarray = None, coverage: List[float] = [0.9, 0.99], div_value: float = 4.):
+        """Constructor for an AdaptiveOutput
+
+        Args:
+            hidden_dim (int): 
+                The capacity of the LSTM.
+            vocab_size (int): 
+                The size of the vocabulary.
+            counts (np.ndarray, optional): `(vocab_size)` Defaults to None.
+                The number of occurrences of each ID, used for evaluate the clusters (See cutoffs_from_counts).
+            coverage (List[float], optional): Defaults to [0.9, 0.99].
+                The fraction of the tokens of the dataset covered by the head and by each cluster of the tail.
+            div_value (float, optional): Defaults to 4.
+                The projection of the cluster i of the tail has hidden_dim / div_value^(i+1) features.
+        """
+        super(AdaptiveOutput, self).__init__(hidden_dim, vocab_size, AdaptiveOutput.cutoffs_from_counts(vocab_size, counts, coverage), div_value=div_value)
+    
+    @staticmethod
+    def cutoffs_from_counts(vocab_size: int, counts: np.ndarray = None, coverage: List[float] = [0.9, 0.99]) -> List[int]:
+        """Evaluate the clusters of the adaptive softmax.
+
+        Args:
+            vocab_size (int): 
+                The size of the vocabulary.
+            counts (np.ndarray, optional): `(vocab_size)` Defaults to None.
+                The number of occurrences of each ID, the IDs after the 4 Flavored Token are sorted by frequency. 
+                The counts of <PAD> and <START> are ignored.
+                If None, the clusters split the vocabulary geometrically: vocab_size / 10, vocab_size / 2.
+            coverage (List[float], optional): Defaults to [0.9, 0.99].
+                The fraction of the tokens covered by the head and by each cluster of the tail.
+
+        Returns:
+            (List[int]): 
+                The first ID of each cluster of the tail.
+        """
+        if counts is None:
+            cutoffs = [vocab_size // 10, vocab_size // 2]
+        else:
+            # <PAD> (ID 0) and <START> (ID 1) are never a target (See CaRNet.train), they don't count in the coverage of the targets.
+            # REMARK The counts can be memory-mapped (See Vocabulary), they are copied.
+            counts = np.array(counts, dtype=np.int64)
+            counts[:2] = 0
+            
+            # The smallest ID that covers the requested fraction of the tokens
+            coverage_by_id = np.cumsum(counts) / max(int(np.sum(counts)), 1) # Out: (vocab_size)
+            cutoffs = [int(np.searchsorted(coverage_by_id, fraction)) + 1 for fraction in coverage]
+        
+        # The cutoffs must be increasing, in the range (0, vocab_size)
+        cutoffs = sorted(set(cutoff for cutoff in cutoffs if 0 < cutoff < vocab_size))
+        return cutoffs if len(cutoffs) > 0 else [max(vocab_size // 2, 1)]
+    
+    def forward(self, hiddens: torch.Tensor) -> torch.Tensor:
+        """Compute the log-probability of each word of the vocabulary.
+
+        Args:
+            hiddens (torch.Tensor): `(*, hidden_dim)`
+                The hidden states.
+
+        Returns:
+            (torch.Tensor): `(*, vocab_size)`
+                The log-probability of each word.
+        """
+        _hiddens = hiddens.reshape(-1, hiddens.shape[-1]) # Out: (batch_dim, hidden_dim)
+        return self._full_log_prob(_hiddens, self.head(_hiddens)).reshape(hiddens.shape[:-1] + (self.n_classes,))
+    
+    def _full_log_prob(self, hiddens: torch.Tensor, head_output: torch.Tensor) -> torch.Tensor:
+        """Compute the log-probability of each word of the vocabulary, given the output of the head.
+            Same of nn.AdaptiveLogSoftmaxWithLoss.log_prob, written for TorchScript (See Export).
+            REMARK Single underscore: TorchScript can't resolve the mangled name of a __private method.
+
+        Args:
+            hiddens (torch.Tensor): `(batch_dim, hidden_dim)`
+                The hidden states.
+                
+            head_output (torch.Tensor): `(batch_dim, shortlist_size + number_of_clusters)`
+                The output of the head.
+
+        Returns:
+            (torch.Tensor): `(batch_dim, vocab_size)`
+                The log-probability of each word.
+        """
+        head_log_prob = F.log_softmax(head_output, dim=1) # Out: (batch_dim, shortlist_size + number_of_clusters)
+        
+        # The log-probability of a word of a cluster is log P(cluster) + log P(word | cluster)
+        log_prob = [head_log_prob[:, :self.shortlist_size]]
+        for idx, cluster in enumerate(self.tail):
+            log_prob.append(F.log_softmax(cluster(hiddens), dim=1) + head_log_prob[:, self.shortlist_size + idx].unsqueeze(1))
+        return torch.cat(log_prob, dim=1) # Out: (batch_dim, vocab_size)
+    
+    def loss(self, hiddens: torch.Tensor, targets: torch.Tensor) -> torch.Tensor:
+        """Compute the cross entropy of the targets (sum reduction), each token evaluates only the head and the cluster of its target.
+
+        Args:
+            hiddens (torch.Tensor): `(number_of_tokens, hidden_dim)`
+                The hidden state used for predict each token.
+            targets (torch.Tensor): `(number_of_tokens)`
+                The ID of each token.
+
+        Returns:
+            (torch.Tensor): `(1)`
+                The sum of the cross entropy of each token.
+        """
+        return super(AdaptiveOutput, self).forward(hiddens, targets).loss * targets.shape[0]
+    
+    def predict(self, hiddens: torch.Tensor) -> torch.Tensor:
+        """Compute the most likely word, the tail is evaluated only if the most likely element of the head is a cluster.
+            Same of nn.AdaptiveLogSoftmaxWithLoss.predict, written for TorchScript (See Export).
+
+        Args:
+            hiddens (torch.Tensor): `(batch_dim, hidden_dim)`
+                The hidden states.
+
+        Returns:
+            (torch.Tensor): `(batch_dim)`
+                The ID of the most likely word.
+        """
+        head_output = self.head(hiddens) # Out: (batch_dim, shortlist_size + number_of_clusters)
+        predicted = head_output.argmax(dim=1) # Out: (batch_dim)
+        
+        # If a cluster is the most likely, a word of the cluster can be less likely than a word of the shortlist: the full distribution is needed.
+        in_tail = predicted >= self.shortlist_size # Out: (batch_dim)
+        if bool(in_tail.any()):
+            predicted[in_tail] = self._full_log_prob(hiddens[in_tail], head_output[in_tail]).argmax(dim=1)
+        return predicted
@@ -0,0 +1,83 @@
+# MIT License
+
+# Copyright (c) 2022 christiandimaio
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import torch
+import torch.nn as nn
+
+class IOutput(nn.Module):
+    """
+        Class interface for the Output layer of a decoder: the projection of the hidden state of the LSTM on the vocabulary.
+        Args are intended as suggested.
+    """
+    def __init__(self, *args):
+        """Constructor for an Output layer
+
+        Args:
+            hidden_dim (int): 
+                The capacity of the LSTM.
+            vocab_size (int): 
+                The size of the vocabulary.
+            counts (np.ndarray): `(vocab_size)`
+                The number of occurrences of each ID in the dataset, None if not available.
+        """
+        super(IOutput, self).__init__()
+        
+    def forward(self, *args):
+        """Compute the score of each word of the vocabulary.
+
+        Args:
+            hiddens (torch.Tensor): `(*, hidden_dim)`
+                The hidden states.
+
+        Returns:
+            (torch.Tensor): `(*, vocab_size)`
+                The score of each word, log_softmax of the scores gives the log-probabilities.
+        """
+        pass
+    
+    def loss(self, *args):
+        """Compute the cross entropy of the targets (sum reduction).
+
+        Args:
+            hiddens (torch.Tensor): `(number_of_tokens, hidden_dim)`
+                The hidden state used for predict each token.
+            targets (torch.Tensor): `(number_of_tokens)`
+                The ID of each token.
+
+        Returns:
+            (torch.Tensor): `(1)`
+                The sum of the cross entropy of each token.
+        """
+        pass
+    
+    def predict(self, *args):
+        """Compute the most likely word, without evaluating the full distribution when possible.
+
+        Args:
+            hiddens (torch.Tensor): `(batch_dim, hidden_dim)`
+                The hidden states.
+
+        Returns:
+            (torch.Tensor): `(batch_dim)`
+                The ID of the most likely word.
+        """
+        pass
@@ -0,0 +1,78 @@
+# MIT License
+
+# Copyright (c) 2022 christiandimaio
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import torch
+import torch.nn as nn
+import numpy as np
+from ..Loss import ChunkedCrossEntropy
+
+class LinearOutput(nn.Linear):
+    """
+        Full softmax over the vocabulary: a linear projection of the hidden state.
+        It is a nn.Linear, the checkpoints of the decoders saved before the introduction of the output layers are still valid.
+    """
+    def __init__(self, hidden_dim: int, vocab_size: int, counts: np.ndarray = None, chunk_size: int = 4096):
+        """Constructor for a LinearOutput
+
+        Args:
+            hidden_dim (int): 
+                The capacity of the LSTM.
+            vocab_size (int): 
+                The size of the vocabulary.
+            counts (np.ndarray, optional): `(vocab_size)` Defaults to None.
+                Not used, the full vocabulary is always evaluated.
+            chunk_size (int, optional): Defaults to 4096.
+                The number of words of the vocabulary evaluated at a time by the loss (See ChunkedCrossEntropy).
+        """
+        super(LinearOutput, self).__init__(hidden_dim, vocab_size)
+        
+        # Q. Why not a ChunkedCrossEntropyLoss submodule?
+        # A. The submodules are compiled by TorchScript, and an autograd Function can't be: the output layer must stay exportable (See Export).
+        self.chunk_size = chunk_size
+    
+    def loss(self, hiddens: torch.Tensor, targets: torch.Tensor) -> torch.Tensor:
+        """Compute the cross entropy of the targets (sum reduction), without storing the logits of all the vocabulary.
+
+        Args:
+            hiddens (torch.Tensor): `(number_of_tokens, hidden_dim)`
+                The hidden state used for predict each token.
+            targets (torch.Tensor): `(number_of_tokens)`
+                The ID of each token.
+
+        Returns:
+            (torch.Tensor): `(1)`
+                The sum of the cross entropy of each token.
+        """
+        return ChunkedCrossEntropy.apply(hiddens, self.weight, self.bias, targets, self.chunk_size)
+    
+    def predict(self, hiddens: torch.Tensor) -> torch.Tensor:
+        """Compute the most likely word, the softmax doesn't change the argmax.
+
+        Args:
+            hiddens (torch.Tensor): `(batch_dim, hidden_dim)`
+                The hidden states.
+
+        Returns:
+            (torch.Tensor): `(batch_dim)`
+                The ID of the most likely word.
+        """
+        return self(hiddens).argmax(dim=-1)
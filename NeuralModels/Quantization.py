@@ -0,0 +1,127 @@
+# MIT License
+
+# Copyright (c) 2022 christiandimaio
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import copy
+import torch
+import torch.nn as nn
+import torch.ao.nn.quantized.dynamic as nnqd
+from torch.ao.quantization import quantize_dynamic, get_default_qconfig_mapping
+from torch.ao.quantization.quantization_mappings import get_default_dynamic_quant_module_mappings
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+from typing import Iterable
+from .Output.LinearOutput import LinearOutput
+
+# Int8 inference on cpu, 2 flavours:
+#   - dynamic: the weights of the Linear layers and of the LSTMCell are stored in int8, the activations are quantized on the fly at each call.
+#       It is the right choice for the decoder, its cost is in the weights (the projection on the vocabulary) and it doesn't need any data.
+#   - static: the weights and the activations of the ResNet50 trunk are int8, the range of the activations is observed on a calibration set.
+#       The convolutions are the cost of the encoder, the dynamic quantization doesn't support them.
+# Both work only on cpu, no training is possible after the quantization.
+
+class DynamicQuantizedLinearOutput(nnqd.Linear):
+    """
+        LinearOutput with the weights in int8 (dynamic quantization), only for inference.
+    """
+    
+    @classmethod
+    def from_float(cls, mod: LinearOutput, use_precomputed_fake_quant: bool = False) -> "DynamicQuantizedLinearOutput":
+        """Create the quantized output layer from a LinearOutput, called by quantize_dynamic.
+
+        Args:
+            mod (LinearOutput): 
+                The output layer, with the qconfig assigned by quantize_dynamic.
+                
+            use_precomputed_fake_quant (bool, optional): Defaults to False.
+                Not used, required by the interface of torch.
+
+        Returns:
+            (DynamicQuantizedLinearOutput): 
+                The quantized output layer.
+        """
+        # Q. Why a copy into a nn.Linear?
+        # A. nnqd.Linear.from_float accepts only the exact type nn.Linear, LinearOutput is a subclass.
+        linear = nn.Linear(mod.in_features, mod.out_features)
+        linear.weight, linear.bias, linear.qconfig = mod.weight, mod.bias, mod.qconfig
+        return super(DynamicQuantizedLinearOutput, cls).from_float(linear, use_precomputed_fake_quant)
+    
+    def loss(self, hiddens: torch.Tensor, targets: torch.Tensor) -> torch.Tensor:
+        """Not available, a quantized net can't be trained.
+
+        Raises:
+            RuntimeError: Always.
+        """
+        raise RuntimeError("A quantized output layer can't be trained, load the float checkpoint.")
+    
+    def predict(self, hiddens: torch.Tensor) -> torch.Tensor:
+        """Compute the most likely word, the softmax doesn't change the argmax.
+
+        Args:
+            hiddens (torch.Tensor): `(batch_dim, hidden_dim)`
+                The hidden states.
+
+        Returns:
+            (torch.Tensor): `(batch_dim)`
+                The ID of the most likely word.
+        """
+        return self(hiddens).argmax(dim=-1)
+
+def quantize_dynamic_int8(module: nn.Module) -> nn.Module:
+    """Quantize in place the Linear layers (output layer and attention projections included) and the LSTMCell of a module, dynamic quantization.
+        The Embedding is left in float: it is a lookup, there is no computation to speed up.
+
+    Args:
+        module (nn.Module): 
+            The module, Ex. a decoder or an encoder. It must be on cpu.
+
+    Returns:
+        (nn.Module): 
+            The same module, quantized.
+    """
+    mapping = get_default_dynamic_quant_module_mappings()
+    mapping[LinearOutput] = DynamicQuantizedLinearOutput
+    # The layers of AdaptiveOutput are plain nn.Linear, they are quantized without any special care.
+    return quantize_dynamic(module, {nn.Linear, nn.LSTMCell, LinearOutput}, dtype=torch.qint8, mapping=mapping, inplace=True)
+
+def quantize_static_int8(module: nn.Module, example_images: torch.Tensor, calibration: Iterable[torch.Tensor] = None) -> nn.Module:
+    """Quantize a convolutional module (the trunk of the encoder), static quantization through torch.fx.
+        Conv+BatchNorm+ReLU are fused and the activations stay int8 between the layers, the kernels are the ones of torch.backends.quantized.engine.
+
+    Args:
+        module (nn.Module): 
+            The module, it must be traceable by torch.fx (Ex. the nn.Sequential of the ResNet50) and on cpu.
+            
+        example_images (torch.Tensor): `(1, channels, height, width)`
+            An input of the module, used only for tracing.
+            
+        calibration (Iterable[torch.Tensor], optional): `(batch_dim, channels, height, width)` Defaults to None.
+            The batches of images used for observe the range of the activations.
+            If None the module is not calibrated: only the structure is built, for loading a quantized checkpoint (the ranges are in the state_dict).
+
+    Returns:
+        (nn.Module): 
+            A new quantized module, the given one is not modified.
+    """
+    prepared = prepare_fx(copy.deepcopy(module).eval(), get_default_qconfig_mapping(torch.backends.quantized.engine), (example_images,))
+    if calibration is not None:
+        with torch.no_grad():
+            for images in calibration:
+                prepared(images)
+    return convert_fx(prepared)
@@ -0,0 +1,194 @@
+# MIT License
+
+# Copyright (c) 2022 christiandimaio
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Typing trick for avoid circular import dependencies valid for python > 3.9
+# from __future__ import annotations
+# from typing import TYPE_CHECKING
+# if TYPE_CHECKING:
+#     from .Dataset import MyDataset
+
+import numpy as np
+from torch.utils.data import Sampler
+from typing import Iterator, List
+
+class EpochBatchSampler(Sampler):
+    """
+        Base of the batch samplers whose mini-batches depend on the epoch: the shuffle is seeded with seed + epoch, so the order is deterministic.
+        
+        The mini-batches of an epoch are computed once, by the subclass (See _epoch_batches), and shared by __len__ and __iter__.
+        Each iteration is a new epoch, unless set_epoch is called before it.
+    """
+    
+    def __init__(self, shuffle: bool = True, seed: int = 0):
+        """Constructor of the sampler
+
+        Args:
+            shuffle (bool, optional): Defaults to True.
+                If True, the mini-batches are shuffled at each epoch.
+                
+            seed (int, optional): Defaults to 0.
+                The seed of the shuffle, together with the epoch it makes the order deterministic.
+        """
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+        self._batches = None
+    
+    def set_epoch(self, epoch: int):
+        """Set the epoch used for the shuffle of the next iteration."""
+        self.epoch = epoch
+        self._batches = None
+    
+    def _epoch_batches(self) -> List[List]:
+        """Compute the mini-batches of the current epoch, implemented by the subclass.
+
+        Returns:
+            (List[List]): 
+                The mini-batches, in the order of the iteration.
+        """
+        raise NotImplementedError
+    
+    def __iter__(self) -> Iterator[List]:
+        if self._batches is None:
+            self._batches = self._epoch_batches()
+        batches, self._batches = self._batches, None
+        
+        # The next iteration is a new epoch.
+        self.epoch += 1
+        return iter(batches)
+    
+    def __len__(self) -> int:
+        """Number of mini-batches of the next iteration.
+            REMARK Once the iteration is started, it is the length of the next epoch, not the one of the current epoch.
+        """
+        if self._batches is None:
+            self._batches = self._epoch_batches()
+        return len(self._batches)
+
+
+class ImageGroupedBatchSampler(EpochBatchSampler):
+    """
+        Batch sampler that keeps together all the captions of the same image.
+        
+        Each element of a mini-batch is the list of the rows of an image, so the image is loaded and encoded only once 
+        and its features are shared among all its captions (See MyDataset.pack_minibatch_training with group_by_image).
+        
+        Assumption:
+        
+            1) batch_size is intended as number of captions, an image is never splitted among two mini-batches.
+    """
+    
+    # For python > 3.9 -> def __init__(self, data_set: MyDataset, batch_size: int, shuffle: bool = True, seed: int = 0):
+    def __init__(self, data_set, batch_size: int, shuffle: bool = True, seed: int = 0):
+        """Constructor of the sampler
+
+        Args:
+            data_set (MyDataset): 
+                The dataset to sample.
+                
+            batch_size (int): 
+                The maximum number of captions in a mini-batch (at least one image is always picked).
+                
+            shuffle (bool, optional): Defaults to True.
+                If True, the images are shuffled at each epoch.
+                
+            seed (int, optional): Defaults to 0.
+                The seed of the shuffle, together with the epoch it makes the order deterministic.
+        """
+        super(ImageGroupedBatchSampler, self).__init__(shuffle, seed)
+        self.groups = data_set.get_images_groups()
+        self.batch_size = batch_size
+    
+    def _epoch_batches(self) -> List[List[List[int]]]:
+        """Compute the mini-batches of the current epoch."""
+        order = np.arange(len(self.groups))
+        if self.shuffle:
+            np.random.RandomState(self.seed + self.epoch).shuffle(order)
+        
+        batches = []
+        batch, batch_captions = [], 0
+        for group in order:
+            if batch_captions + len(self.groups[group]) > self.batch_size and len(batch) > 0:
+                batches.append(batch)
+                batch, batch_captions = [], 0
+            batch.append(self.groups[group])
+            batch_captions += len(self.groups[group])
+        if len(batch) > 0:
+            batches.append(batch)
+        return batches
+    
+
+
+class TokenBudgetBatchSampler(EpochBatchSampler):
+    """
+        Batch sampler that buckets the rows by caption length and fills each mini-batch up to a budget of tokens.
+        
+        Since the captions of a mini-batch have (almost) the same length, the padding is minimal and the number of timesteps
+        of the decoder is the one really needed. The number of captions in a mini-batch varies, the number of tokens (padding included) does not.
+        
+        Assumption:
+        
+            1) The cost of a mini-batch is `number_of_captions * longest_caption`, with <START> and <END> token.
+    """
+    
+    # For python > 3.9 -> def __init__(self, data_set: MyDataset, max_tokens: int, shuffle: bool = True, seed: int = 0):
+    def __init__(self, data_set, max_tokens: int, shuffle: bool = True, seed: int = 0):
+        """Constructor of the sampler
+
+        Args:
+            data_set (MyDataset): 
+                The dataset to sample.
+                
+            max_tokens (int): 
+                The maximum number of tokens in a mini-batch (at least one caption is always picked).
+                
+            shuffle (bool, optional): Defaults to True.
+                If True, the captions inside each bucket and the order of the mini-batches are shuffled at each epoch.
+                
+            seed (int, optional): Defaults to 0.
+                The seed of the shuffle, together with the epoch it makes the order deterministic.
+        """
+        super(TokenBudgetBatchSampler, self).__init__(shuffle, seed)
+        self.captions_length = np.asarray(data_set.get_captions_length())
+        self.max_tokens = max_tokens
+    
+    def _epoch_batches(self) -> List[List[int]]:
+        """Compute the mini-batches of the current epoch."""
+        random_state = np.random.RandomState(self.seed + self.epoch)
+        
+        order = random_state.permutation(len(self.captions_length)) if self.shuffle else np.arange(len(self.captions_length))
+        # Bucket by length, the stable sort keeps the rows of the same bucket shuffled.
+        order = order[np.argsort(self.captions_length[order], kind="stable")]
+        
+        batches = []
+        start = 0
+        while start < len(order):
+            # The rows are sorted by length, so the longest caption of the mini-batch is the last one.
+            end = start + 1
+            while end < len(order) and (end - start + 1) * self.captions_length[order[end]] <= self.max_tokens:
+                end += 1
+            batches.append(order[start:end].tolist())
+            start = end
+        
+        if self.shuffle:
+            random_state.shuffle(batches)
+        return batches
@@ -0,0 +1,273 @@
+# MIT License
+
+# Copyright (c) 2022 christiandimaio
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Typing trick for avoid circular import dependencies valid for python > 3.9
+# from __future__ import annotations
+# from typing import TYPE_CHECKING
+# if TYPE_CHECKING:
+#     from .Dataset import MyDataset
+#     from .Encoder.IEncoder import IEncoder
+
+import os
+import pickle
+import numpy as np
+import torch
+from PIL import Image
+from typing import List, Tuple
+
+class MemoryMappedStore():
+    """
+        A non-volatile store of fixed shape arrays, one for each image of the dataset, keyed by `image_name`.
+        
+        On disk the store is made of 2 files under `directory`:
+        
+            1) `<name>.npy`: A numpy array `(number_of_images, *row_shape)` opened as memory-mapped file.\n
+            2) `<name>_index.pickle`: The dictionary image_name -> row of the array.
+        
+        Assumption:
+        
+            1) The memory map is opened lazily, so every DataLoader worker has its own map and all of them share the page cache.
+    """
+    
+    def __init__(self, directory: str, name: str):
+        """Constructor of the store, nothing is read from the disk until the first access.
+
+        Args:
+            directory (str): 
+                The directory that contains the files of the store.
+                
+            name (str): 
+                The name of the store.
+        """
+        self.directory = directory
+        self.name = name
+        self._index = None
+        self._array = None
+    
+    @property
+    def array_path(self) -> str:
+        return f"{self.directory}/{self.name}.npy"
+    
+    @property
+    def index_path(self) -> str:
+        return f"{self.directory}/{self.name}_index.pickle"
+    
+    def exists(self) -> bool:
+        """Tell if the store is already present in non-volatile memory."""
+        return os.path.exists(self.array_path) and os.path.exists(self.index_path)
+    
+    def covers(self, images_names: List[str], row_shape: Tuple[int, ...]) -> bool:
+        """Tell if the store on disk already contains all the given images with the given shape.
+
+        Args:
+            images_names (List[str]): 
+                The images that we expect to find.
+                
+            row_shape (Tuple[int, ...]): 
+                The expected shape of a single row.
+
+        Returns:
+            bool: If True the store can be used as is, oth. it must be built again.
+        """
+        if not self.exists():
+            return False
+        if tuple(self.array.shape[1:]) != tuple(row_shape):
+            return False
+        return all(image_name in self.index for image_name in images_names)
+    
+    @property
+    def index(self) -> dict:
+        if self._index is None:
+            with open(self.index_path, 'rb') as index:
+                self._index = pickle.load(index)
+        return self._index
+    
+    @property
+    def array(self) -> np.ndarray:
+        if self._array is None:
+            # Q. Why copy-on-write (mode "c") instead of read-only?
+            # A. torch.from_numpy needs a writable array, "c" gives it without ever touching the file.
+            self._array = np.load(self.array_path, mmap_mode="c")
+        return self._array
+    
+    def _create(self, images_names: List[str], row_shape: Tuple[int, ...], dtype: np.dtype) -> np.ndarray:
+        """Create an empty store on disk, ready to be filled.
+
+        Args:
+            images_names (List[str]): 
+                The images that will be stored, the order defines the row of each image.
+                
+            row_shape (Tuple[int, ...]): 
+                The shape of a single row.
+                
+            dtype (np.dtype): 
+                The type of the array.
+
+        Returns:
+            (np.ndarray): `(len(images_names), *row_shape)`
+                The writable memory map.
+        """
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        
+        self._index = {image_name: row for row, image_name in enumerate(images_names)}
+        self._array = None
+        with open(self.index_path, 'wb') as index:
+            pickle.dump(self._index, index, protocol=pickle.HIGHEST_PROTOCOL)
+            
+        return np.lib.format.open_memmap(self.array_path, mode="w+", dtype=dtype, shape=(len(images_names), *row_shape))
+    
+    def get(self, image_name: str) -> torch.Tensor:
+        """Get the row associated to an image, as a tensor view of the memory map (zero-copy).
+
+        Args:
+            image_name (str): 
+                The name of the image.
+
+        Returns:
+            (torch.Tensor): `(*row_shape)`
+                The row associated to the image.
+        """
+        return torch.from_numpy(self.array[self.index[image_name]])
+    
+    def __contains__(self, image_name: str) -> bool:
+        return image_name in self.index
+    
+    def __len__(self) -> int:
+        return len(self.index)
+    
+    def __getstate__(self) -> dict:
+        # Avoid to send the memory map to the DataLoader workers, each of them will open its own.
+        state = self.__dict__.copy()
+        state["_array"] = None
+        return state
+    
+
+class FeaturesStore(MemoryMappedStore):
+    """
+        Store of the features produced by the frozen trunk of an encoder (See IEncoder.trunk).
+        
+        Since the trunk is frozen, each image is processed only once and the training reads the features from the store.
+            REMARK No random transformation can be applied to the images anymore.
+    """
+    
+    def __init__(self, directory: str, encoder_name: str):
+        """Constructor of the store
+
+        Args:
+            directory (str): 
+                The directory that contains the files of the store.
+                
+            encoder_name (str): 
+                The name of the encoder, stores of different encoders can live in the same directory.
+        """
+        super(FeaturesStore, self).__init__(directory, f"features_{encoder_name}")
+    
+    # For python > 3.9 -> def build(self, data_sets: List[MyDataset], encoder: IEncoder, batch_size: int = 32) -> bool:
+    def build(self, data_sets: List, encoder, batch_size: int = 32) -> bool:
+        """Run every image of the given datasets through the trunk of the encoder and store the result.
+            If the store on disk already contains every image, nothing is done.
+
+        Args:
+            data_sets (List[MyDataset]): 
+                The datasets whose images have to be stored.
+                
+            encoder (IEncoder): 
+                The encoder that provides the trunk.
+                
+            batch_size (int, optional): Defaults to 32.
+                How many images are fed to the trunk at once.
+
+        Returns:
+            bool: If True the store was built, False if it was already available.
+        """
+        images_names = []
+        for data_set in data_sets:
+            images_names += data_set.get_all_distinct_images_in_dataset()
+        images_names = sorted(set(images_names))
+        
+        if self.covers(images_names, encoder.trunk_output_shape):
+            return False
+        
+        features = self._create(images_names, encoder.trunk_output_shape, np.float32)
+        
+        _training = encoder.training
+        encoder.eval()
+        with torch.inference_mode():
+            for start in range(0, len(images_names), batch_size):
+                images = torch.stack([data_sets[0].image_to_tensor(data_sets[0].load_image(image_name)) for image_name in images_names[start:start+batch_size]], 0) # Out: (batch_dim, channels, height, width)
+                features[start:start+images.shape[0]] = encoder.trunk(images.to(encoder.device)).cpu().numpy() # Out: (batch_dim, *trunk_output_shape)
+        encoder.train(_training)
+        
+        features.flush()
+        del features
+        return True
+
+
+class ImagesStore(MemoryMappedStore):
+    """
+        Store of the images of the dataset, already decoded and resized, as `(height, width, channels)` uint8 arrays.
+        
+        Reading a sample becomes a copy from the page cache instead of a jpeg decoding plus a resize.
+    """
+    
+    def __init__(self, directory: str, size: int = 224):
+        """Constructor of the store
+
+        Args:
+            directory (str): 
+                The directory that contains the files of the store.
+                
+            size (int, optional): Defaults to 224.
+                The size of the (squared) stored images.
+        """
+        super(ImagesStore, self).__init__(directory, f"images_{size}")
+        self.size = size
+    
+    # For python > 3.9 -> def build(self, data_sets: List[MyDataset]) -> bool:
+    def build(self, data_sets: List) -> bool:
+        """Decode and resize every image of the given datasets and store the result.
+            If the store on disk already contains every image, nothing is done.
+
+        Args:
+            data_sets (List[MyDataset]): 
+                The datasets whose images have to be stored.
+
+        Returns:
+            bool: If True the store was built, False if it was already available.
+        """
+        images_names = []
+        for data_set in data_sets:
+            images_names += data_set.get_all_distinct_images_in_dataset()
+        images_names = sorted(set(images_names))
+        
+        if self.covers(images_names, (self.size, self.size, 3)):
+            return False
+        
+        images = self._create(images_names, (self.size, self.size, 3), np.uint8)
+        
+        for row, image_name in enumerate(images_names):
+            images[row] = np.asarray(data_sets[0].load_image(image_name).resize((self.size, self.size), Image.BILINEAR), dtype=np.uint8) # Out: (height, width, channels)
+        
+        images.flush()
+        del images
+        return True
@@ -27,8 +27,10 @@
 #     from .Dataset import MyDataset
     
 import torch
-from typing import List
+import numpy as np
+from typing import List, Tuple
 import os
+import json
 import pickle
 
 class Vocabulary():
@@ -44,37 +46,75 @@ class Vocabulary():
                 <UNK>: Out of vocabulary word ------> ID: 3\n
 
                 Example: <START> I Love Pizza <END> <PAD> <PAD> -> Translate into ids -> 1 243 5343 645655 2 0 0 
+                
+            2) The vocabulary is stored in the directory .saved as:\n
+                vocabulary.npy: structured array (word, count) of the IDs, it is loaded memory-mapped.\n
+                vocabulary.json: the metadata, the version of the format included.
     """
     
+    # Version of the file format, increment it if the content of the files changes.
+    VERSION = 1
     
-    def __init__(self, source_dataset = None): # for python > 3.9 -> def __init__(self, source_dataset: MyDataset):
+    def __init__(self, source_dataset = None, min_count: int = 1, max_size: int = None, directory: str = ".saved"): # for python > 3.9 -> def __init__(self, source_dataset: MyDataset, min_count: int = 1, max_size: int = None, directory: str = ".saved"):
         """Vocabulary constructor
+            The words are sorted by frequency (descending order), the most frequent word has ID 4.
 
         Args:
             source_dataset (MyDataset): 
-                The source Dataset, if None try to load a vocabulary from the hidden .saved folder
+                The source Dataset, if None try to load a vocabulary from the directory.
+                
+            min_count (int, optional): Default is 1.
+                The words that appear less than min_count times in the dataset are left out, they become <UNK>.
+                
+            max_size (int, optional): Default is None.
+                If not None, only the max_size most frequent words are kept (4 Flavored Token excluded), the others become <UNK>.
+                
+            directory (str, optional): Default is ".saved".
+                The directory where the vocabulary is stored.
+        
+        Raises:
+            FileNotFoundError: if the loading from file is requested but the vocabulary doesn't exist.
+            ValueError: if the vocabulary file has a version not supported.
         """
+        self.directory = directory
+        
+        # One-hot embeddings, materialised at the first access (See embeddings).
+        self._embeddings = None
         
         if source_dataset is None:
             print("Try to load the vocabulary from file..")
             
-            if not os.path.exists(".saved/word2id.pickle") or not os.path.exists(".saved/embeddings.pickle"):
+            if os.path.exists(f"{directory}/vocabulary.json"):
+                self.__load()
+            elif os.path.exists(f"{directory}/word2id.pickle"):
+                self.__load_legacy()
+            else:
                 raise FileNotFoundError("You request a loading from file but the file doesn't exist, first generate the vocabulary!")
             
-            with open('.saved/word2id.pickle', 'rb') as word2id, open('.saved/embeddings.pickle', 'rb') as embeddings:
-                self.word2id = pickle.load(word2id)
-                self.embeddings = pickle.load(embeddings)
-                self.dictionary_length = len(self.word2id.keys())
-                return 
+            self.dictionary_length = len(self.id2word)
+            self.word2id = {word: idx for idx, word in enumerate(self.id2word.tolist())}
+            return 
+        
+        # Load for the 1st time all the possible words from the dataset, with their frequency
+        dataset_words, dataset_counts = source_dataset.get_words_frequency()
         
-        # Load for the 1st time all the possible words from the dataset
-        dataset_words = source_dataset.get_all_distinct_words_in_dataset()
+        # Sort by frequency, the words with the same frequency keep the order of appearance
+        order = np.argsort(-dataset_counts, kind="stable")
+        order = order[dataset_counts[order] >= min_count]
+        if max_size is not None:
+            order = order[:max_size]
+        dataset_words = [dataset_words[idx] for idx in order]
+        
+        # Occurrences of each ID: <START> and <END> appear once per caption, the words left out are <UNK>.
+        self.counts = np.zeros(len(dataset_words)+4, dtype=np.int64)
+        self.counts[1] = self.counts[2] = len(source_dataset)
+        self.counts[3] = dataset_counts.sum() - dataset_counts[order].sum()
+        self.counts[4:] = dataset_counts[order]
         
         # Dictionary length 
         self.dictionary_length = len(dataset_words)+4 # Dictionary word + 4 Flavored Token (PAD + START + END + UNK)
         
         self.word2id = {}
-        self.embeddings = torch.zeros((self.dictionary_length, self.dictionary_length))  # DIM1: dict rows + 4 flavored token (PAD + START + END + UNK) | DIM2: Dict Rows +4 flavored token (PAD + START + END + UNK) as 1-hot
         
         # Initialize the token:
         # <PAD>, <START>, <END>, <UNK>
@@ -88,12 +128,103 @@ class Vocabulary():
             self.word2id[word] = counter
             counter += 1
         
-        # Identiry matrix == 1-hot vector :)
-        self.embeddings = torch.eye(self.dictionary_length)
+        # The word of each id, the ids are given in order of insertion.
+        self.id2word = np.array(list(self.word2id.keys()), dtype=str)
+        
+        self.save()
+    
+    @property
+    def embeddings(self) -> torch.Tensor:
+        """The 1-hot representation of each word, it is built only when requested.
+
+        Returns:
+            (torch.Tensor): `(dictionary_length, dictionary_length)`
+                Identiry matrix == 1-hot vector :)
+        """
+        if self._embeddings is None:
+            self._embeddings = torch.eye(self.dictionary_length)
+        return self._embeddings
+    
+    def load_pretrained_embeddings(self, file_path: str, embedding_dim: int) -> Tuple[torch.Tensor, int]:
+        """Load the embeddings of the words of the vocabulary from a text file of pretrained vectors (GloVe / word2vec text format).
+            Each line of the file is: word v_1 v_2 ... v_embedding_dim\n
+            The lines with a different number of values (Ex. the header of word2vec) are skipped.
+
+        Args:
+            file_path (str): 
+                The path of the file.
+            embedding_dim (int): 
+                The number of values of each vector.
 
-        with open('.saved/word2id.pickle', 'wb') as word2id, open('.saved/embeddings.pickle', 'wb') as embeddings:
-            pickle.dump(self.word2id, word2id, protocol=pickle.HIGHEST_PROTOCOL)
-            pickle.dump(self.embeddings, embeddings, protocol=pickle.HIGHEST_PROTOCOL)
+        Raises:
+            FileNotFoundError: if the file doesn't exist.
+
+        Returns:
+            (Tuple[torch.Tensor, int]): [`(dictionary_length, embedding_dim)`, `(1)`]
+                The embedding of each ID and the number of words found in the file.
+                    REMARK The words not found are initialized from N(0,1) as nn.Embedding does, <PAD> is all zeros.
+        """
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"{file_path} not Exist!")
+        
+        weights = torch.randn(self.dictionary_length, embedding_dim)
+        found = np.zeros(self.dictionary_length, dtype=bool)
+        
+        with open(file_path, "r", encoding="utf-8") as file:
+            for line in file:
+                values = line.rstrip().split(" ")
+                idx = self.word2id.get(values[0])
+                if idx is None or len(values) != embedding_dim + 1:
+                    continue
+                weights[idx] = torch.tensor([float(value) for value in values[1:]])
+                found[idx] = True
+        
+        weights[self.word2id["<PAD>"]] = 0.
+        return weights, int(found.sum())
+    
+    def save(self):
+        """Store the vocabulary in its directory.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        
+        _vocabulary = np.zeros(self.dictionary_length, dtype=[("word", self.id2word.dtype), ("count", np.int64)])
+        _vocabulary["word"] = self.id2word
+        _vocabulary["count"] = self.counts
+        np.save(f"{self.directory}/vocabulary.npy", _vocabulary)
+        
+        # The metadata are written last: the vocabulary exists only if they exist.
+        with open(f"{self.directory}/vocabulary.json", "w", encoding="utf-8") as metadata:
+            json.dump({"version": Vocabulary.VERSION, "dictionary_length": self.dictionary_length, "predefined_token_idx": self.predefined_token_idx()}, metadata)
+    
+    def __load(self):
+        """Load the vocabulary stored by save, the words and the counts are memory-mapped.
+        
+        Raises:
+            ValueError: if the vocabulary file has a version not supported.
+        """
+        with open(f"{self.directory}/vocabulary.json", "r", encoding="utf-8") as metadata:
+            metadata = json.load(metadata)
+        
+        if metadata["version"] > Vocabulary.VERSION:
+            raise ValueError(f"The vocabulary has version {metadata['version']}, the maximum supported is {Vocabulary.VERSION}!")
+        
+        _vocabulary = np.load(f"{self.directory}/vocabulary.npy", mmap_mode="r")
+        self.id2word = _vocabulary["word"]
+        self.counts = _vocabulary["count"]
+    
+    def __load_legacy(self):
+        """Load a vocabulary stored as pickle files, before the introduction of the versioned format.
+            The embeddings stored with it are never read, they are the identity matrix.
+        """
+        with open(f"{self.directory}/word2id.pickle", "rb") as word2id:
+            # The word of each id, the ids are given in order of insertion.
+            self.id2word = np.array(list(pickle.load(word2id).keys()), dtype=str)
+        
+        # The counts are not available for the vocabulary generated before they were introduced.
+        self.counts = None
+        if os.path.exists(f"{self.directory}/counts.pickle"):
+            with open(f"{self.directory}/counts.pickle", "rb") as counts:
+                self.counts = pickle.load(counts)
             
     def predefined_token_idx(self) -> dict:
         """Return the predefined token indexes.
@@ -125,28 +256,43 @@ class Vocabulary():
                 `else`: <1> + ...Caption...
         """
         
-        # Initialize the translator
+        # Evaluate all the word into the caption and translate it to an id, <UNK> if it is not in the vocabulary.
+        unknown = self.word2id["<UNK>"]
+        _sequence = [self.word2id["<START>"]] + [self.word2id.get(word.lower(), unknown) for word in word_sequence]
         
-        if type == "uncomplete":
-            _sequence = torch.zeros(len(word_sequence)+1, dtype=torch.int32) # <START> + ...Caption...
-            
         if type == "complete":
-            _sequence = torch.zeros(len(word_sequence)+2, dtype=torch.int32) # <START> + ...Caption... + <END> 
-            _sequence[-1] = self.word2id["<END>"]
+            _sequence.append(self.word2id["<END>"])
+        
+        return torch.tensor(_sequence, dtype=torch.int32)
+    
+    def translate_batch(self, word_sequences: List[List[str]], type: str = "complete") -> Tuple[torch.Tensor, torch.Tensor]:
+        """Given a batch of sequences of words, translate them into a padded tensor of ids according to the vocabulary.
+
+        Args:
+            word_sequences (List[List[str]]): 
+                The sequences of words to translate.
             
-        _sequence[0] = self.word2id["<START>"]
+            type (str, optional): Default is complete
+                The type of translation, see translate.
+
+        Returns:
+            (Tuple[torch.Tensor, torch.Tensor]): [`(batch_dim, max_caption_length)`, `(batch_dim)`]
+                The captions in IDs form padded with <PAD> and the length of each caption (<START> and <END> included).
+        """
+        unknown = self.word2id["<UNK>"]
+        extra_tokens = 2 if type == "complete" else 1
+        lengths = np.array([len(word_sequence) + extra_tokens for word_sequence in word_sequences], dtype=np.int32) # Out: (batch_dim)
         
-        counter = 1 # Always skip <START> 
+        _sequences = np.full((len(word_sequences), lengths.max()), self.word2id["<PAD>"], dtype=np.int64) # Out: (batch_dim, max_caption_length)
+        _sequences[:, 0] = self.word2id["<START>"]
+        if type == "complete":
+            _sequences[np.arange(len(word_sequences)), lengths - 1] = self.word2id["<END>"]
         
-        # Evaluate all the word into the caption and translate it to an embeddings
-        for word in word_sequence:
-            if word.lower() in self.word2id.keys():
-                _sequence[counter] = self.word2id[word.lower()]
-            else:
-                _sequence[counter] = self.word2id["<UNK>"]
-            counter += 1
+        # All the words of the batch are translated at once and scattered in their position, after <START>.
+        _positions = np.arange(_sequences.shape[1])
+        _sequences[(_positions >= 1) & (_positions < (lengths - extra_tokens + 1)[:, None])] = [self.word2id.get(word.lower(), unknown) for word_sequence in word_sequences for word in word_sequence]
         
-        return _sequence
+        return torch.from_numpy(_sequences), torch.from_numpy(lengths)
     
     def rev_translate(self, words_id : torch.tensor) -> List[str]:
         """Given a sequence of word, translate into id list according to the vocabulary.
@@ -158,7 +304,30 @@ class Vocabulary():
             (List(str)):
                 The caption in words form.
         """
-        return [list(self.word2id.keys())[idx] for idx in words_id[:].tolist()]   # word_id (1,caption_length)
+        return self.id2word[np.asarray(words_id.cpu())].tolist()   # word_id (1,caption_length)
+    
+    def rev_translate_batch(self, words_ids: torch.Tensor) -> List[List[str]]:
+        """Given a batch of sequences of IDs, translate them into words according to the vocabulary.
+            Each sequence is trimmed at the first <END> (or <PAD>), the <START> at the beginning is removed.
+
+        Args:
+            words_ids (torch.Tensor): `(batch_dim, caption_length)`
+                The sequences of IDs.
+
+        Returns:
+            (List[List[str]]): 
+                The words of each caption.
+        """
+        words_ids = np.asarray(words_ids.cpu())
+        
+        # The caption ends at the first <END> or <PAD>, if any.
+        _stop = (words_ids == self.word2id["<END>"]) | (words_ids == self.word2id["<PAD>"])
+        _stop[:, 0] = False
+        lengths = np.where(_stop.any(axis=1), _stop.argmax(axis=1), words_ids.shape[1]) # Out: (batch_dim)
+        starts = (words_ids[:, 0] == self.word2id["<START>"]).astype(np.int64) # Out: (batch_dim)
+        
+        words = self.id2word[words_ids] # Out: (batch_dim, caption_length)
+        return [words[idx, starts[idx]:lengths[idx]].tolist() for idx in range(words.shape[0])]
     
     
     def __len__(self):
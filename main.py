@@ -24,9 +24,14 @@ from torch.utils.data import DataLoader
 from NeuralModels.FactoryModels import *
 from NeuralModels.Dataset import MyDataset
 from NeuralModels.Vocabulary import Vocabulary
+from NeuralModels.Storage import FeaturesStore, ImagesStore
+from NeuralModels.Sampler import ImageGroupedBatchSampler, TokenBudgetBatchSampler
+from NeuralModels.Export import ScriptedCaptioner
+from NeuralModels.OnnxCaptioner import OnnxCaptioner
 import argparse
 import sys, os
 from PIL import Image
+import numpy as np
 
 def parse_command_line_arguments():
 
@@ -35,8 +40,8 @@ def parse_command_line_arguments():
     parser.add_argument('decoder', type=Decoder.argparse, choices=list(Decoder),
                         help="What type of decoder do you want use?")
     
-    parser.add_argument('mode', choices=['train', 'eval'],
-                        help='train or evaluate C[aA]RNet.')
+    parser.add_argument('mode', choices=['train', 'eval', 'export', 'quantize'],
+                        help='train, evaluate, export (TorchScript) or quantize (int8) C[aA]RNet.')
     
     parser.add_argument('encoder_dim', type=int,
                         help = 'Size of the encoder output. IF Attention is True, fixed at 2048. IF CaRNetvI as net, encoder_dim == |vocabulary|.')
@@ -74,6 +79,57 @@ def parse_command_line_arguments():
     
     parser.add_argument('--device', default='cpu', type=str,
                         help='device to be used for computations (in {cpu, cuda:0, cuda:1, ...}, default: cpu)')
+    
+    parser.add_argument('--features_cache', type=str, default="",
+                        help='Directory of the memory-mapped store of the encoder features. If provided, the frozen ResNet50 runs once for each image and the training reads the features from the store, no random flip is applied. Used only if mode = train (default: "")')
+    
+    parser.add_argument('--images_cache', type=str, default="",
+                        help='Directory of the memory-mapped store of the images, already decoded and resized. If provided, the images are decoded only once. Used only if mode = train (default: "")')
+    
+    parser.add_argument('--group_by_image', action='store_true',
+                        help='Pack all the captions of an image in the same mini-batch, so each image is loaded and encoded once. batch_size becomes the maximum number of captions. Used only if mode = train (default: False)')
+    
+    parser.add_argument('--max_tokens', type=int, default=0,
+                        help='If greater than 0, the captions are bucketed by length and each mini-batch is filled up to this number of tokens (padding included) instead of batch_size. Used only if mode = train (default: 0)')
+    
+    parser.add_argument('--embedding_dim', type=int, default=0,
+                        help='Dimension of the embedding of the words, it is also the encoder_dim for RNetvI. 0 means the size of the vocabulary (1-hot sized). (default: 0)')
+    
+    parser.add_argument('--embeddings_file', type=str, default="",
+                        help='Text file of pretrained word vectors (GloVe format) used to initialize the embedding of the words of a new net. (default: "")')
+    
+    parser.add_argument('--min_count', type=int, default=1,
+                        help='Minimum number of occurrences of a word for being in the vocabulary, the others are <UNK>. (default: 1)')
+    
+    parser.add_argument('--max_vocab_size', type=int, default=0,
+                        help='Maximum number of words in the vocabulary (the most frequent), 0 means no limit. (default: 0)')
+    
+    parser.add_argument('--beam_size', type=int, default=1,
+                        help='Number of beams used for generate the captions, 1 means greedy decoding. (default: 1)')
+    
+    parser.add_argument('--output', type=Output.argparse, choices=list(Output), default=Output.Linear,
+                        help='Output layer of the decoder: Linear (full softmax) or Adaptive (adaptive softmax, clusters of the vocabulary by frequency). (default: Linear)')
+    
+    parser.add_argument('--backend', choices=['eager', 'torchscript', 'onnx'], default='eager',
+                        help='How the caption is generated in evaluation: eager (the python net), torchscript or onnx (the artefact produced by the export mode, greedy decoding). (default: eager)')
+    
+    parser.add_argument('--export_format', choices=['torchscript', 'onnx'], default='torchscript',
+                        help='Format of the artefact produced by the export mode. (default: torchscript)')
+    
+    parser.add_argument('--quantize', choices=['none', 'int8'], default='none',
+                        help='Use the int8 quantized net (cpu only) produced by the quantize mode. Used only if mode = eval, with the eager backend (default: none)')
+    
+    parser.add_argument('--quantize_trunk', action='store_true',
+                        help='Quantize also the ResNet50 trunk (static quantization, calibrated on calibration_size images of the train set). It must be the same in quantize and eval mode. (default: False)')
+    
+    parser.add_argument('--calibration_size', type=int, default=256,
+                        help='Number of images used for calibrate the quantized trunk. Used only if mode = quantize (default: 256)')
+    
+    parser.add_argument('--precision', choices=['fp32', 'bf16', 'fp16'], default='fp32',
+                        help='Precision of the forward in training: fp32, or bf16/fp16 mixed precision (autocast), the loss, the gradients and the weights stay in float32. fp16 uses loss scaling. Used only if mode = train (default: fp32)')
+    
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the split of the dataset and of the shuffle of the batch samplers, the order of the mini-batches is deterministic for a given seed. (default: 0)')
 
     parsed_arguments = parser.parse_args()
 
@@ -114,31 +170,83 @@ if __name__ == "__main__":
         print("OK.")
         
         print("Define vocabulary..")
-        vocabulary = Vocabulary(dataset)
+        vocabulary = Vocabulary(dataset, min_count=args.min_count, max_size=args.max_vocab_size if args.max_vocab_size > 0 else None)
+        print("OK.")
+        
+        print("Encode the captions..")
+        dataset.encode(vocabulary)
         print("OK.")
         
         # Obtain train, validation and test set
+        # Each set is a fixed range of rows, the seed makes also their order reproducible (See MyDataset.get_fraction_of_dataset). The quantize mode uses the same split.
         print("Obtain train, validation and test set..")
+        np.random.seed(args.seed)
         train_set = dataset.get_fraction_of_dataset(percentage=args.splits[0], delete_transfered_from_source=True)
         validation_set = dataset.get_fraction_of_dataset(percentage=args.splits[1], delete_transfered_from_source=True)
         test_set  = dataset.get_fraction_of_dataset(percentage=args.splits[2], delete_transfered_from_source=True)
         print("OK.")
         
+        if args.images_cache != "":
+            print("Pack the images..")
+            images_store = ImagesStore(args.images_cache, MyDataset.image_trasformation_parameter["crop"]["size"])
+            print("Built." if images_store.build([train_set, validation_set, test_set]) else "Already available.")
+            for _set in [train_set, validation_set, test_set]:
+                _set.set_images_store(images_store)
+            print("OK.")
+        
         # Define the associate dataloader
         print("Define the associate dataloader")
-        dataloader_training = DataLoader(train_set, batch_size=args.batch_size,
-                        shuffle=True, num_workers=args.workers, collate_fn = lambda data: dataset.pack_minibatch_training(data,vocabulary))
+        if args.group_by_image and args.max_tokens > 0:
+            raise ValueError("--group_by_image and --max_tokens can't be used together.")
+        if args.group_by_image:
+            dataloader_training = DataLoader(train_set, batch_sampler=ImageGroupedBatchSampler(train_set, args.batch_size, shuffle=True, seed=args.seed),
+                            num_workers=args.workers, collate_fn = lambda data: dataset.pack_minibatch_training(data,vocabulary,group_by_image=True))
+        elif args.max_tokens > 0:
+            dataloader_training = DataLoader(train_set, batch_sampler=TokenBudgetBatchSampler(train_set, args.max_tokens, shuffle=True, seed=args.seed),
+                            num_workers=args.workers, collate_fn = lambda data: dataset.pack_minibatch_training(data,vocabulary))
+        else:
+            dataloader_training = DataLoader(train_set, batch_size=args.batch_size,
+                            shuffle=True, num_workers=args.workers, collate_fn = lambda data: dataset.pack_minibatch_training(data,vocabulary))
         dataloader_validation = DataLoader(validation_set, batch_size=args.batch_size,
                         shuffle=True, num_workers=args.workers, collate_fn = lambda data: dataset.pack_minibatch_evaluation(data,vocabulary))
         dataloader_test = DataLoader(test_set, batch_size=args.batch_size,
                         shuffle=True, num_workers=args.workers, collate_fn = lambda data: dataset.pack_minibatch_evaluation(data,vocabulary))
         print("OK.")
         
-    if args.mode == "eval":
+    if args.mode == "quantize":
+        print("Define dataset..")
+        dataset = MyDataset(args.dataset_folder, percentage=8)
+        print("OK.")
+        
+        # The vocabulary must be the one of the trained net
+        print("Define vocabulary..")
+        vocabulary = Vocabulary()
+        print("OK.")
+        
+        print("Encode the captions..")
+        dataset.encode(vocabulary)
+        print("OK.")
+        
+        # Same split of the training (with the same --seed): the test set has never been seen by the net.
+        print("Obtain the calibration and the test set..")
+        np.random.seed(args.seed)
+        train_set = dataset.get_fraction_of_dataset(percentage=args.splits[0], delete_transfered_from_source=True)
+        _ = dataset.get_fraction_of_dataset(percentage=args.splits[1], delete_transfered_from_source=True)
+        test_set  = dataset.get_fraction_of_dataset(percentage=args.splits[2], delete_transfered_from_source=True)
+        print("OK.")
+        
+        dataloader_calibration = DataLoader(train_set, batch_size=args.batch_size,
+                        shuffle=True, num_workers=args.workers, collate_fn = lambda data: dataset.pack_minibatch_evaluation(data,vocabulary))
+        # No shuffle: the float and the quantized net are evaluated on the same mini-batches.
+        dataloader_test = DataLoader(test_set, batch_size=args.batch_size,
+                        shuffle=False, num_workers=args.workers, collate_fn = lambda data: dataset.pack_minibatch_evaluation(data,vocabulary))
+    
+    if args.mode == "eval" or args.mode == "export":
         print("Define vocabulary..")
         vocabulary = Vocabulary()
         print("Ok.")
 
+    if args.mode == "eval":
         print("Load the image..")
         if not os.path.exists(args.image_path) or os.path.isdir(args.image_path):
             raise ValueError(f"Got {args.image_path} as file path, error!")
@@ -148,22 +256,36 @@ if __name__ == "__main__":
     
     #################################### Define Net
     print("Create the net..")
+    # Legacy: if not given, the embedding is as big as the vocabulary.
+    embedding_dim = args.embedding_dim if args.embedding_dim > 0 else len(vocabulary)
     net = FactoryNeuralNet(NeuralNet.CaRNet)(
         encoder=encoder,
         decoder=decoder,
         attention=attention, # != None only if Attention is requested
         attention_dim = args.attention_dim, # != 0 only if Attention is True
         net_name=args.net_name,
-        encoder_dim = args.encoder_dim if args.decoder is not Decoder.RNetvI else vocabulary.embeddings.shape[1], # if Attention is True encoder_dim hasn't any meaning, cause it is 2048 internally by construction.
+        encoder_dim = args.encoder_dim if args.decoder is not Decoder.RNetvI else embedding_dim, # if Attention is True encoder_dim hasn't any meaning, cause it is 2048 internally by construction.
         hidden_dim= args.hidden_dim,
         padding_index= vocabulary.predefined_token_idx()["<PAD>"],
         vocab_size= len(vocabulary.word2id.keys()),
-        embedding_dim = vocabulary.embeddings.shape[1],
-        device=args.device
+        embedding_dim = embedding_dim,
+        device=args.device,
+        beam_size=args.beam_size,
+        output=FactoryOutput(args.output),
+        words_counts=vocabulary.counts
     )
     print("OK.")
     #################################### Load a previous trained net, if exist
     
+    if args.quantize != "none" and (args.mode != "eval" or args.backend != "eager"):
+        raise ValueError("--quantize is used only in eval mode with the eager backend, the quantize mode produces the quantized net.")
+    
+    if args.quantize == "int8":
+        # The structure of the net is quantized before loading the quantized checkpoint
+        print("Quantize the net..")
+        net.quantize(trunk=args.quantize_trunk)
+        print("OK.")
+    
     print("Check if it is present a previous version of the Net..")
     try:
         net.load("./.saved")
@@ -171,12 +293,28 @@ if __name__ == "__main__":
     except Exception as ex:
         print("An exception has occurred.")
         print(ex)
-        if args.mode == "eval": # If the mode is eval the script cannot continue
-            print("Since you want an evaluation, the script cannot continue, please retrain the network.")
+        if args.mode != "train": # If the mode is eval or export the script cannot continue
+            print("Since you want an evaluation, an export or a quantization, the script cannot continue, please retrain (or quantize) the network.")
             sys.exit(0)
         # In training it creates new files.
         print("Not Found.")
         print("Since the selected mode is training, a new instance of the net will saved during the training activity.")
+        
+        if args.embeddings_file != "":
+            print("Load the pretrained embeddings of the words..")
+            weights, found = vocabulary.load_pretrained_embeddings(args.embeddings_file, embedding_dim)
+            net.set_words_embedding(weights)
+            print(f"Found {found}/{len(vocabulary)} words.")
+    
+    #################################### Extract the features of the frozen encoder, if requested
+    
+    if args.mode == "train" and args.features_cache != "":
+        print("Extract the features of the images..")
+        features_store = FeaturesStore(args.features_cache, type(net.C).__name__)
+        print("Built." if features_store.build([train_set, validation_set, test_set], net.C, args.batch_size) else "Already available.")
+        for _set in [train_set, validation_set, test_set]:
+            _set.set_features_store(features_store)
+        print("OK.")
     
     #################################### Training or Evaluate
     
@@ -187,7 +325,8 @@ if __name__ == "__main__":
                 validation_set=dataloader_validation,
                 lr=args.lr,
                 epochs=args.epochs,
-                vocabulary=vocabulary
+                vocabulary=vocabulary,
+                precision=args.precision
             )
         # Evaluate Test set
         print("Done")
@@ -195,6 +334,42 @@ if __name__ == "__main__":
         
     if args.mode == "eval":
         print("Start evaluation..")
-        net.eval(image, vocabulary)
+        if args.backend == "torchscript":
+            captioner = ScriptedCaptioner(net.export_path("./.saved"), device=args.device)
+            print(captioner.caption([image])[0])
+        elif args.backend == "onnx":
+            captioner = OnnxCaptioner(net.export_path("./.saved", "onnx"))
+            print(captioner.caption([image])[0])
+        else:
+            net.eval(image, vocabulary)
+        print("OK.")
+    
+    if args.mode == "quantize":
+        print("Evaluate the float net..")
+        float_accuracy = float(net.eval_net(dataloader_test, vocabulary))
+        print("OK.")
+        
+        print("Quantize the net..")
+        calibration = None
+        if args.quantize_trunk:
+            # calibration_size random images of the train set
+            calibration, calibration_images = [], 0
+            for images, _, _ in dataloader_calibration:
+                calibration.append(images[:args.calibration_size - calibration_images])
+                calibration_images += calibration[-1].shape[0]
+                if calibration_images >= args.calibration_size:
+                    break
+        print(f"Quantized ({net.quantize(trunk=args.quantize_trunk, calibration=calibration)}).")
+        
+        print("Evaluate the quantized net..")
+        quantized_accuracy = float(net.eval_net(dataloader_test, vocabulary))
+        print("OK.")
+        print(f"Test set Accuracy ({len(test_set)} captions, the split of the training): float={float_accuracy:.4f}, int8={quantized_accuracy:.4f}, delta={quantized_accuracy - float_accuracy:+.4f}")
+        
+        print("Saved." if net.save("./.saved") else "Not saved.")
+    
+    if args.mode == "export":
+        print("Export the net..")
+        print(f"Exported in {net.export('./.saved', vocabulary, args.export_format)}.")
         print("OK.")
     ####################################
\ No newline at end of file
@@ -0,0 +1,65 @@
+# MIT License
+
+# Copyright (c) 2022 christiandimaio
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import numpy as np
+import torch
+
+from NeuralModels.Output.AdaptiveOutput import AdaptiveOutput
+
+# <PAD>, <START>, <END>, <UNK>, then the words sorted by frequency. <START> and <END> are counted once per caption.
+COUNTS = np.array([0, 100, 100, 0, 50, 30, 10, 5, 3, 2])
+
+
+def test_cutoffs_ignore_pad_and_start():
+    counts = COUNTS.copy()
+    counts[0] = 1000
+    counts.setflags(write=False)
+    
+    # The targets are 200: the head (IDs 0-5) covers 90% of them, the 1st cluster (IDs 6-8) up to 99%.
+    assert AdaptiveOutput.cutoffs_from_counts(len(counts), counts) == [6, 9]
+    # The counts are not modified
+    assert counts[0] == 1000 and counts[1] == 100
+
+
+def test_cutoffs_cover_the_targets():
+    counts = np.concatenate(([0, 5000, 5000, 700], np.sort(np.random.RandomState(0).zipf(1.5, 500))[::-1]))
+    targets = counts.copy()
+    targets[:2] = 0
+    
+    cutoffs = AdaptiveOutput.cutoffs_from_counts(len(counts), counts)
+    assert cutoffs == sorted(cutoffs) and 0 < cutoffs[0] and cutoffs[-1] < len(counts)
+    
+    # The head is the smallest one that covers 90% of the targets
+    assert targets[:cutoffs[0]].sum() >= 0.9 * targets.sum() > targets[:cutoffs[0] - 1].sum()
+
+
+def test_cutoffs_without_counts():
+    assert AdaptiveOutput.cutoffs_from_counts(1000) == [100, 500]
+
+
+def test_forward_is_a_distribution():
+    torch.manual_seed(0)
+    output = AdaptiveOutput(32, len(COUNTS), COUNTS)
+    log_probabilities = output(torch.randn((3, 5, 32)))
+    
+    assert log_probabilities.shape == (3, 5, len(COUNTS))
+    torch.testing.assert_close(log_probabilities.exp().sum(dim=-1), torch.ones((3, 5)))
@@ -0,0 +1,111 @@
+# MIT License
+
+# Copyright (c) 2022 christiandimaio
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import numpy as np
+import pytest
+import torch
+
+from NeuralModels.Decoder.BeamSearch import BeamSearch
+from NeuralModels.Decoder.GreedySearch import GreedySearch
+from NeuralModels.Decoder.RNetvI import RNetvI
+from NeuralModels.Decoder.RNetvH import RNetvH
+from NeuralModels.Decoder.RNetvHC import RNetvHC
+from NeuralModels.Output.AdaptiveOutput import AdaptiveOutput
+
+HIDDEN_DIM = 32
+VOCAB_SIZE = 50
+MAX_CAPTION_LENGTH = 12
+
+PAD, START, END, A, B = 0, 1, 2, 3, 4
+
+
+class TableDecoder():
+    """Decoder whose logits depend only on the tokens generated so far, read from a table. The state is the caption itself.
+        The vocabulary has 8 words, the missing ones have logit -50.
+    """
+    
+    def __init__(self, table):
+        self.table = table
+    
+    def init_state(self, images):
+        return (torch.full((images.shape[0], 0), START, dtype=torch.long),)
+    
+    def step(self, state, token_ids):
+        captions = torch.cat((state[0], token_ids.unsqueeze(1)), dim=1)
+        logits = torch.full((captions.shape[0], 8), -50.)
+        for i, caption in enumerate(captions.tolist()):
+            # The captions that are not in the table end
+            for token, logit in self.table.get(tuple(caption), {END: 0.}).items():
+                logits[i, token] = logit
+        return logits, (captions,)
+
+
+def decoder(decoder_class, output):
+    torch.manual_seed(0)
+    if output == "Adaptive":
+        output = AdaptiveOutput(HIDDEN_DIM, VOCAB_SIZE, np.arange(VOCAB_SIZE)[::-1] + 1)
+    else:
+        output = None
+    return decoder_class(HIDDEN_DIM, PAD, VOCAB_SIZE, HIDDEN_DIM, output=output).eval()
+
+
+@pytest.mark.parametrize("decoder_class", [RNetvI, RNetvH, RNetvHC])
+@pytest.mark.parametrize("output", ["Linear", "Adaptive"])
+def test_beam_size_1_is_greedy(decoder_class, output):
+    net = decoder(decoder_class, output)
+    images = torch.randn((8, HIDDEN_DIM), generator=torch.Generator().manual_seed(1))
+    
+    with torch.no_grad():
+        greedy = GreedySearch().search(net, images, MAX_CAPTION_LENGTH)
+    beam, _ = BeamSearch(beam_size=1).search(net, images, MAX_CAPTION_LENGTH)
+    
+    assert torch.equal(beam, greedy)
+
+
+def test_single_image_caption_ends_with_end():
+    net = decoder(RNetvH, "Linear")
+    # A <END> for free in the first steps, so some beams finish early.
+    net.linear_1.bias.data[END] += 4.
+    
+    for seed in range(5):
+        images = torch.randn((1, HIDDEN_DIM), generator=torch.Generator().manual_seed(seed))
+        caption, _ = BeamSearch(beam_size=3).search(net, images, MAX_CAPTION_LENGTH)
+        
+        assert caption[0, 0] == START
+        assert PAD not in caption[0].tolist()
+        assert caption[0, -1] == END or caption.shape[1] == MAX_CAPTION_LENGTH
+
+
+def test_ranking_by_normalized_score():
+    # <START> <END> has a better log probability than <START> A B at the 2nd step, with the raw ranking it takes its place in the beam.
+    # <START> A B <END> has the best normalized score, it survives only if the beams are ranked by the normalized score at each step.
+    # After <START> A A all the words have the same probability.
+    table = {
+        (START,): {END: -1.0, A: -0.5, B: -4.0},
+        (START, A): {A: -0.7, B: -0.9},
+        (START, A, A): {token: 0. for token in range(END, 8)},
+        (START, A, B): {END: 0.},
+    }
+    caption, score = BeamSearch(beam_size=2).search(TableDecoder(table), torch.zeros((1, 1)), MAX_CAPTION_LENGTH)
+    
+    assert caption.tolist() == [[START, A, B, END]]
+    assert score.shape == (1,)
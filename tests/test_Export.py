@@ -0,0 +1,109 @@
+# MIT License
+
+# Copyright (c) 2022 christiandimaio
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import torch
+import torch.nn as nn
+
+from NeuralModels.Attention.SoftAttention import SoftAttention
+from NeuralModels.Decoder.GreedySearch import GreedySearch
+from NeuralModels.Decoder.RNetvI import RNetvI
+from NeuralModels.Decoder.RNetvH import RNetvH
+from NeuralModels.Decoder.RNetvHC import RNetvHC
+from NeuralModels.Decoder.RNetvHCAttention import RNetvHCAttention
+from NeuralModels.Export import ScriptedCaptioner, export_torchscript
+from NeuralModels.Output.AdaptiveOutput import AdaptiveOutput
+
+HIDDEN_DIM = 16
+ENCODER_DIM = 24
+VOCAB_SIZE = 40
+MAX_CAPTION_LENGTH = 10
+
+
+class TinyEncoder(nn.Module):
+    """Stand-in of the ResNet50 encoders: a 1x1 convolution, then a vector for each image or a grid 7x7 of vectors for the attention."""
+    
+    def __init__(self, encoder_dim: int, attention: bool):
+        super(TinyEncoder, self).__init__()
+        self.convolution = nn.Conv2d(3, encoder_dim, 1)
+        self.pool = nn.AdaptiveAvgPool2d(7 if attention else 1)
+        self.attention = attention
+    
+    def forward(self, images: torch.Tensor) -> torch.Tensor:
+        features = self.pool(self.convolution(images)) # Out: (batch_dim, encoder_dim, H_portions, W_portions)
+        if self.attention:
+            return features.permute(0, 2, 3, 1) # Out: (batch_dim, H_portions, W_portions, encoder_dim)
+        return features.flatten(1) # Out: (batch_dim, encoder_dim)
+
+
+class FakeVocabulary():
+    id2word = np.array(["<PAD>", "<START>", "<END>", "<UNK>"] + [f"word{i}" for i in range(VOCAB_SIZE - 4)])
+    
+    def predefined_token_idx(self):
+        return {"<PAD>": 0, "<START>": 1, "<END>": 2, "<UNK>": 3}
+
+
+def net(decoder_class, output: str):
+    torch.manual_seed(0)
+    output = AdaptiveOutput(HIDDEN_DIM, VOCAB_SIZE, np.arange(VOCAB_SIZE)[::-1] + 1) if output == "Adaptive" else None
+    if decoder_class is RNetvHCAttention:
+        encoder = TinyEncoder(ENCODER_DIM, attention=True)
+        decoder = RNetvHCAttention(HIDDEN_DIM, 0, VOCAB_SIZE, HIDDEN_DIM, attention=SoftAttention(ENCODER_DIM, HIDDEN_DIM, 12), output=output)
+    else:
+        encoder = TinyEncoder(HIDDEN_DIM, attention=False)
+        decoder = decoder_class(HIDDEN_DIM, 0, VOCAB_SIZE, HIDDEN_DIM, output=output)
+    # A bias on <END>, so some captions end before MAX_CAPTION_LENGTH.
+    if output is None:
+        decoder.linear_1.bias.data[2] += 2.
+    return SimpleNamespace(C=encoder.eval(), R=decoder.eval(), name_net=decoder_class.__name__)
+
+
+@pytest.mark.parametrize("decoder_class", [RNetvI, RNetvH, RNetvHC, RNetvHCAttention])
+@pytest.mark.parametrize("output", ["Linear", "Adaptive"])
+def test_scripted_equals_eager(decoder_class, output, tmp_path):
+    _net = net(decoder_class, output)
+    images = torch.randn((6, 3, 14, 14), generator=torch.Generator().manual_seed(1))
+    
+    with torch.no_grad():
+        expected = GreedySearch().search(_net.R, _net.C(images), MAX_CAPTION_LENGTH)
+    
+    file_path = export_torchscript(_net, FakeVocabulary(), str(tmp_path / "net.pt"), 
+                                   {"crop": {"size": 14}, "mean": torch.zeros(3), "std_dev": torch.ones(3)}, MAX_CAPTION_LENGTH)
+    captions = ScriptedCaptioner(file_path).generate(images)
+    
+    assert torch.equal(captions, expected)
+
+
+def test_scripted_attention_without_projection():
+    torch.manual_seed(0)
+    attention = SoftAttention(ENCODER_DIM, HIDDEN_DIM, 12).eval()
+    scripted = torch.jit.script(attention)
+    images, hidden_states = torch.randn((2, 49, ENCODER_DIM)), torch.randn((2, HIDDEN_DIM))
+    
+    with torch.no_grad():
+        expected = attention(images, hidden_states)
+        for result in [scripted(images, hidden_states), scripted(images, hidden_states, attention.prepare(images))]:
+            for tensor, expected_tensor in zip(result, expected):
+                torch.testing.assert_close(tensor, expected_tensor)
@@ -0,0 +1,85 @@
+# MIT License
+
+# Copyright (c) 2022 christiandimaio
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import pytest
+import torch
+
+from NeuralModels.Decoder.RNetvI import RNetvI
+from NeuralModels.Decoder.RNetvH import RNetvH
+from NeuralModels.Decoder.RNetvHC import RNetvHC
+
+HIDDEN_DIM = 32
+VOCAB_SIZE = 50
+CAPTIONS_LENGTH = [9, 4, 7, 2, 9, 5]
+
+
+def step_by_step_hidden_states(decoder, images: torch.Tensor, captions: torch.Tensor, captions_length) -> torch.Tensor:
+    """The loop of the decoders before the fused LSTM: a LSTMCell call for each timestep over the whole batch, the padding is masked at the end."""
+    inputs = decoder.words_embedding(captions)
+    
+    if isinstance(decoder, RNetvI):
+        # The features vector is the input at t_{-1}
+        h, c = decoder.lstm_unit(images)
+    elif isinstance(decoder, RNetvH):
+        h, c = images, torch.zeros_like(images)
+    else:
+        h, c = images, images
+    
+    hiddens = []
+    for t in range(captions.shape[1]):
+        h, c = decoder.lstm_unit(inputs[:, t, :], (h, c))
+        hiddens.append(h)
+    hiddens = torch.stack(hiddens, dim=1)
+    
+    # The <END> token is never an input, the timesteps after it are ZEROS.
+    valid = torch.arange(captions.shape[1]).unsqueeze(0) < (torch.as_tensor(captions_length) - 1).unsqueeze(1)
+    return hiddens * valid.unsqueeze(2).to(hiddens.dtype)
+
+
+def batch(seed: int = 0):
+    generator = torch.Generator().manual_seed(seed)
+    images = torch.randn((len(CAPTIONS_LENGTH), HIDDEN_DIM), generator=generator)
+    captions = torch.randint(3, VOCAB_SIZE, (len(CAPTIONS_LENGTH), max(CAPTIONS_LENGTH)), generator=generator)
+    captions[:, 0] = 1
+    for i, length in enumerate(CAPTIONS_LENGTH):
+        captions[i, length - 1] = 2
+        captions[i, length:] = 0
+    return images, captions
+
+
+@pytest.mark.parametrize("decoder_class", [RNetvI, RNetvH, RNetvHC])
+@pytest.mark.parametrize("autocast", [False, True])
+def test_fused_lstm_matches_step_by_step(decoder_class, autocast):
+    torch.manual_seed(0)
+    decoder = decoder_class(HIDDEN_DIM, 0, VOCAB_SIZE, HIDDEN_DIM)
+    images, captions = batch()
+    
+    with torch.no_grad(), torch.autocast("cpu", dtype=torch.bfloat16, enabled=autocast):
+        hiddens, decode_lengths = decoder.hidden_states(images, captions, CAPTIONS_LENGTH)
+        expected = step_by_step_hidden_states(decoder, images, captions, CAPTIONS_LENGTH)
+    
+    assert decode_lengths.tolist() == [length - 1 for length in CAPTIONS_LENGTH]
+    assert hiddens.shape == expected.shape
+    assert hiddens.dtype == (torch.bfloat16 if autocast else torch.float32)
+    # bfloat16 keeps 8 bits of mantissa, the error of the two computations adds up over the timesteps.
+    tolerance = 2e-2 if autocast else 1e-5
+    torch.testing.assert_close(hiddens.float(), expected.float(), rtol=tolerance, atol=tolerance)
@@ -0,0 +1,81 @@
+# MIT License
+
+# Copyright (c) 2022 christiandimaio
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import pytest
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from NeuralModels.Loss import ChunkedCrossEntropy, ChunkedCrossEntropyLoss
+from NeuralModels.Output.LinearOutput import LinearOutput
+
+PAD = 0
+HIDDEN_DIM = 6
+VOCAB_SIZE = 37
+
+
+def inputs(dtype: torch.dtype = torch.float, bias: bool = True, seed: int = 0):
+    """Hidden states, weight and bias of the projection and targets, with some <PAD> among the targets."""
+    generator = torch.Generator().manual_seed(seed)
+    hiddens = torch.randn((20, HIDDEN_DIM), generator=generator, dtype=dtype, requires_grad=True)
+    weight = torch.randn((VOCAB_SIZE, HIDDEN_DIM), generator=generator, dtype=dtype, requires_grad=True)
+    bias = torch.randn(VOCAB_SIZE, generator=generator, dtype=dtype, requires_grad=True) if bias else None
+    targets = torch.randint(0, VOCAB_SIZE, (20,), generator=generator)
+    targets[::4] = PAD
+    return hiddens, weight, bias, targets
+
+
+# 5 and 8 don't divide the vocabulary size, the last slice is smaller.
+@pytest.mark.parametrize("chunk_size", [5, 8, VOCAB_SIZE, 4096])
+@pytest.mark.parametrize("bias", [True, False])
+def test_gradcheck(chunk_size, bias):
+    hiddens, weight, bias, targets = inputs(torch.double, bias)
+    
+    assert torch.autograd.gradcheck(lambda hiddens, weight, bias: ChunkedCrossEntropy.apply(hiddens, weight, bias, targets, chunk_size, PAD), 
+                                    (hiddens, weight, bias))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 8, VOCAB_SIZE, 4096])
+def test_equal_to_cross_entropy(chunk_size):
+    hiddens, weight, bias, targets = inputs()
+    
+    loss = ChunkedCrossEntropy.apply(hiddens, weight, bias, targets, chunk_size, PAD)
+    gradients = torch.autograd.grad(loss, (hiddens, weight, bias))
+    
+    expected_loss = F.cross_entropy(F.linear(hiddens, weight, bias), targets, ignore_index=PAD, reduction="sum")
+    expected_gradients = torch.autograd.grad(expected_loss, (hiddens, weight, bias))
+    
+    torch.testing.assert_close(loss, expected_loss)
+    for gradient, expected_gradient in zip(gradients, expected_gradients):
+        torch.testing.assert_close(gradient, expected_gradient)
+
+
+def test_module_and_output_layer():
+    hiddens, _, _, targets = inputs()
+    linear = nn.Linear(HIDDEN_DIM, VOCAB_SIZE)
+    
+    expected_loss = F.cross_entropy(linear(hiddens), targets, ignore_index=PAD, reduction="sum")
+    torch.testing.assert_close(ChunkedCrossEntropyLoss(chunk_size=8, ignore_index=PAD)(hiddens, linear, targets), expected_loss)
+    
+    # Without ignore_index every token counts, as in the training where the targets are packed (no <PAD>).
+    output = LinearOutput(HIDDEN_DIM, VOCAB_SIZE, chunk_size=8)
+    torch.testing.assert_close(output.loss(hiddens, targets), F.cross_entropy(output(hiddens), targets, reduction="sum"))
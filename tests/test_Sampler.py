@@ -0,0 +1,97 @@
+# MIT License
+
+# Copyright (c) 2022 christiandimaio
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import numpy as np
+
+from NeuralModels.Sampler import ImageGroupedBatchSampler, TokenBudgetBatchSampler
+
+
+class FakeDataset():
+    """Minimal dataset, the samplers need only the length of the captions and the image of each row."""
+    
+    def __init__(self, number_of_rows: int = 200, seed: int = 0):
+        random_state = np.random.RandomState(seed)
+        self.captions_length = random_state.randint(3, 20, size=number_of_rows).tolist()
+        self.image_ids = random_state.randint(0, number_of_rows // 5, size=number_of_rows)
+    
+    def get_captions_length(self):
+        return self.captions_length
+    
+    def get_images_groups(self):
+        return [np.flatnonzero(self.image_ids == image).tolist() for image in np.unique(self.image_ids)]
+
+
+def epochs(sampler, number_of_epochs: int):
+    return [list(sampler) for _ in range(number_of_epochs)]
+
+
+def test_token_budget_deterministic_by_seed_and_epoch():
+    data_set = FakeDataset()
+    
+    first = epochs(TokenBudgetBatchSampler(data_set, max_tokens=64, seed=3), 3)
+    second = epochs(TokenBudgetBatchSampler(data_set, max_tokens=64, seed=3), 3)
+    assert first == second
+    
+    # Each epoch has its own order, the rows are the same.
+    assert first[0] != first[1]
+    assert sorted(sum(first[0], [])) == sorted(sum(first[1], [])) == list(range(len(data_set.captions_length)))
+    
+    # set_epoch gives back the mini-batches of that epoch.
+    sampler = TokenBudgetBatchSampler(data_set, max_tokens=64, seed=3)
+    sampler.set_epoch(2)
+    assert list(sampler) == first[2]
+    
+    # Another seed, another order.
+    assert epochs(TokenBudgetBatchSampler(data_set, max_tokens=64, seed=4), 1)[0] != first[0]
+
+
+def test_token_budget_respects_max_tokens():
+    data_set = FakeDataset()
+    lengths = np.asarray(data_set.captions_length)
+    
+    for max_tokens in [19, 20, 64, 333]:
+        for batch in TokenBudgetBatchSampler(data_set, max_tokens=max_tokens, seed=1):
+            assert len(batch) * lengths[batch].max() <= max_tokens
+    
+    # A caption longer than the budget is alone in its mini-batch.
+    for batch in TokenBudgetBatchSampler(data_set, max_tokens=10, seed=1):
+        assert len(batch) * lengths[batch].max() <= 10 or len(batch) == 1
+
+
+def test_image_grouped_deterministic_by_seed_and_epoch():
+    data_set = FakeDataset()
+    
+    first = epochs(ImageGroupedBatchSampler(data_set, batch_size=16, seed=3), 2)
+    assert first == epochs(ImageGroupedBatchSampler(data_set, batch_size=16, seed=3), 2)
+    assert first[0] != first[1]
+    
+    for batch in first[0]:
+        assert sum(len(group) for group in batch) <= 16 or len(batch) == 1
+
+
+def test_len_is_the_one_of_the_iteration():
+    data_set = FakeDataset()
+    sampler = TokenBudgetBatchSampler(data_set, max_tokens=40, seed=0)
+    
+    for _ in range(3):
+        number_of_batches = len(sampler)
+        assert number_of_batches == len(list(sampler))